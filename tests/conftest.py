@@ -23,6 +23,7 @@ if FILENAME not in project_dir_content:
         f'Убедитесь, что у вас верная структура проекта.'
     )
 
+import pytest
 from django.utils.version import get_version
 
 assert get_version() < '3.0.0', 'Пожалуйста, используйте версию Django < 3.0.0'
@@ -37,3 +38,17 @@ pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(scope='session', autouse=True)
+def isolated_files():
+    # Как TestRunner у manage.py test: кэш, метрики и профили тестов не
+    # попадают в файлы сервера разработки.
+    from core.testing import isolated_files
+    with isolated_files() as directory:
+        yield directory
+
+
+@pytest.fixture(autouse=True)
+def eager_tasks(settings):
+    settings.TASKS_ALWAYS_EAGER = True
@@ -1,5 +1,20 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.models.signals import post_migrate
+
+
+def clear_caches(**kwargs):
+    """Общий кэш переживает перезапуск процессов, поэтому после миграций
+    в нём могут остаться данные прежней схемы или другой (тестовой) базы.
+    """
+    from django.core.cache import caches
+    for alias in settings.CACHES:
+        caches[alias].clear()
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from . import db, querycache  # noqa: F401
+        post_migrate.connect(clear_caches, sender=self)
@@ -0,0 +1,15 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite, в котором atomic() сразу берёт блокировку записи.
+
+    После обычного BEGIN транзакция сначала читает, а право на запись
+    просит позже; если его держит другой процесс, SQLite не ждёт
+    busy_timeout и сразу отвечает «database is locked». BEGIN IMMEDIATE
+    ждёт блокировку в начале транзакции, пока читать ещё нечего.
+    Читателей в режиме WAL он не задерживает.
+    """
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
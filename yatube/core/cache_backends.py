@@ -0,0 +1,417 @@
+"""Двухуровневый кэш: LRU в памяти процесса поверх общего файла SQLite.
+
+L1 — словарь текущего процесса, не больше L1_MAX_ENTRIES записей; каждая
+живёт в нём не дольше L1_TIMEOUT секунд, поэтому чужая запись или
+удаление доходит до процесса за это время. Django создаёт экземпляр
+бэкенда в каждом потоке, поэтому L1, как у LocMemCache, хранится в модуле
+по LOCATION и общая для всех потоков процесса. L2 — таблица в файле LOCATION,
+общая для всех воркеров на машине: одно вычисление видят все, и
+инвалидация (например, incr счётчика поколений) сразу действует везде.
+
+Чтобы горячий ключ пересчитывал один воркер, а не все разом:
+
+* запись хранится ещё STALE_TIMEOUT секунд после истечения. Первый, кто
+  её запросил, получает промах и блокировку на пересчёт, остальные —
+  старое значение, пока не придёт новое;
+* если значения нет совсем, а блокировку держит другой процесс, get()
+  до LOCK_WAIT секунд ждёт его результата;
+* незадолго до истечения get() с вероятностью, растущей к сроку, сам
+  отдаёт промах одному воркеру (XFetch): чем дольше значение считалось
+  в прошлый раз, тем раньше начинается пересчёт.
+
+Попадания и промахи каждого уровня считаются в метрике
+yatube_cache_requests_total.
+"""
+import math
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .metrics import registry
+
+LOCK_PREFIX = 'lock|'
+
+# L1 и её блокировки по LOCATION: общие для экземпляров всех потоков.
+_l1_caches = {}
+_l1_locks = {}
+
+
+@contextmanager
+def immediate(db):
+    """Транзакция, которая сразу берёт блокировку записи файла."""
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        yield
+    except BaseException:
+        db.execute('ROLLBACK')
+        raise
+    db.execute('COMMIT')
+
+
+class TwoTierCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.path = location
+        self.l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1000))
+        self.l1_timeout = float(options.get('L1_TIMEOUT', 2))
+        self.stale_timeout = float(options.get('STALE_TIMEOUT', 30))
+        self.lock_timeout = float(options.get('LOCK_TIMEOUT', 10))
+        self.lock_wait = float(options.get('LOCK_WAIT', 0.5))
+        self.beta = float(options.get('BETA', 1))
+        self._l1 = _l1_caches.setdefault(location, OrderedDict())
+        self._l1_lock = _l1_locks.setdefault(location, threading.Lock())
+        self._local = threading.local()
+        self._ready = False
+        self._sets = 0
+
+    # Общий файл.
+
+    def _db(self):
+        # Соединение SQLite нельзя унести в дочерний процесс после fork.
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.db = sqlite3.connect(
+                self.path, timeout=5, isolation_level=None
+            )
+            local.db.execute('PRAGMA journal_mode = WAL')
+            local.db.execute('PRAGMA synchronous = NORMAL')
+            local.pid = os.getpid()
+            if not self._ready:
+                local.db.execute(
+                    'CREATE TABLE IF NOT EXISTS cache ('
+                    'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+                    'expires REAL, stale_until REAL, '
+                    'delta REAL NOT NULL DEFAULT 0)'
+                )
+                self._ready = True
+        return local.db
+
+    def _rows(self, keys, now):
+        """Живые и ещё не выброшенные устаревшие записи L2."""
+        rows = {}
+        keys = list(keys)
+        # Ограничение SQLite на число параметров запроса.
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows.update(
+                (key, (value, expires, stale_until, delta))
+                for key, value, expires, stale_until, delta in
+                self._db().execute(
+                    'SELECT key, value, expires, stale_until, delta '
+                    'FROM cache WHERE key IN ({}) AND (stale_until IS NULL '
+                    'OR stale_until > ?)'.format(', '.join('?' * len(chunk))),
+                    (*chunk, now)
+                )
+            )
+        return rows
+
+    def _stale_until(self, expires):
+        return None if expires is None else expires + self.stale_timeout
+
+    def _write(self, db, key, value, expires, only_missing=False):
+        """Пишет значение в L2; only_missing — только на место мёртвой."""
+        delta = self._finish_rebuild(db, key)
+        if expires is not None and expires <= time.time():
+            # Нулевой таймаут: значение не кэшируется.
+            self._l1_delete([key])
+            db.execute('DELETE FROM cache WHERE key = ?', (key,))
+            return False
+        sql = (
+            'INSERT INTO cache (key, value, expires, stale_until, delta) '
+            'VALUES (?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+            'value = excluded.value, expires = excluded.expires, '
+            'stale_until = excluded.stale_until, delta = excluded.delta'
+        )
+        params = [key, value, expires, self._stale_until(expires), delta]
+        if only_missing:
+            sql += ' WHERE cache.expires IS NOT NULL AND cache.expires <= ?'
+            params.append(time.time())
+        written = db.execute(sql, params).rowcount > 0
+        if written:
+            self._l1_put(key, value, expires, delta)
+        self._sets += 1
+        if self._sets % 100 == 0:
+            self._cull(db)
+        return written
+
+    def _cull(self, db):
+        db.execute(
+            'DELETE FROM cache WHERE COALESCE(stale_until, expires) <= ?',
+            (time.time(),)
+        )
+        count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            # Первыми уходят записи, которые истекут раньше остальных.
+            db.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count // self._cull_frequency,)
+            )
+
+    # Пересчёт в одном воркере.
+
+    def _rebuilding(self):
+        if not hasattr(self._local, 'rebuilding'):
+            self._local.rebuilding = {}
+        return self._local.rebuilding
+
+    def _try_lock(self, key):
+        """Берёт право пересчитать key; True, если оно у этого потока."""
+        rebuilding = self._rebuilding()
+        started = rebuilding.get(key)
+        if started is not None:
+            if time.monotonic() - started < self.lock_timeout:
+                return True
+            # Значение так и не записали, блокировка уже истекла.
+            del rebuilding[key]
+        now = time.time()
+        taken = self._db().execute(
+            'INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+            'expires = excluded.expires WHERE cache.expires <= ?',
+            (LOCK_PREFIX + key, b'', now + self.lock_timeout, now)
+        ).rowcount > 0
+        if taken:
+            rebuilding[key] = time.monotonic()
+            if len(rebuilding) > self.l1_max_entries:
+                # Ключи, которые так и не записали после промаха.
+                for old in [old for old, started in rebuilding.items()
+                            if time.monotonic() - started
+                            >= self.lock_timeout]:
+                    del rebuilding[old]
+        return taken
+
+    def _finish_rebuild(self, db, key):
+        """Снимает блокировку key; возвращает, сколько шёл пересчёт."""
+        started = self._rebuilding().pop(key, None)
+        if started is None:
+            return 0
+        db.execute('DELETE FROM cache WHERE key = ?', (LOCK_PREFIX + key,))
+        return time.monotonic() - started
+
+    def _is_locked(self, key):
+        return self._db().execute(
+            'SELECT 1 FROM cache WHERE key = ? AND expires > ?',
+            (LOCK_PREFIX + key, time.time())
+        ).fetchone() is not None
+
+    def _wait(self, key):
+        """Ждёт значение, которое пересчитывает другой процесс."""
+        deadline = time.monotonic() + self.lock_wait
+        delay = 0.01
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+            row = self._rows([key], time.time()).get(key)
+            if row is not None and self._fresh(row[1], time.time()):
+                return row
+            if not self._is_locked(key):
+                break
+        return None
+
+    # L1.
+
+    def _l1_get(self, key, now):
+        with self._l1_lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return None
+            value, expires, delta, deadline = entry
+            if deadline <= time.monotonic() or not self._fresh(expires, now):
+                del self._l1[key]
+                return None
+            self._l1.move_to_end(key)
+            return value, expires, delta
+
+    def _l1_put(self, key, value, expires, delta):
+        with self._l1_lock:
+            self._l1[key] = (
+                value, expires, delta, time.monotonic() + self.l1_timeout
+            )
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_delete(self, keys):
+        with self._l1_lock:
+            for key in keys:
+                self._l1.pop(key, None)
+
+    # Чтение.
+
+    @staticmethod
+    def _fresh(expires, now):
+        return expires is None or expires > now
+
+    def _count(self, tier, result, amount=1):
+        if amount:
+            registry.increment(
+                'yatube_cache_requests_total', amount, tier=tier,
+                result=result
+            )
+
+    def _from_l2(self, key, row, now, wait):
+        """Запись L2 для выдачи или None, если key пересчитывает вызвавший."""
+        if row is None:
+            if not self._try_lock(key) and wait:
+                row = self._wait(key)
+            if row is None:
+                self._count('l2', 'miss')
+                return None
+        elif not self._fresh(row[1], now):
+            if self._try_lock(key):
+                self._count('l2', 'stale_rebuild')
+                return None
+            # Пересчитывает другой процесс: пока годится старое.
+            self._count('l2', 'stale')
+            return row[0], row[1], row[3]
+        self._count('l2', 'hit')
+        value, expires, stale_until, delta = row
+        self._l1_put(key, value, expires, delta)
+        return value, expires, delta
+
+    def _recompute_early(self, key, expires, delta, now):
+        if expires is None or not delta or not self._fresh(expires, now):
+            return False
+        # XFetch: -log(random) в среднем 1, изредка больше, поэтому
+        # пересчёт начинается у одного воркера примерно за delta до срока.
+        early = now - delta * self.beta * math.log(1 - random.random())
+        if early >= expires and self._try_lock(key):
+            self._count('l2', 'early_rebuild')
+            return True
+        return False
+
+    def _lookup(self, keys, wait):
+        """Найденные значения keys; промах — и для того, кто пересчитывает."""
+        now = time.time()
+        found, l2_keys = {}, []
+        for key in keys:
+            entry = self._l1_get(key, now)
+            if entry is None:
+                l2_keys.append(key)
+            else:
+                found[key] = entry
+        self._count('l1', 'hit', len(found))
+        self._count('l1', 'miss', len(l2_keys))
+        rows = self._rows(l2_keys, now) if l2_keys else {}
+        for key in l2_keys:
+            entry = self._from_l2(key, rows.get(key), now, wait)
+            if entry is not None:
+                found[key] = entry
+        return {
+            key: pickle.loads(value)
+            for key, (value, expires, delta) in found.items()
+            if not self._recompute_early(key, expires, delta, now)
+        }
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        found = self._lookup([key], wait=True)
+        return found.get(key, default)
+
+    def get_many(self, keys, version=None):
+        made = {}
+        for key in keys:
+            made_key = self.make_key(key, version=version)
+            self.validate_key(made_key)
+            made[made_key] = key
+        found = self._lookup(made, wait=False)
+        return {made[key]: value for key, value in found.items()}
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        if self._l1_get(key, now) is not None:
+            return True
+        row = self._rows([key], now).get(key)
+        return row is not None and self._fresh(row[1], now)
+
+    # Запись.
+
+    def _dumps(self, value):
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._write(
+            self._db(), key, self._dumps(value),
+            self.get_backend_timeout(timeout)
+        )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._write(
+            self._db(), key, self._dumps(value),
+            self.get_backend_timeout(timeout), only_missing=True
+        )
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        db = self._db()
+        with immediate(db):
+            for key, value in data.items():
+                key = self.make_key(key, version=version)
+                self.validate_key(key)
+                self._write(db, key, self._dumps(value), expires)
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        expires = self.get_backend_timeout(timeout)
+        touched = self._db().execute(
+            'UPDATE cache SET expires = ?, stale_until = ? '
+            'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (expires, self._stale_until(expires), key, time.time())
+        ).rowcount > 0
+        self._l1_delete([key])
+        return touched
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        db = self._db()
+        with immediate(db):
+            row = db.execute(
+                'SELECT value, expires FROM cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or not self._fresh(row[1], time.time()):
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            self._write(db, key, self._dumps(value), row[1])
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._l1_delete([key])
+        self._db().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        for key in keys:
+            self.validate_key(key)
+        self._l1_delete(keys)
+        db = self._db()
+        with immediate(db):
+            db.executemany(
+                'DELETE FROM cache WHERE key = ?', [(key,) for key in keys]
+            )
+
+    def clear(self):
+        with self._l1_lock:
+            self._l1.clear()
+        self._rebuilding().clear()
+        self._db().execute('DELETE FROM cache')
@@ -0,0 +1,66 @@
+"""Соединения SQLite для нескольких процессов.
+
+Каждое новое соединение получает SQLITE_PRAGMAS: WAL пускает читателей
+параллельно с писателем, busy_timeout заставляет ждать блокировку, а не
+сразу падать. Транзакции начинаются с BEGIN IMMEDIATE (см.
+core.backends.sqlite3). Если блокировку не удалось получить и за
+busy_timeout, запись повторяется целиком (retry_on_locked).
+"""
+import logging
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+LOCKED_MESSAGES = ('database is locked', 'database table is locked')
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def is_locked(error):
+    return any(message in str(error) for message in LOCKED_MESSAGES)
+
+
+def retry_on_locked(func):
+    """Выполняет func в транзакции и повторяет её, если база занята.
+
+    Транзакция нужна, чтобы неудачная попытка не оставила половину
+    записей. Между попытками — экспоненциальная пауза со случайным
+    разбросом, чтобы процессы не сталкивались снова одновременно.
+
+    BEGIN IMMEDIATE держит единственную блокировку записи SQLite до конца
+    транзакции, поэтому оборачивать стоит только саму запись: чтение,
+    проверку формы и обработку картинки — до неё.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        attempts = settings.SQLITE_RETRY_ATTEMPTS
+        for attempt in range(attempts):
+            try:
+                with transaction.atomic():
+                    return func(*args, **kwargs)
+            except OperationalError as error:
+                if not is_locked(error) or attempt == attempts - 1:
+                    raise
+                delay = random.uniform(
+                    0, settings.SQLITE_RETRY_DELAY * 2 ** attempt
+                )
+                logger.warning(
+                    'База занята, повтор %s через %.3f с',
+                    func.__qualname__, delay
+                )
+                time.sleep(delay)
+    return wrapper
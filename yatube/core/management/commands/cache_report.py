@@ -0,0 +1,51 @@
+import re
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from core.metrics import get_store, registry
+
+# Семейство метрики, метка, по которой строятся строки отчёта, и их
+# подпись.
+FAMILIES = (
+    ('yatube_cache_requests_total', 'tier', '{}'),
+    ('yatube_object_cache_requests_total', 'model', 'снимки {}'),
+    ('yatube_query_cache_requests_total', 'model', 'запросы {}'),
+)
+# Устаревшее значение, отданное на время пересчёта, — тоже попадание.
+HIT_RESULTS = ('hit', 'stale')
+LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def hit_ratios():
+    """{(семейство, значение метки): (попаданий, промахов)} по метрикам."""
+    registry.flush()
+    groups = {name: label for name, label, _ in FAMILIES}
+    totals = defaultdict(lambda: [0, 0])
+    for name, labels, value in get_store().samples():
+        if name not in groups:
+            continue
+        labels = dict(LABEL_RE.findall(labels))
+        row = totals[(name, labels[groups[name]])]
+        row[0 if labels['result'] in HIT_RESULTS else 1] += int(value)
+    return {key: tuple(row) for key, row in totals.items()}
+
+
+class Command(BaseCommand):
+    help = (
+        'Доля попаданий в кэш: по уровням L1 и L2, по снимкам объектов и '
+        'по кэшу запросов для каждой модели. '
+        'Считается по метрикам всех процессов с их запуска.'
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{"кэш":<28}{"попаданий":>11}{"промахов":>10}{"доля":>8}'
+        )
+        titles = {name: title for name, _, title in FAMILIES}
+        for (name, label), (hits, misses) in sorted(hit_ratios().items()):
+            title = titles[name].format(label)
+            ratio = hits / (hits + misses) if hits + misses else 0
+            self.stdout.write(
+                f'{title:<28}{hits:>11}{misses:>10}{ratio:>8.1%}'
+            )
@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def copy_database(alias):
+    """Переписывает реплику alias снимком основной базы SQLite."""
+    source, target = connections[DEFAULT_DB_ALIAS], connections[alias]
+    source.ensure_connection()
+    target.ensure_connection()
+    source.connection.backup(target.connection)
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную базу SQLite в реплики DATABASE_REPLICAS. '
+        'Заменяет репликацию при локальной проверке чтения с реплик: '
+        'с --interval копирует снова и снова, и реплики отстают от '
+        'основной базы не больше чем на интервал.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Повторять каждые N секунд; 0 — скопировать один раз.'
+        )
+
+    def handle(self, *args, **options):
+        aliases = settings.DATABASE_REPLICAS
+        if not aliases:
+            raise CommandError('DATABASE_REPLICAS пуст.')
+        for alias in (DEFAULT_DB_ALIAS, *aliases):
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f'{alias}: команда копирует только SQLite.')
+        while True:
+            for alias in aliases:
+                copy_database(alias)
+            self.stdout.write(f'Реплики обновлены: {", ".join(aliases)}')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,229 @@
+"""Метрики запросов в формате Prometheus.
+
+Каждый процесс копит приращения в памяти и раз в METRICS_FLUSH_INTERVAL
+секунд сбрасывает их в общий файл SQLite (METRICS_STORE). Эндпоинт
+/metrics читает сумму по всем процессам, поэтому любой воркер отдаёт
+одинаковую картину.
+"""
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+FAMILIES = (
+    ('yatube_http_requests_total', 'counter',
+     'Число обработанных запросов.'),
+    ('yatube_http_request_duration_seconds', 'histogram',
+     'Время обработки запроса.'),
+    ('yatube_db_queries', 'histogram',
+     'Число SQL-запросов на один HTTP-запрос.'),
+    ('yatube_db_duration_seconds_total', 'counter',
+     'Суммарное время SQL-запросов.'),
+    ('yatube_template_render_seconds_total', 'counter',
+     'Суммарное время рендеринга шаблонов.'),
+    ('yatube_ratelimit_requests_total', 'counter',
+     'Решения ограничителя частоты: allowed или limited.'),
+    ('yatube_cache_requests_total', 'counter',
+     'Обращения к кэшу по уровням: l1 и l2.'),
+    ('yatube_object_cache_requests_total', 'counter',
+     'Снимки объектов в кэше: hit или miss.'),
+    ('yatube_query_cache_requests_total', 'counter',
+     'Кэш результатов запросов по моделям: hit или miss.'),
+)
+
+LE_RE = re.compile(r'le="([^"]+)"')
+
+current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Замеры одного запроса; заполняются хуком базы и бэкендом шаблонов."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+def add_render_time(seconds):
+    metrics = current.get()
+    if metrics is not None:
+        metrics.render_time += seconds
+
+
+def _labels(**labels):
+    return ','.join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n')
+        )
+        for name, value in sorted(labels.items())
+    )
+
+
+def _sample_order(sample):
+    """Корзины гистограммы идут по возрастанию границы, +Inf последней."""
+    labels = sample[0]
+    match = LE_RE.search(labels)
+    if match is None:
+        return labels, 0.0
+    return LE_RE.sub('', labels), float(match.group(1))
+
+
+def _format(value):
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class MetricsStore:
+    """Сумма приращений всех процессов в файле SQLite."""
+
+    def __init__(self, path):
+        self.path = path
+        self._ready = False
+
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=5)
+        if not self._ready:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS samples ('
+                'name TEXT NOT NULL, labels TEXT NOT NULL, '
+                'value REAL NOT NULL, PRIMARY KEY (name, labels))'
+            )
+            self._ready = True
+        return db
+
+    def add(self, increments):
+        db = self.connect()
+        try:
+            with db:
+                db.executemany(
+                    'INSERT INTO samples (name, labels, value) '
+                    'VALUES (?, ?, ?) ON CONFLICT (name, labels) '
+                    'DO UPDATE SET value = value + excluded.value',
+                    [(name, labels, value)
+                     for (name, labels), value in increments.items()]
+                )
+        finally:
+            db.close()
+
+    def samples(self):
+        db = self.connect()
+        try:
+            return db.execute(
+                'SELECT name, labels, value FROM samples '
+                'ORDER BY name, labels'
+            ).fetchall()
+        finally:
+            db.close()
+
+
+class Registry:
+    """Приращения текущего процесса, ещё не сброшенные в хранилище."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(float)
+        self._flushed_at = time.monotonic()
+
+    def _observe(self, name, buckets, value, **labels):
+        for bound in buckets:
+            if value <= bound:
+                self._pending[
+                    (f'{name}_bucket', _labels(le=bound, **labels))
+                ] += 1
+        self._pending[(f'{name}_bucket', _labels(le='+Inf', **labels))] += 1
+        self._pending[(f'{name}_sum', _labels(**labels))] += value
+        self._pending[(f'{name}_count', _labels(**labels))] += 1
+
+    def record(self, view, method, status, duration, metrics):
+        with self._lock:
+            self._pending[('yatube_http_requests_total', _labels(
+                view=view, method=method, status=status
+            ))] += 1
+            self._observe(
+                'yatube_http_request_duration_seconds', LATENCY_BUCKETS,
+                duration, view=view
+            )
+            self._observe(
+                'yatube_db_queries', QUERY_BUCKETS, metrics.queries,
+                view=view
+            )
+            self._pending[('yatube_db_duration_seconds_total', _labels(
+                view=view
+            ))] += metrics.db_time
+            self._pending[('yatube_template_render_seconds_total', _labels(
+                view=view
+            ))] += metrics.render_time
+        self._flush_if_due()
+
+    def increment(self, name, amount=1, **labels):
+        with self._lock:
+            self._pending[(name, _labels(**labels))] += amount
+        self._flush_if_due()
+
+    def _flush_if_due(self):
+        if (time.monotonic() - self._flushed_at
+                >= settings.METRICS_FLUSH_INTERVAL):
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(float)
+            self._flushed_at = time.monotonic()
+        if pending:
+            get_store().add(pending)
+
+    def discard(self):
+        """Отбрасывает приращения, ещё не попавшие в хранилище."""
+        with self._lock:
+            self._pending.clear()
+
+    def exposition(self):
+        """Текст в формате Prometheus по данным всех процессов."""
+        self.flush()
+        samples = defaultdict(list)
+        for name, labels, value in get_store().samples():
+            samples[name].append((labels, value))
+        lines = []
+        for family, kind, help_text in FAMILIES:
+            lines.append(f'# HELP {family} {help_text}')
+            lines.append(f'# TYPE {family} {kind}')
+            names = (
+                [f'{family}_bucket', f'{family}_sum', f'{family}_count']
+                if kind == 'histogram' else [family]
+            )
+            for name in names:
+                for labels, value in sorted(samples[name], key=_sample_order):
+                    lines.append(f'{name}{{{labels}}} {_format(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+_stores = {}
+
+
+def get_store():
+    path = settings.METRICS_STORE
+    if path not in _stores:
+        _stores[path] = MetricsStore(path)
+    return _stores[path]
+
+
+registry = Registry()
@@ -0,0 +1,135 @@
+import cProfile
+import pstats
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics, profiling, querylog, routers
+from .tasks import enqueue
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class MetricsMiddleware:
+    """Собирает метрики запроса по имени view (posts:index, ...).
+
+    Стоит первым в MIDDLEWARE, чтобы время запроса включало всю цепочку.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current.set(request_metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(request_metrics)
+                    )
+                response = self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        match = request.resolver_match
+        metrics.registry.record(
+            view=match.view_name if match else 'unresolved',
+            method=request.method,
+            status=response.status_code,
+            duration=time.perf_counter() - started,
+            metrics=request_metrics,
+        )
+        return response
+
+
+class ProfilingMiddleware:
+    """Профилирует выборку запросов cProfile (см. core.profiling).
+
+    Стоит сразу после MetricsMiddleware: в профиль попадает вся цепочка
+    middleware, а время записи профиля в метрики не попадает.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling.should_profile(request):
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        sampler = profiling.StackSampler(
+            threading.get_ident(), ProfilingMiddleware.__call__.__code__
+        )
+        started = time.perf_counter()
+        sampler.start()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+            sampler.stop()
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        enqueue(profiling.save_profile, pstats.Stats(profiler),
+                sampler.collapsed(), {
+            'id': uuid.uuid4().hex,
+            'view': match.view_name if match else 'unresolved',
+            'method': request.method,
+            'path': request.get_full_path()[:500],
+            'status': response.status_code,
+            'duration': duration,
+            'created': time.time(),
+        })
+        return response
+
+
+class QueryLogMiddleware:
+    """Пишет в лог медленные запросы и признаки N+1 (см. core.querylog)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with querylog.record_queries() as log:
+            response = self.get_response(request)
+        match = request.resolver_match
+        querylog.warn_repeated(
+            log, match.view_name if match else request.path
+        )
+        return response
+
+
+class ReplicaMiddleware:
+    """Выбирает базу для чтения в запросе (см. core.routers).
+
+    Клиент, который что-то записал, получает куку STICKY_COOKIE на
+    REPLICA_STICKY_SECONDS и до её истечения читает из основной базы.
+    Стоит перед SessionMiddleware, чтобы сессия тоже читалась оттуда.
+    """
+
+    STICKY_COOKIE = 'db_primary'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routing = routers.Routing(
+            pinned=request.method not in SAFE_METHODS
+            or self.STICKY_COOKIE in request.COOKIES
+        )
+        token = routers.current.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.current.reset(token)
+        if routing.wrote:
+            response.set_cookie(
+                self.STICKY_COOKIE, '1',
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,208 @@
+"""Профили cProfile отдельных запросов.
+
+ProfilingMiddleware профилирует долю PROFILE_SAMPLE_RATE запросов, а
+также любой запрос с заголовком PROFILE_HEADER, равным PROFILE_TOKEN.
+Профиль сохраняется в фоне в PROFILE_DIR двумя файлами: .prof для
+pstats и snakeviz и .collapsed со стеками, снятыми по таймеру
+(StackSampler), для flamegraph.pl и speedscope. Индекс профилей по view
+и длительности лежит там же в SQLite; хранятся последние
+PROFILE_MAX_FILES профилей, старые файлы удаляются.
+"""
+import hmac
+import io
+import os
+import pstats
+import random
+import sqlite3
+import sys
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+
+def profile_path(profile_id, extension):
+    return os.path.join(settings.PROFILE_DIR, f'{profile_id}.{extension}')
+
+
+def function_name(func):
+    filename, line, name = func
+    if filename == '~':
+        # Встроенные функции: {method 'execute' of ...}.
+        return name
+    return f'{os.path.basename(filename)}:{line}({name})'
+
+
+class StackSampler(threading.Thread):
+    """Снимает стек потока запроса каждые PROFILE_STACK_INTERVAL секунд.
+
+    cProfile хранит только пары вызывающий — вызванный, а для flame
+    graph нужны стеки целиком. Стек обрезается по кадру root: выше него
+    код сервера, а не запроса. Чаще, чем раз в sys.getswitchinterval(),
+    поток запроса GIL не отдаёт, так что это и есть предел точности.
+    """
+
+    def __init__(self, thread_id, root):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.root = root
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(settings.PROFILE_STACK_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and frame.f_code is not self.root:
+                code = frame.f_code
+                stack.append(function_name(
+                    (code.co_filename, code.co_firstlineno, code.co_name)
+                ))
+                frame = frame.f_back
+            # Без кадра root поток уже не в запросе.
+            if frame is not None and stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def collapsed(self):
+        """Формат flamegraph.pl и speedscope: «a;b;c число_снимков»."""
+        return ''.join(
+            f'{stack} {count}\n'
+            for stack, count in sorted(self.stacks.items())
+        )
+
+
+def top_functions(profile_id, limit=30):
+    """Функции профиля по убыванию суммарного времени."""
+    stats = pstats.Stats(
+        profile_path(profile_id, 'prof'), stream=io.StringIO()
+    )
+    rows = [
+        {
+            'name': function_name(func),
+            'calls': calls,
+            'own_ms': own * 1000,
+            'cumulative_ms': cumulative * 1000,
+        }
+        for func, (_, calls, own, cumulative, _) in stats.stats.items()
+    ]
+    rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+    return rows[:limit]
+
+
+def _entry(row):
+    entry = dict(row)
+    entry['duration_ms'] = entry['duration'] * 1000
+    entry['created_at'] = datetime.fromtimestamp(
+        entry['created'], timezone.utc
+    )
+    return entry
+
+
+class ProfileStore:
+    """Индекс профилей в SQLite рядом с файлами."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def connect(self):
+        os.makedirs(self.directory, exist_ok=True)
+        db = sqlite3.connect(
+            os.path.join(self.directory, 'index.sqlite3'), timeout=5
+        )
+        db.row_factory = sqlite3.Row
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS profiles ('
+            'id TEXT PRIMARY KEY, view TEXT NOT NULL, method TEXT NOT NULL, '
+            'path TEXT NOT NULL, status INTEGER NOT NULL, '
+            'duration REAL NOT NULL, created REAL NOT NULL)'
+        )
+        return db
+
+    def add(self, row):
+        """Добавляет профиль; возвращает id вытесненных из кольца."""
+        db = self.connect()
+        try:
+            with db:
+                db.execute(
+                    'INSERT INTO profiles (id, view, method, path, status, '
+                    'duration, created) VALUES (:id, :view, :method, :path, '
+                    ':status, :duration, :created)',
+                    row
+                )
+                evicted = [old for old, in db.execute(
+                    'SELECT id FROM profiles ORDER BY created DESC '
+                    'LIMIT -1 OFFSET ?', (settings.PROFILE_MAX_FILES,)
+                )]
+                db.executemany(
+                    'DELETE FROM profiles WHERE id = ?',
+                    [(old,) for old in evicted]
+                )
+            return evicted
+        finally:
+            db.close()
+
+    def slowest(self, view=None, limit=50):
+        db = self.connect()
+        try:
+            sql = 'SELECT * FROM profiles'
+            params = []
+            if view:
+                sql += ' WHERE view = ?'
+                params.append(view)
+            sql += ' ORDER BY duration DESC LIMIT ?'
+            return [_entry(row) for row in db.execute(sql, (*params, limit))]
+        finally:
+            db.close()
+
+    def views(self):
+        db = self.connect()
+        try:
+            return [view for view, in db.execute(
+                'SELECT DISTINCT view FROM profiles ORDER BY view'
+            )]
+        finally:
+            db.close()
+
+    def get(self, profile_id):
+        db = self.connect()
+        try:
+            row = db.execute(
+                'SELECT * FROM profiles WHERE id = ?', (profile_id,)
+            ).fetchone()
+            return None if row is None else _entry(row)
+        finally:
+            db.close()
+
+
+def get_store():
+    return ProfileStore(settings.PROFILE_DIR)
+
+
+def save_profile(stats, collapsed, row):
+    """Пишет файлы профиля и запись индекса; вытесненные удаляет."""
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    stats.dump_stats(profile_path(row['id'], 'prof'))
+    with open(profile_path(row['id'], 'collapsed'), 'w') as fp:
+        fp.write(collapsed)
+    for old in get_store().add(row):
+        for extension in ('prof', 'collapsed'):
+            try:
+                os.remove(profile_path(old, extension))
+            except FileNotFoundError:
+                pass
+
+
+def should_profile(request):
+    token = settings.PROFILE_TOKEN
+    header = request.META.get(
+        'HTTP_' + settings.PROFILE_HEADER.upper().replace('-', '_')
+    )
+    if token and header and hmac.compare_digest(
+            header.encode(), token.encode()):
+        return True
+    return random.random() < settings.PROFILE_SAMPLE_RATE
@@ -0,0 +1,179 @@
+"""Кэш результатов запросов ORM с версиями таблиц.
+
+cached(queryset) включает кэш для одного queryset: строки хранятся под
+отпечатком SQL и параметров, а в ключ входят версии всех таблиц из FROM
+и JOIN запроса. Любая запись через соединения Django (INSERT, UPDATE,
+DELETE — из save(), update(), delete() или сырого SQL) меняет версию
+своей таблицы, и прежние результаты перестают находиться. Версия
+меняется сразу и ещё раз после фиксации транзакции: другой процесс мог
+успеть закэшировать строки, прочитанные до неё. Таблицы, в которые
+текущая транзакция уже писала, до её фиксации читаются мимо кэша: иначе
+после отката в кэше остались бы несуществующие строки.
+
+Кэшируется только выборка строк: итерация, get(), first(), срезы и
+iterator(). count() и exists() всегда идут в базу. Попадания и промахи
+по моделям считаются в метрике yatube_query_cache_requests_total.
+"""
+import hashlib
+import re
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .metrics import registry
+
+KEY = 'querycache:{}:{}'
+TABLE_KEY = 'querycache:table:{}'
+TABLE_RE = re.compile(r'\b(?:FROM|JOIN)\s+"?(\w+)"?', re.IGNORECASE)
+WRITE_RE = re.compile(
+    r'^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO'
+    r'|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+"?(\w+)"?',
+    re.IGNORECASE
+)
+
+# Смена версии сама пишет в кэш; если кэш хранится в базе Django, эта
+# запись не должна снова менять версию.
+bumping = ContextVar('querycache_bumping', default=False)
+
+
+def _initial_version():
+    # Как и счётчики поколений posts.cache: вытесненная версия не
+    # совпадёт ни с одной из прежних.
+    return int(time.time() * 1000)
+
+
+def table_versions(tables):
+    keys = [TABLE_KEY.format(table) for table in tables]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            value = _initial_version()
+            if not cache.add(key, value, None):
+                value = cache.get(key, value)
+            found[key] = value
+    return [found[key] for key in keys]
+
+
+def bump_table(table):
+    key = TABLE_KEY.format(table)
+    token = bumping.set(True)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_version(), None)
+    finally:
+        bumping.reset(token)
+
+
+def uncommitted_tables(connection):
+    """Таблицы, в которые писала текущая транзакция connection."""
+    if not connection.in_atomic_block:
+        connection.querycache_written = set()
+    return connection.__dict__.setdefault('querycache_written', set())
+
+
+def track_writes(execute, sql, params, many, context):
+    """Обёртка выполнения SQL: запись меняет версию своей таблицы."""
+    result = execute(sql, params, many, context)
+    match = WRITE_RE.match(sql)
+    if match is not None and not bumping.get():
+        table = match.group(1)
+        bump_table(table)
+        connection = context['connection']
+        if connection.in_atomic_block:
+            written = uncommitted_tables(connection)
+            written.add(table)
+
+            def committed():
+                written.discard(table)
+                bump_table(table)
+
+            transaction.on_commit(committed, using=connection.alias)
+    return result
+
+
+@receiver(connection_created)
+def install_write_tracking(sender, connection, **kwargs):
+    # В начало списка: execute_wrapper() снимает последнюю обёртку, а
+    # соединение может открыться внутри него (см. MetricsMiddleware).
+    if track_writes not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, track_writes)
+
+
+def _count(model, result):
+    registry.increment(
+        'yatube_query_cache_requests_total', model=model, result=result
+    )
+
+
+class CachedQuerySetMixin:
+    cache_timeout = None
+
+    def _clone(self):
+        clone = super()._clone()
+        clone.cache_timeout = self.cache_timeout
+        return clone
+
+    def _fetch_all(self):
+        if self._result_cache is None:
+            self._result_cache = self._cached_results()
+        super()._fetch_all()
+
+    def iterator(self, chunk_size=2000):
+        self._fetch_all()
+        return iter(self._result_cache)
+
+    def _cached_results(self):
+        try:
+            sql, params = self.query.get_compiler(using=self.db).as_sql()
+        except EmptyResultSet:
+            return []
+        tables = sorted(set(TABLE_RE.findall(sql)))
+        model = self.model._meta.label_lower
+        if uncommitted_tables(connections[self.db]).intersection(tables):
+            _count(model, 'uncommitted')
+            return list(self._iterable_class(self))
+        fingerprint = hashlib.md5(
+            f'{self.db}|{self._iterable_class.__name__}|{self._fields}|'
+            f'{sql}|{params!r}'.encode()
+        ).hexdigest()
+        key = KEY.format(
+            fingerprint, '.'.join(map(str, table_versions(tables)))
+        )
+        results = cache.get(key)
+        if results is not None:
+            _count(model, 'hit')
+            return results
+        _count(model, 'miss')
+        results = list(self._iterable_class(self))
+        timeout = self.cache_timeout or settings.QUERY_CACHE_TIMEOUT
+        if self.db != DEFAULT_DB_ALIAS:
+            # Реплика может отставать: её строки живут не дольше окна
+            # отставания.
+            timeout = min(timeout, settings.REPLICA_STICKY_SECONDS)
+        cache.set(key, results, timeout)
+        return results
+
+
+_classes = {}
+
+
+def cached(queryset, timeout=None):
+    """Копия queryset, строки которой берутся из кэша запросов."""
+    cls = queryset.__class__
+    if not issubclass(cls, CachedQuerySetMixin):
+        if cls not in _classes:
+            _classes[cls] = type(
+                f'Cached{cls.__name__}', (CachedQuerySetMixin, cls), {}
+            )
+        cls = _classes[cls]
+    clone = queryset._chain()
+    clone.__class__ = cls
+    clone.cache_timeout = timeout
+    return clone
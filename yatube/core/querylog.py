@@ -0,0 +1,140 @@
+"""Журнал SQL-запросов одного HTTP-запроса.
+
+QueryLog записывает каждый запрос с отпечатком (SQL без конкретных
+значений) и местом вызова: строкой кода проекта и тегом шаблона, если
+запрос выполнил шаблон. Запрос дольше SLOW_QUERY_THRESHOLD секунд сразу
+пишется в лог; отпечаток, выполненный за HTTP-запрос больше
+QUERY_REPEAT_LIMIT раз, — признак N+1, он пишется в лог в конце запроса
+(QueryLogMiddleware). Тесты проверяют бюджет запросов через
+core.testing.QueryBudgetMixin.
+"""
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter, namedtuple
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Node
+
+logger = logging.getLogger(__name__)
+
+CORE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Обёртки и бэкенды, через которые проходит любой запрос: место вызова
+# ищется выше них.
+INFRASTRUCTURE = tuple(
+    os.path.join(CORE_DIR, name)
+    for name in ('backends', 'db.py', 'metrics.py', 'querycache.py',
+                 'querylog.py')
+)
+RENDER_NODE = Node.render_annotated.__code__
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST_RE = re.compile(
+    r'\bIN\s*\(\s*%s(?:\s*,\s*%s)*\s*\)', re.IGNORECASE
+)
+SPACE_RE = re.compile(r'\s+')
+
+Query = namedtuple('Query', 'sql fingerprint duration code template')
+
+
+def fingerprint(sql):
+    """SQL без значений: запросы, различающиеся только ими, совпадают."""
+    sql = STRING_RE.sub('%s', sql)
+    sql = NUMBER_RE.sub('%s', sql)
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    return SPACE_RE.sub(' ', sql).strip()
+
+
+def query_origin():
+    """Строка кода проекта и тег шаблона, откуда выполнен запрос."""
+    code = template = None
+    frame = sys._getframe(2)
+    while frame is not None and code is None:
+        if template is None and frame.f_code is RENDER_NODE:
+            node = frame.f_locals.get('self')
+            origin = getattr(node, 'origin', None)
+            token = getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                name = origin.template_name or origin.name
+                template = f'{name}:{token.lineno}'
+        filename = frame.f_code.co_filename
+        if (filename.startswith(settings.BASE_DIR)
+                and not filename.startswith(INFRASTRUCTURE)):
+            code = '{}:{}({})'.format(
+                os.path.relpath(filename, settings.BASE_DIR),
+                frame.f_lineno, frame.f_code.co_name
+            )
+        frame = frame.f_back
+    return code, template
+
+
+class QueryLog:
+    """Обёртка выполнения SQL: запросы одного HTTP-запроса или теста."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            query = Query(
+                sql, fingerprint(sql), time.perf_counter() - started,
+                *query_origin()
+            )
+            self.queries.append(query)
+            if query.duration >= settings.SLOW_QUERY_THRESHOLD:
+                logger.warning(
+                    'Медленный запрос, %.1f мс, %s: %s',
+                    query.duration * 1000, self.describe(query), sql
+                )
+
+    @staticmethod
+    def describe(query):
+        if query.template:
+            return f'{query.template} из {query.code}'
+        return query.code or 'вне кода проекта'
+
+    def repeated(self, limit=None):
+        """Отпечатки, выполненные больше limit раз: [(первый, число)]."""
+        if limit is None:
+            limit = settings.QUERY_REPEAT_LIMIT
+        counts = Counter(query.fingerprint for query in self.queries)
+        first = {}
+        for query in self.queries:
+            first.setdefault(query.fingerprint, query)
+        return [
+            (first[sql], count) for sql, count in counts.most_common()
+            if count > limit
+        ]
+
+    def report(self):
+        """Все запросы по порядку, с местом вызова и длительностью."""
+        return '\n'.join(
+            f'{number}. {query.duration * 1000:.1f} мс, '
+            f'{self.describe(query)}: {query.sql}'
+            for number, query in enumerate(self.queries, 1)
+        )
+
+
+@contextmanager
+def record_queries():
+    """Записывает в QueryLog запросы ко всем базам внутри блока."""
+    log = QueryLog()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(log))
+        yield log
+
+
+def warn_repeated(log, view):
+    for query, count in log.repeated():
+        logger.warning(
+            'Возможный N+1 в %s: %d одинаковых запросов, %s: %s',
+            view, count, log.describe(query), query.fingerprint
+        )
@@ -0,0 +1,85 @@
+"""Ограничение частоты записи: корзина жетонов в общем кэше.
+
+Политика из RATE_LIMITS задаёт ёмкость корзины (capacity) и за сколько
+секунд восполняется один жетон (refill). Корзина — одно целое число в
+кэше: сколько жетонов израсходовано, в единицах «номер интервала
+refill от начала эпохи». Каждый интервал прибавляет жетон сам собой, а
+запрос меняет число только атомарными incr/decr, поэтому параллельные
+воркеры не теряют обновлений.
+"""
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import render
+
+from .metrics import registry
+
+KEY = 'ratelimit:{}:{}'
+
+
+def client_ident(request):
+    """Пользователь, а для анонимов — адрес клиента."""
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return f'ip:{request.META.get("REMOTE_ADDR", "")}'
+
+
+def take_token(policy, ident):
+    """Берёт жетон; возвращает 0 или через сколько секунд повторить."""
+    capacity = settings.RATE_LIMITS[policy]['capacity']
+    refill = settings.RATE_LIMITS[policy]['refill']
+    key = KEY.format(policy, ident)
+    now = time.time()
+    earned = int(now // refill)
+    # Через capacity * refill секунд простоя корзина полна, и запись
+    # можно забыть.
+    timeout = math.ceil(capacity * refill)
+    cache.add(key, earned, timeout)
+    try:
+        used = cache.incr(key)
+    except ValueError:
+        # Запись вытеснили между add и incr.
+        cache.add(key, earned, timeout)
+        used = cache.incr(key)
+    # За время простоя копится не больше capacity жетонов: отстающий
+    # счётчик подтягивается сдвигом, а не записью, чтобы не затереть
+    # параллельные incr.
+    if used - 1 < earned:
+        used = cache.incr(key, earned - (used - 1))
+    if used - earned <= capacity:
+        cache.touch(key, timeout)
+        return 0
+    cache.decr(key)
+    # Жетон появится, когда earned дорастёт до used - capacity.
+    return max(math.ceil((used - capacity) * refill - now), 1)
+
+
+def rate_limit(policy, methods=('POST',)):
+    """Пропускает не больше запросов methods, чем позволяет policy.
+
+    Лишние получают 429 с заголовком Retry-After. Решения считаются в
+    метрике yatube_ratelimit_requests_total.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return view(request, *args, **kwargs)
+            retry_after = take_token(policy, client_ident(request))
+            registry.increment(
+                'yatube_ratelimit_requests_total', policy=policy,
+                result='limited' if retry_after else 'allowed'
+            )
+            if not retry_after:
+                return view(request, *args, **kwargs)
+            response = render(
+                request, 'core/429.html', {'retry_after': retry_after},
+                status=429
+            )
+            response['Retry-After'] = str(retry_after)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,69 @@
+"""Чтение с реплик, запись в основную базу.
+
+Внутри HTTP-запроса чтение уходит на случайную реплику из
+DATABASE_REPLICAS, пока запрос ничего не записал. Запросы с методом
+POST и другими небезопасными методами, а также клиенты, которые сами
+писали в последние REPLICA_STICKY_SECONDS, читают из основной базы и
+видят свои изменения, не дожидаясь репликации (см. ReplicaMiddleware).
+Фоновые задачи и команды всегда читают из основной базы.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Routing:
+    """Состояние маршрутизации одного HTTP-запроса."""
+
+    def __init__(self, pinned=False):
+        # pinned — читать из основной базы до конца запроса.
+        self.pinned = pinned
+        self.wrote = False
+
+
+current = ContextVar('routing', default=None)
+
+
+def reading_from_replica():
+    routing = current.get()
+    return bool(
+        routing is not None
+        and not routing.pinned
+        and settings.DATABASE_REPLICAS
+        # Внутри транзакции чтение должно видеть её же записи.
+        and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+    )
+
+
+def may_be_stale(modified):
+    """Могут ли реплики ещё не знать о записи, сделанной в modified.
+
+    modified — timestamp с точностью до секунды, поэтому к окну
+    прибавляется секунда.
+    """
+    window = settings.REPLICA_STICKY_SECONDS + 1
+    return reading_from_replica() and time.time() - modified < window
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if reading_from_replica():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        routing = current.get()
+        if routing is not None:
+            routing.pinned = routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На репликах те же строки, что и в основной базе.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схема приходит на реплики вместе с данными.
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,41 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.TASKS_MAX_WORKERS,
+            thread_name_prefix='yatube-task',
+        )
+    return _executor
+
+
+def _run(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception('Фоновая задача %s завершилась ошибкой', func)
+    finally:
+        connection.close()
+
+
+def enqueue(func, *args, **kwargs):
+    """Выполняет func в локальном пуле потоков после коммита транзакции.
+
+    При TASKS_ALWAYS_EAGER задача выполняется сразу в текущем потоке.
+    """
+    if settings.TASKS_ALWAYS_EAGER:
+        func(*args, **kwargs)
+        return
+    transaction.on_commit(
+        lambda: get_executor().submit(_run, func, args, kwargs)
+    )
@@ -0,0 +1,36 @@
+import time
+from contextvars import ContextVar
+
+from django.template.backends import django as backend
+
+from .metrics import add_render_time
+
+# Карточки и фрагменты рендерятся внутри страницы: их время уже входит
+# во время внешнего шаблона.
+rendering = ContextVar('template_rendering', default=False)
+
+
+class Template(backend.Template):
+    def render(self, context=None, request=None):
+        if rendering.get():
+            return super().render(context, request)
+        token = rendering.set(True)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            rendering.reset(token)
+            add_render_time(time.perf_counter() - started)
+
+
+class DjangoTemplates(backend.DjangoTemplates):
+    """Бэкенд Django, который учитывает время рендеринга в метриках."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except backend.TemplateDoesNotExist as exc:
+            backend.reraise(exc, self)
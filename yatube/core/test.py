@@ -0,0 +1,667 @@
+import glob
+import io
+import os
+import tempfile
+import threading
+import time
+from http import HTTPStatus
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import (DEFAULT_DB_ALIAS, OperationalError, connections,
+                       transaction)
+from django.template import Context, Template, engines
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import reverse
+
+from posts.models import Comment, Group, Post, User, UserStats
+
+from . import cache_backends
+from .cache_backends import TwoTierCache
+from .db import retry_on_locked
+from .metrics import Registry, RequestMetrics, registry
+from .profiling import StackSampler
+from .profiling import get_store as get_profile_store
+from .ratelimit import take_token
+from .middleware import ReplicaMiddleware
+from .querycache import cached
+from .querylog import fingerprint, record_queries
+from .testing import QueryBudgetMixin
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        store = os.path.join(self.tmp.name, 'metrics.sqlite3')
+        settings = override_settings(
+            METRICS_STORE=store, METRICS_FLUSH_INTERVAL=3600
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        registry.discard()
+        self.guest_client = Client()
+
+    def test_metrics_collected_per_view(self):
+        """Запросы учитываются по имени view вместе с SQL и шаблонами."""
+        self.guest_client.get(reverse('posts:index'))
+        self.guest_client.get(reverse('posts:index'))
+        text = self.guest_client.get('/metrics').content.decode()
+        self.assertIn(
+            'yatube_http_requests_total{method="GET",status="200",'
+            'view="posts:index"} 2',
+            text
+        )
+        self.assertIn(
+            'yatube_http_request_duration_seconds_count'
+            '{view="posts:index"} 2',
+            text
+        )
+        self.assertIn(
+            'yatube_http_request_duration_seconds_bucket'
+            '{le="+Inf",view="posts:index"} 2',
+            text
+        )
+        self.assertIn('yatube_db_queries_sum{view="posts:index"}', text)
+        self.assertIn(
+            'yatube_template_render_seconds_total{view="posts:index"}', text
+        )
+        self.assertIn('# TYPE yatube_db_queries histogram', text)
+
+    def test_metrics_aggregated_across_processes(self):
+        """Приращения разных процессов складываются в общем хранилище."""
+        other_worker = Registry()
+        with override_settings(METRICS_FLUSH_INTERVAL=0):
+            self.guest_client.get(reverse('about:author'))
+            request_metrics = RequestMetrics()
+            request_metrics.queries = 3
+            other_worker.record(
+                'about:author', 'GET', 200, 0.2, request_metrics
+            )
+        text = registry.exposition()
+        self.assertIn(
+            'yatube_http_requests_total{method="GET",status="200",'
+            'view="about:author"} 2',
+            text
+        )
+        self.assertIn(
+            'yatube_db_duration_seconds_total{view="about:author"}', text
+        )
+
+    def test_nested_render_counted_once(self):
+        """Шаблон, отрисованный внутри другого, не учитывается дважды."""
+        [engine] = engines.all()
+        inner = engine.from_string('карточка')
+        outer = engine.from_string('{{ card }}')
+        with mock.patch('core.template_backends.add_render_time') as add:
+            self.assertEqual(
+                outer.render({'card': lambda: inner.render()}), 'карточка'
+            )
+        add.assert_called_once()
+
+    def test_metrics_hidden_from_outside(self):
+        """Чужим адресам эндпоинт отвечает 404."""
+        response = self.guest_client.get('/metrics', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_STICKY_SECONDS=5)
+class ReplicaRoutingTests(TransactionTestCase):
+    """Реплика — вторая база SQLite, которую обновляет sync_replicas."""
+
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='writer')
+        self.guest_client = Client()
+        self.author_client = Client()
+        self.author_client.force_login(self.user)
+        self.sync()
+
+    def sync(self):
+        call_command('sync_replicas', stdout=io.StringIO())
+
+    def test_reads_go_to_replica(self):
+        """Чтение идёт с реплики и видит только то, что туда дошло."""
+        Post.objects.create(author=self.user, text='Ещё не на реплике')
+        url = reverse('posts:index')
+        response = self.guest_client.get(url)
+        self.assertNotContains(response, 'Ещё не на реплике')
+        # Свежая версия страницы собрана с реплики: валидаторов нет, и
+        # клиент не получит на неё 304 после репликации.
+        self.assertFalse(response.has_header('ETag'))
+        self.sync()
+        cache.clear()
+        self.assertContains(self.guest_client.get(url), 'Ещё не на реплике')
+
+    def test_writer_reads_own_writes(self):
+        """После своей записи клиент читает из основной базы."""
+        response = self.author_client.post(
+            reverse('posts:post_create'), data={'text': 'Мой новый пост'}
+        )
+        self.assertIn(ReplicaMiddleware.STICKY_COOKIE, response.cookies)
+        url = reverse('posts:profile', args=(self.user.username,))
+        self.assertNotContains(self.guest_client.get(url), 'Мой новый пост')
+        self.assertContains(self.author_client.get(url), 'Мой новый пост')
+        del self.author_client.cookies[ReplicaMiddleware.STICKY_COOKIE]
+        self.assertNotContains(
+            self.author_client.get(url), 'Мой новый пост'
+        )
+
+    @override_settings(TASKS_ALWAYS_EAGER=True)
+    def test_write_in_get_request_pins_to_primary(self):
+        """Подписка по ссылке тоже закрепляет клиента за основной базой."""
+        author = User.objects.create_user(username='author')
+        Post.objects.create(author=author, text='Пост автора')
+        self.sync()
+        response = self.author_client.get(
+            reverse('posts:profile_follow', args=(author.username,))
+        )
+        self.assertIn(ReplicaMiddleware.STICKY_COOKIE, response.cookies)
+        self.assertContains(
+            self.author_client.get(reverse('posts:follow_index')),
+            'Пост автора'
+        )
+
+
+class SqliteConnectionTests(TestCase):
+    def test_new_connection_gets_pragmas(self):
+        """Новое соединение с файлом базы работает в WAL и ждёт блокировку."""
+        default = connections[DEFAULT_DB_ALIAS]
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = type(default)({
+                **default.settings_dict,
+                'NAME': os.path.join(directory, 'db.sqlite3'),
+            }, alias='pragmas')
+            try:
+                with wrapper.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+                    cursor.execute('PRAGMA busy_timeout')
+                    self.assertEqual(
+                        cursor.fetchone()[0],
+                        settings.SQLITE_PRAGMAS['busy_timeout']
+                    )
+            finally:
+                wrapper.close()
+
+    @override_settings(SQLITE_RETRY_ATTEMPTS=3, SQLITE_RETRY_DELAY=0)
+    def test_locked_view_is_retried_without_leftovers(self):
+        """Занятая база — повтор; записи неудачной попытки откатываются."""
+        user = User.objects.create_user(username='retry')
+        attempts = []
+
+        @retry_on_locked
+        def view(request):
+            Post.objects.create(author=user, text='Попытка')
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise OperationalError('database is locked')
+            return 'ok'
+
+        with self.assertLogs('core.db', 'WARNING'):
+            self.assertEqual(view(None), 'ok')
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(Post.objects.filter(author=user).count(), 1)
+
+    def test_write_transaction_only_around_save(self):
+        """Показ формы и её проверка идут без блокировки записи."""
+        cache.clear()
+        user = User.objects.create_user(username='writer')
+        self.client.force_login(user)
+        url = reverse('posts:post_create')
+        with mock.patch(
+            'core.db.transaction.atomic', wraps=transaction.atomic
+        ) as atomic:
+            self.client.get(url)
+            self.client.post(url, {'text': ''})
+            self.assertFalse(atomic.called)
+            self.client.post(url, {'text': 'Записано'})
+            atomic.assert_called_once_with()
+        self.assertTrue(Post.objects.filter(text='Записано').exists())
+
+    @override_settings(SQLITE_RETRY_ATTEMPTS=3, SQLITE_RETRY_DELAY=0)
+    def test_other_errors_are_not_retried(self):
+        attempts = []
+
+        @retry_on_locked
+        def view(request):
+            attempts.append(1)
+            raise OperationalError('no such table: posts_post')
+
+        with self.assertRaises(OperationalError):
+            view(None)
+        self.assertEqual(len(attempts), 1)
+
+
+@override_settings(RATE_LIMITS={
+    'comment': {'capacity': 2, 'refill': 60},
+    'signup': {'capacity': 1, 'refill': 600},
+})
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        settings = override_settings(
+            METRICS_STORE=os.path.join(self.tmp.name, 'metrics.sqlite3'),
+            METRICS_FLUSH_INTERVAL=3600,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        registry.discard()
+
+    def test_bucket_allows_burst_then_refills(self):
+        """Корзина отдаёт capacity жетонов сразу и по одному за refill."""
+        with mock.patch('core.ratelimit.time.time', return_value=6000.0):
+            self.assertEqual(take_token('comment', 'ip:1'), 0)
+            self.assertEqual(take_token('comment', 'ip:1'), 0)
+            self.assertEqual(take_token('comment', 'ip:1'), 60)
+            # Другой клиент считается отдельно.
+            self.assertEqual(take_token('comment', 'ip:2'), 0)
+        with mock.patch('core.ratelimit.time.time', return_value=6059.5):
+            self.assertEqual(take_token('comment', 'ip:1'), 1)
+        with mock.patch('core.ratelimit.time.time', return_value=6060.0):
+            self.assertEqual(take_token('comment', 'ip:1'), 0)
+            self.assertEqual(take_token('comment', 'ip:1'), 60)
+
+    def test_idle_bucket_holds_at_most_capacity(self):
+        with mock.patch('core.ratelimit.time.time', return_value=6000.0):
+            take_token('comment', 'ip:1')
+        with mock.patch('core.ratelimit.time.time', return_value=60000.0):
+            self.assertEqual(take_token('comment', 'ip:1'), 0)
+            self.assertEqual(take_token('comment', 'ip:1'), 0)
+            self.assertEqual(take_token('comment', 'ip:1'), 60)
+
+    def test_limited_view_answers_429(self):
+        """Лишний комментарий получает 429 с Retry-After и не пишется."""
+        user = User.objects.create_user(username='bot')
+        post = Post.objects.create(author=user, text='Пост')
+        client = Client()
+        client.force_login(user)
+        url = reverse('posts:add_comment', args=(post.pk,))
+        for _ in range(2):
+            response = client.post(url, data={'text': 'Спам'})
+            self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        response = client.post(url, data={'text': 'Спам'})
+        self.assertEqual(response.status_code, HTTPStatus.TOO_MANY_REQUESTS)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(Comment.objects.filter(post=post).count(), 2)
+        text = registry.exposition()
+        self.assertIn(
+            'yatube_ratelimit_requests_total'
+            '{policy="comment",result="allowed"} 2',
+            text
+        )
+        self.assertIn(
+            'yatube_ratelimit_requests_total'
+            '{policy="comment",result="limited"} 1',
+            text
+        )
+
+    def test_signup_limited_per_address(self):
+        """Регистрация ограничена по адресу; показ формы не считается."""
+        client = Client()
+        url = reverse('users:signup')
+        self.assertEqual(client.get(url).status_code, HTTPStatus.OK)
+        self.assertEqual(client.get(url).status_code, HTTPStatus.OK)
+        data = {
+            'username': 'newbie', 'email': 'newbie@example.com',
+            'password1': 'Sup3r-secret', 'password2': 'Sup3r-secret',
+        }
+        client.post(url, data=data)
+        response = client.post(url, data={**data, 'username': 'newbie2'})
+        self.assertEqual(response.status_code, HTTPStatus.TOO_MANY_REQUESTS)
+        other = Client(REMOTE_ADDR='10.0.0.2')
+        self.assertNotEqual(
+            other.post(url, data={**data, 'username': 'newbie3'})
+            .status_code,
+            HTTPStatus.TOO_MANY_REQUESTS
+        )
+
+
+class TwoTierCacheTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        settings = override_settings(
+            METRICS_STORE=os.path.join(self.tmp.name, 'metrics.sqlite3'),
+            METRICS_FLUSH_INTERVAL=3600,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        registry.discard()
+
+    def worker(self, **options):
+        """Кэш отдельного процесса над общим файлом L2."""
+        # У другого процесса своя L1.
+        with mock.patch.dict(cache_backends._l1_caches, clear=True):
+            return TwoTierCache(
+                os.path.join(self.tmp.name, 'cache.sqlite3'),
+                {'OPTIONS': {'LOCK_WAIT': 0.05, **options}}
+            )
+
+    def test_workers_share_l2(self):
+        """Запись и инвалидация одного процесса видны другому."""
+        first, second = self.worker(L1_TIMEOUT=0), self.worker(L1_TIMEOUT=0)
+        first.set('page', 'v1')
+        self.assertEqual(second.get('page'), 'v1')
+        first.add('generation', 1, None)
+        self.assertEqual(second.incr('generation'), 2)
+        self.assertEqual(first.get('generation'), 2)
+        first.delete('page')
+        self.assertIsNone(second.get('page'))
+        self.assertFalse(second.add('generation', 5, None))
+        self.assertEqual(first.get_many(['generation', 'page']),
+                         {'generation': 2})
+
+    def test_l1_is_bounded_lru(self):
+        cache = self.worker(L1_MAX_ENTRIES=2, L1_TIMEOUT=60)
+        for key in 'abc':
+            cache.set(key, key)
+        self.assertEqual(list(cache._l1), [':1:b', ':1:c'])
+        cache.get('b')
+        cache.set('d', 'd')
+        self.assertEqual(list(cache._l1), [':1:b', ':1:d'])
+        # Вытесненное из L1 читается из L2.
+        self.assertEqual(cache.get('a'), 'a')
+
+    def test_threads_share_l1(self):
+        """Поток, в котором Django создал свой экземпляр кэша, читает L1."""
+        config = {'default': {
+            'BACKEND': 'core.cache_backends.TwoTierCache',
+            'LOCATION': os.path.join(self.tmp.name, 'threads.sqlite3'),
+            'OPTIONS': {'L1_TIMEOUT': 60},
+        }}
+        with override_settings(CACHES=config):
+            caches['default'].set('key', 'value')
+            # В L2 значения больше нет: найти его можно только в L1.
+            caches['default']._db().execute('DELETE FROM cache')
+            results = []
+            thread = threading.Thread(
+                target=lambda: results.append(caches['default'].get('key'))
+            )
+            thread.start()
+            thread.join()
+        self.assertEqual(results, ['value'])
+
+    def test_stats_per_tier(self):
+        cache = self.worker(L1_TIMEOUT=60)
+        cache.get('missing')
+        cache.set('key', 'value')
+        cache.get('key')
+        self.worker().get('key')
+        text = registry.exposition()
+        for tier, result, count in (('l1', 'hit', 1), ('l1', 'miss', 2),
+                                    ('l2', 'hit', 1), ('l2', 'miss', 1)):
+            self.assertIn(
+                'yatube_cache_requests_total'
+                f'{{result="{result}",tier="{tier}"}} {count}',
+                text
+            )
+
+    def test_only_one_worker_rebuilds_expired_key(self):
+        """Истёкшее значение пересчитывает один, остальным — старое."""
+        workers = [self.worker(L1_TIMEOUT=0) for _ in range(3)]
+        workers[0].set('hot', 'old', 1)
+        with mock.patch(
+            'core.cache_backends.time.time', return_value=time.time() + 2
+        ):
+            results = [worker.get('hot') for worker in workers]
+            self.assertEqual(results, [None, 'old', 'old'])
+            workers[0].set('hot', 'new', 20)
+            self.assertEqual(workers[2].get('hot'), 'new')
+
+    def test_missing_key_waits_for_rebuild(self):
+        first, second = self.worker(), self.worker()
+        self.assertIsNone(first.get('hot'))
+        started = time.monotonic()
+        self.assertIsNone(second.get('hot'))
+        # Значения не дождались: ждали не дольше LOCK_WAIT.
+        self.assertLess(time.monotonic() - started, 1)
+        first.set('hot', 'value')
+        self.assertEqual(second.get('hot'), 'value')
+
+    def test_early_recomputation_before_expiry(self):
+        """XFetch отдаёт промах незадолго до срока, если пересчёт долгий."""
+        cache = self.worker(L1_TIMEOUT=0)
+        cache.get('slow')
+        cache._rebuilding()[':1:slow'] -= 5
+        cache.set('slow', 'value', 10)
+        with mock.patch('core.cache_backends.random.random',
+                        return_value=0.5):
+            self.assertEqual(cache.get('slow'), 'value')
+            with mock.patch('core.cache_backends.time.time',
+                            return_value=time.time() + 8):
+                self.assertIsNone(cache.get('slow'))
+                self.assertEqual(self.worker().get('slow'), 'value')
+
+    def test_cache_report(self):
+        """Отчёт показывает долю попаданий по уровням и снимкам."""
+        cache = self.worker(L1_TIMEOUT=60)
+        cache.set('key', 'value')
+        for _ in range(3):
+            cache.get('key')
+        cache.get('missing')
+        registry.increment(
+            'yatube_object_cache_requests_total', 4, model='post',
+            result='hit'
+        )
+        out = io.StringIO()
+        call_command('cache_report', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[1].split(), ['l1', '3', '1', '75.0%'])
+        self.assertEqual(lines[2].split(), ['l2', '0', '1', '0.0%'])
+        self.assertEqual(lines[3].split(), ['снимки', 'post', '4', '0',
+                                            '100.0%'])
+
+
+class QueryCacheTests(TransactionTestCase):
+    """Транзакционный тест: кэш не берёт строки незафиксированных записей,
+    а TestCase держит весь тест в одной транзакции."""
+
+    def setUp(self):
+        cache.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        settings = override_settings(
+            METRICS_STORE=os.path.join(self.tmp.name, 'metrics.sqlite3'),
+            METRICS_FLUSH_INTERVAL=3600,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        registry.discard()
+        self.group = Group.objects.create(title='Группа', slug='cached')
+
+    def title(self):
+        return cached(Group.objects.all()).get(slug='cached').title
+
+    def test_repeated_read_skips_database(self):
+        for queries in (2, 0):
+            with self.assertNumQueries(queries):
+                self.assertEqual(self.title(), 'Группа')
+                slugs = cached(Group.objects.values_list('slug', flat=True))
+                self.assertEqual(list(slugs.iterator()), ['cached'])
+        text = registry.exposition()
+        self.assertIn('yatube_query_cache_requests_total'
+                      '{model="posts.group",result="hit"} 2', text)
+        self.assertIn('yatube_query_cache_requests_total'
+                      '{model="posts.group",result="miss"} 2', text)
+
+    def test_orm_writes_invalidate_tables(self):
+        """save(), update() и записи в таблицы из JOIN сбрасывают кэш."""
+        self.title()
+        self.group.title = 'Новая'
+        self.group.save()
+        self.assertEqual(self.title(), 'Новая')
+        Group.objects.update(title='Ещё новее')
+        self.assertEqual(self.title(), 'Ещё новее')
+        # Запись в другую таблицу кэш группы не трогает.
+        User.objects.create_user(username='other')
+        with self.assertNumQueries(0):
+            self.title()
+        user = cached(User.objects.select_related('stats')).get(
+            username='other'
+        )
+        UserStats.objects.filter(user=user).update(post_count=5)
+        user = cached(User.objects.select_related('stats')).get(
+            username='other'
+        )
+        self.assertEqual(user.stats.post_count, 5)
+
+    def test_uncommitted_writes_bypass_cache(self):
+        """Строки незафиксированной транзакции не попадают в кэш."""
+        self.title()
+        with transaction.atomic():
+            Group.objects.update(title='Откатится')
+            with self.assertNumQueries(2):
+                self.assertEqual(self.title(), 'Откатится')
+                self.assertEqual(self.title(), 'Откатится')
+            transaction.set_rollback(True)
+        self.assertEqual(self.title(), 'Группа')
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        settings = override_settings(
+            PROFILE_DIR=self.tmp.name, PROFILE_TOKEN='secret',
+            PROFILE_MAX_FILES=2, TASKS_ALWAYS_EAGER=True,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = Client()
+
+    def files(self, extension):
+        return glob.glob(os.path.join(self.tmp.name, f'*.{extension}'))
+
+    def test_header_profiles_request(self):
+        """С верным заголовком запрос профилируется и попадает в индекс."""
+        self.client.get(reverse('posts:index'), HTTP_X_PROFILE='wrong')
+        self.assertEqual(get_profile_store().slowest(), [])
+        self.client.get(reverse('posts:index'), HTTP_X_PROFILE='secret')
+        [profile] = get_profile_store().slowest()
+        self.assertEqual(profile['view'], 'posts:index')
+        self.assertEqual(profile['status'], HTTPStatus.OK)
+        self.assertEqual(len(self.files('prof')), 1)
+        self.assertEqual(len(self.files('collapsed')), 1)
+
+    @override_settings(PROFILE_STACK_INTERVAL=0.001)
+    def test_sampler_collapses_stacks_below_root(self):
+        def root():
+            return busy()
+
+        def busy():
+            started = time.perf_counter()
+            while time.perf_counter() - started < 0.05:
+                pass
+
+        sampler = StackSampler(threading.get_ident(), root.__code__)
+        sampler.start()
+        root()
+        sampler.stop()
+        line = sampler.collapsed().splitlines()[0]
+        stack, count = line.rsplit(' ', 1)
+        self.assertEqual(stack, 'test.py:{}(busy)'.format(
+            busy.__code__.co_firstlineno
+        ))
+        self.assertGreater(int(count), 0)
+
+    @override_settings(PROFILE_SAMPLE_RATE=1)
+    def test_sampled_profiles_kept_in_ring(self):
+        """Хранятся последние PROFILE_MAX_FILES профилей."""
+        for _ in range(3):
+            self.client.get(reverse('posts:index'))
+        self.assertEqual(len(get_profile_store().slowest()), 2)
+        self.assertEqual(len(self.files('prof')), 2)
+        self.assertEqual(len(self.files('collapsed')), 2)
+
+    def test_profiles_visible_to_staff_only(self):
+        self.client.get(reverse('posts:index'), HTTP_X_PROFILE='secret')
+        [profile] = get_profile_store().slowest()
+        urls = (
+            reverse('profiles'),
+            reverse('profile_detail', args=(profile['id'],)),
+            reverse('profile_file', args=(profile['id'], 'collapsed')),
+        )
+        user = User.objects.create_user(username='reader')
+        self.client.force_login(user)
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code,
+                             HTTPStatus.FOUND)
+        user.is_staff = True
+        user.save()
+        self.assertContains(self.client.get(urls[0]), urls[1])
+        self.assertContains(self.client.get(urls[1]), 'views.py')
+        self.assertEqual(self.client.get(urls[2]).status_code, HTTPStatus.OK)
+        self.assertEqual(
+            self.client.get(
+                reverse('profile_file', args=(profile['id'], 'sqlite3'))
+            ).status_code,
+            HTTPStatus.NOT_FOUND
+        )
+
+
+class QueryLogTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        Post.objects.bulk_create(
+            Post(author=cls.user, text=f'Пост {number}')
+            for number in range(7)
+        )
+
+    def test_fingerprint_drops_values(self):
+        self.assertEqual(
+            fingerprint(
+                "SELECT * FROM t WHERE a = 'it''s'  AND b IN (%s, %s, %s)\n"
+                "LIMIT 21"
+            ),
+            'SELECT * FROM t WHERE a = %s AND b IN (...) LIMIT %s'
+        )
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE b IN (%s)'),
+            fingerprint('SELECT * FROM t WHERE b IN (%s, %s)')
+        )
+
+    def test_repeated_query_traced_to_template_and_code(self):
+        """N+1 в шаблоне находится с тегом шаблона и строкой кода."""
+        posts = list(Post.objects.all())
+        template = Template(
+            '{% for post in posts %}\n{{ post.author.username }}'
+            '{% endfor %}'
+        )
+        with record_queries() as log:
+            template.render(Context({'posts': posts}))
+        [(query, count)] = log.repeated()
+        self.assertEqual(count, 7)
+        self.assertEqual(query.template, '<unknown source>:2')
+        self.assertRegex(
+            query.code, r'^core/test\.py:\d+\(test_repeated_query'
+        )
+
+    @override_settings(QUERY_REPEAT_LIMIT=0, SLOW_QUERY_THRESHOLD=0)
+    def test_middleware_logs_slow_and_repeated_queries(self):
+        with self.assertLogs('core.querylog', 'WARNING') as logs:
+            self.client.get(reverse('posts:index'))
+        output = '\n'.join(logs.output)
+        self.assertIn('Медленный запрос', output)
+        self.assertIn('Возможный N+1 в posts:index', output)
+
+    def test_query_budget(self):
+        with self.assertQueryBudget(1):
+            User.objects.count()
+        with self.assertRaisesRegex(AssertionError, 'при бюджете 0'):
+            with self.assertQueryBudget(0):
+                User.objects.count()
+        with self.assertRaisesRegex(AssertionError, 'N\\+1'):
+            with self.assertQueryBudget(10, repeat_limit=1):
+                for post in Post.objects.all()[:2]:
+                    post.author.username
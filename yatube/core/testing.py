@@ -0,0 +1,72 @@
+import copy
+import os
+import tempfile
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+from .querylog import record_queries
+
+
+@contextmanager
+def isolated_files():
+    """Кэш, метрики и профили внутри блока лежат во временном каталоге.
+
+    Иначе тесты пишут в те же файлы, что и сервер разработки, а очистка
+    кэша после миграций тестовой базы стирает его кэш. Используется и
+    TestRunner, и tests/conftest.py.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        caches = copy.deepcopy(settings.CACHES)
+        for alias, config in caches.items():
+            if config['BACKEND'] == 'core.cache_backends.TwoTierCache':
+                config['LOCATION'] = os.path.join(
+                    directory, f'cache-{alias}.sqlite3'
+                )
+        with override_settings(
+            CACHES=caches,
+            METRICS_STORE=os.path.join(directory, 'metrics.sqlite3'),
+            PROFILE_DIR=os.path.join(directory, 'profiles'),
+        ):
+            yield directory
+
+
+class TestRunner(DiscoverRunner):
+    """Запуск тестов с файлами во временном каталоге (isolated_files)."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.files = ExitStack()
+        self.files.enter_context(isolated_files())
+
+    def teardown_test_environment(self, **kwargs):
+        self.files.close()
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryBudgetMixin:
+    """Проверки числа SQL-запросов для TestCase."""
+
+    @contextmanager
+    def assertQueryBudget(self, budget, repeat_limit=None):
+        """Блок выполняет не больше budget запросов и не повторяет один
+        и тот же запрос больше repeat_limit раз (QUERY_REPEAT_LIMIT).
+
+        В сообщении об ошибке — все запросы с местом вызова в коде и
+        шаблоне.
+        """
+        with record_queries() as log:
+            yield log
+        if len(log.queries) > budget:
+            self.fail(
+                f'{len(log.queries)} запросов при бюджете {budget}:\n'
+                f'{log.report()}'
+            )
+        repeated = log.repeated(repeat_limit)
+        if repeated:
+            self.fail('Повторяющиеся запросы (N+1):\n' + '\n'.join(
+                f'{count} раз, {log.describe(query)}: {query.fingerprint}'
+                for query, count in repeated
+            ))
@@ -1,5 +1,16 @@
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import render
 
+from . import profiling
+from .metrics import registry
+
+PROFILE_FILES = {
+    'prof': 'application/octet-stream',
+    'collapsed': 'text/plain; charset=utf-8',
+}
+
 
 def page_not_found(request, exception):
     return render(request, 'core/404.html', {'path': request.path}, status=404)
@@ -15,3 +26,63 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def metrics(request):
+    """Метрики всех воркеров в формате Prometheus; только для своих адресов."""
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(
+        registry.exposition(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+@staff_member_required
+def profiles(request):
+    """Самые долгие из профилированных запросов, по view или все."""
+    store = profiling.get_store()
+    view = request.GET.get('view', '')
+    context = {
+        'profiles': store.slowest(view=view),
+        'views': store.views(),
+        'view': view,
+    }
+    return render(request, 'core/profiles.html', context)
+
+
+def _get_profile(profile_id):
+    profile = profiling.get_store().get(profile_id)
+    if profile is None:
+        raise Http404
+    return profile
+
+
+@staff_member_required
+def profile_detail(request, profile_id):
+    profile = _get_profile(profile_id)
+    try:
+        functions = profiling.top_functions(profile_id)
+    except FileNotFoundError:
+        raise Http404
+    context = {
+        'profile': profile,
+        'functions': functions,
+    }
+    return render(request, 'core/profile_detail.html', context)
+
+
+@staff_member_required
+def profile_file(request, profile_id, extension):
+    """Файл профиля для snakeviz, flamegraph.pl или speedscope."""
+    if extension not in PROFILE_FILES:
+        raise Http404
+    _get_profile(profile_id)
+    try:
+        fp = open(profiling.profile_path(profile_id, extension), 'rb')
+    except FileNotFoundError:
+        raise Http404
+    return FileResponse(
+        fp, as_attachment=True, filename=f'{profile_id}.{extension}',
+        content_type=PROFILE_FILES[extension]
+    )
@@ -1,26 +1,48 @@
 from django.contrib import admin
+from django.db.models.expressions import RawSQL
+
+from core.querycache import cached
 
 from .models import Comment, Follow, Group, Post
+from .search import TOKEN_RE, build_match, fts_available, matching_ids_sql
+
+
+class CachedAdmin(admin.ModelAdmin):
+    """Списки и формы админки читают строки через кэш запросов."""
 
+    def get_queryset(self, request):
+        return cached(super().get_queryset(request))
 
-class PostAdmin(admin.ModelAdmin):
+
+class PostAdmin(CachedAdmin):
     list_display = ('pk', 'text', 'pub_date', 'author', 'group')
     list_editable = ('group',)
     search_fields = ('text',)
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        match = build_match(TOKEN_RE.findall(search_term))
+        if not match or not fts_available():
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        queryset = queryset.filter(
+            pk__in=RawSQL(matching_ids_sql(), [match])
+        )
+        return queryset, False
+
 
-class GroupAdmin(admin.ModelAdmin):
+class GroupAdmin(CachedAdmin):
     list_display = ('pk', 'title', 'slug', 'description',)
     prepopulated_fields = {'slug': ('title',)}
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(CachedAdmin):
     list_display = ('pk', 'post', 'author', 'text', 'created')
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(CachedAdmin):
     list_display = ('pk', 'user', 'author')
 
 
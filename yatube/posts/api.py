@@ -0,0 +1,209 @@
+"""JSON API только для чтения: ленты, посты и комментарии.
+
+Строки выбираются через .values() только с запрошенными полями (fields=),
+картинки отдаются ссылками на миниатюры. Ответы кэшируются по тем же
+версиям, что и HTML-страницы, и поддерживают If-None-Match.
+"""
+from functools import wraps
+
+from django.db.models import F
+from django.http import JsonResponse
+
+from . import cache
+from .models import Comment, Group, Post
+from .thumbnails import thumbnail_or_none
+from .utils import COUNT_COMMENTS, COUNT_POST, CursorPaginator
+
+# Поле ответа -> выражение для .values().
+POST_FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'updated': 'updated',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+}
+# Число комментариев меняет только версию поста, поэтому оно есть лишь
+# в ответе о самом посте, а не в лентах.
+POST_DETAIL_FIELDS = {**POST_FIELDS, 'comment_count': 'comment_count'}
+COMMENT_FIELDS = {
+    'id': 'id',
+    'post': 'post_id',
+    'text': 'text',
+    'created': 'created',
+    'author': 'author__username',
+}
+POST_KEYS = ('pub_date', 'id')
+COMMENT_KEYS = ('created', 'id')
+FEED_KEYS = ('feed_date', 'feed_id')
+THUMBNAIL_PRESET = 'card'
+
+
+class ApiError(Exception):
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def error_response(status, detail):
+    return JsonResponse({'detail': detail}, status=status)
+
+
+def api_view(get_scopes, personal=False):
+    """Только GET/HEAD; ответ кэшируется по версиям scopes.
+
+    get_scopes получает запрос и аргументы представления и возвращает
+    области (scope, ident) либо None, если объекта нет. Ответ personal
+    зависит от пользователя и кэшируется для каждого отдельно.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return error_response(405, 'Метод не поддерживается.')
+            if personal and not request.user.is_authenticated:
+                return error_response(401, 'Нужна авторизация.')
+            scopes = get_scopes(request, *args, **kwargs)
+            if scopes is None:
+                return error_response(404, 'Не найдено.')
+
+            def get_response():
+                try:
+                    return JsonResponse(
+                        view(request, *args, **kwargs),
+                        json_dumps_params={'ensure_ascii': False}
+                    )
+                except ApiError as error:
+                    return error_response(error.status, error.detail)
+
+            vary = request.user.pk if personal else ''
+            return cache.cached_response(request, scopes, get_response, vary)
+        return wrapper
+    return decorator
+
+
+def requested_fields(request, available):
+    """Поля из параметра fields=a,b; без параметра — все поля."""
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(available)
+    fields = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = sorted(set(fields) - set(available))
+    if unknown:
+        raise ApiError(400, f'Неизвестные поля: {", ".join(unknown)}.')
+    return fields
+
+
+def select(queryset, fields, available, keys=()):
+    """values() с нужными полями и полями ключа курсора."""
+    lookups = [available[name] for name in fields]
+    return queryset.values(
+        *lookups, *(key for key in keys if key not in lookups)
+    )
+
+
+def serialize(rows, fields, available):
+    results = []
+    for row in rows:
+        item = {name: row[available[name]] for name in fields}
+        if 'image' in item:
+            thumbnail = thumbnail_or_none(item['image'], THUMBNAIL_PRESET)
+            item['image'] = thumbnail.url if thumbnail else None
+        results.append(item)
+    return results
+
+
+def page_link(request, param, cursor):
+    if not cursor:
+        return None
+    query = request.GET.copy()
+    for name in ('after', 'before', 'page'):
+        query.pop(name, None)
+    query[param] = str(cursor)
+    return request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+
+
+def paginate(request, queryset, available, keys, per_page):
+    fields = requested_fields(request, available)
+    rows = select(queryset, fields, available, keys)
+    paginator = CursorPaginator(rows, per_page, keys=keys)
+    page = paginator.get_cursor_page(request.GET)
+    return {
+        'results': serialize(page.object_list, fields, available),
+        'next': page_link(request, 'after', page.next_cursor),
+        'previous': page_link(request, 'before', page.previous_cursor),
+    }
+
+
+def index_scopes(request):
+    return cache.index_page_scopes()
+
+
+def group_scopes(request, slug):
+    return cache.group_page_scopes(slug)
+
+
+def profile_scopes(request, username):
+    return cache.profile_page_scopes(username)
+
+
+def follow_scopes(request):
+    return [(cache.FOLLOWER, request.user.pk)]
+
+
+def post_scopes(request, post_id):
+    return cache.post_page_scopes(post_id)
+
+
+@api_view(index_scopes)
+def index(request):
+    return paginate(
+        request, Post.objects.all(), POST_FIELDS, POST_KEYS, COUNT_POST
+    )
+
+
+@api_view(group_scopes)
+def group_posts(request, slug):
+    group_ids = Group.objects.filter(slug=slug).values_list('pk', flat=True)
+    return paginate(
+        request, Post.objects.filter(group_id__in=group_ids), POST_FIELDS,
+        POST_KEYS, COUNT_POST
+    )
+
+
+@api_view(profile_scopes)
+def profile(request, username):
+    return paginate(
+        request, Post.objects.filter(author__username=username),
+        POST_FIELDS, POST_KEYS, COUNT_POST
+    )
+
+
+@api_view(follow_scopes, personal=True)
+def follow_index(request):
+    posts = Post.objects.filter(feed_entries__user=request.user).annotate(
+        feed_date=F('feed_entries__pub_date'),
+        feed_id=F('feed_entries__id'),
+    )
+    return paginate(request, posts, POST_FIELDS, FEED_KEYS, COUNT_POST)
+
+
+@api_view(post_scopes)
+def post_detail(request, post_id):
+    fields = requested_fields(request, POST_DETAIL_FIELDS)
+    rows = select(Post.objects.filter(pk=post_id), fields, POST_DETAIL_FIELDS)
+    posts = serialize(rows, fields, POST_DETAIL_FIELDS)
+    if not posts:
+        # Пост удалили между проверкой в api_view и выборкой.
+        raise ApiError(404, 'Не найдено.')
+    return posts[0]
+
+
+@api_view(post_scopes)
+def post_comments(request, post_id):
+    return paginate(
+        request, Comment.objects.filter(post_id=post_id), COMMENT_FIELDS,
+        COMMENT_KEYS, COUNT_COMMENTS
+    )
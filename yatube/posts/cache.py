@@ -0,0 +1,204 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from core import routers
+from core.querycache import cached
+
+from .models import Group, Post, User
+
+GLOBAL = 'global'
+GROUP = 'group'
+AUTHOR = 'author'
+FOLLOWER = 'follower'
+POST = 'post'
+
+GENERATION_KEY = 'posts:generation:{}:{}'
+MODIFIED_KEY = 'posts:modified:{}:{}'
+PAGE_KEY = 'posts:page:{}:{}'
+
+
+def generation_key(scope, ident=''):
+    return GENERATION_KEY.format(scope, ident)
+
+
+def modified_key(scope, ident=''):
+    return MODIFIED_KEY.format(scope, ident)
+
+
+def _initial_generation():
+    # Счётчик, вытесненный из кэша, начинается с текущего времени, чтобы
+    # не совпасть с одним из уже использованных значений.
+    return int(time.time() * 1000)
+
+
+def get_generations(*scopes):
+    """Возвращает версии для пар (scope, ident) одним запросом к кэшу."""
+    keys = [generation_key(*scope) for scope in scopes]
+    found = cache.get_many(keys)
+    missing = {key: _initial_generation() for key in keys
+               if key not in found}
+    for key, value in missing.items():
+        if not cache.add(key, value, None):
+            value = cache.get(key, value)
+        found[key] = value
+    return [found[key] for key in keys]
+
+
+def get_last_modified(*scopes):
+    """Время последнего изменения среди scopes (timestamp)."""
+    keys = [modified_key(*scope) for scope in scopes]
+    found = cache.get_many(keys)
+    now = int(time.time())
+    for key in keys:
+        if key not in found:
+            cache.add(key, now, None)
+            found[key] = cache.get(key, now)
+    return max(found.values())
+
+
+def _bump(scope, ident):
+    key = generation_key(scope, ident)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_generation(), None)
+    cache.set(modified_key(scope, ident), int(time.time()), None)
+
+
+def bump_generation(scope, ident=''):
+    _bump(scope, ident)
+    # До фиксации транзакции другой процесс уже видит новую версию, но
+    # читает старые строки и может закэшировать под ней старую страницу:
+    # после фиксации версия меняется ещё раз (как в snapshots.forget_posts).
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump(scope, ident))
+
+
+def bump_generations(scope, idents):
+    for ident in idents:
+        bump_generation(scope, ident)
+
+
+def feed_cache(*scopes):
+    """Контекст для {% cache %}: время жизни и версия фрагмента.
+
+    Версия меняется при любой записи, влияющей на ленту, поэтому
+    время жизни фрагмента может быть большим.
+    """
+    timeout = settings.FEED_CACHE_TIMEOUT
+    version = '.'.join(map(str, get_generations(*scopes)))
+    # Реплика может ещё не знать о записи, которая уже сменила версию:
+    # такой фрагмент живёт не дольше окна отставания реплик и не
+    # достаётся тем, кто читает из основной базы.
+    if (routers.reading_from_replica()
+            and routers.may_be_stale(get_last_modified(*scopes))):
+        timeout = settings.REPLICA_STICKY_SECONDS
+        version += '.replica'
+    return {
+        'cache_timeout': timeout,
+        'cache_version': version,
+    }
+
+
+def index_page_scopes():
+    return [(GLOBAL,)]
+
+
+def group_page_scopes(slug):
+    group_id = cached(Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True
+    )).first()
+    return None if group_id is None else [(GROUP, group_id)]
+
+
+def profile_page_scopes(username):
+    author_id = cached(User.objects.filter(username=username).values_list(
+        'pk', flat=True
+    )).first()
+    return None if author_id is None else [(AUTHOR, author_id)]
+
+
+def post_page_scopes(post_id):
+    post = Post.objects.filter(pk=post_id).values_list(
+        'author_id', 'group_id'
+    ).first()
+    if post is None:
+        return None
+    author_id, group_id = post
+    scopes = [(POST, post_id), (AUTHOR, author_id)]
+    if group_id is not None:
+        scopes.append((GROUP, group_id))
+    return scopes
+
+
+def cached_response(request, scopes, get_response, vary=''):
+    """Отвечает 304 или отдаёт сохранённый ответ, пока scopes не менялись.
+
+    Из версий областей строится сильный ETag, из времени их изменения —
+    Last-Modified. get_response вызывается только при промахе; в кэш
+    попадают лишь ответы 200. vary добавляется к ключу, если ответ по
+    одному адресу различается для разных пользователей. Ответ, который
+    мог быть собран с отстающей реплики, хранится недолго и уходит без
+    ETag и Last-Modified, чтобы клиент не закрепил его у себя.
+    """
+    version = '.'.join(map(str, get_generations(*scopes)))
+    last_modified = get_last_modified(*scopes)
+    stale = routers.may_be_stale(last_modified)
+    key_version = version + '.replica' if stale else version
+    path = request.get_full_path()
+    etag = quote_etag(hashlib.md5(
+        f'{path}|{version}|{vary}'.encode()
+    ).hexdigest())
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        key = PAGE_KEY.format(
+            hashlib.md5(f'{path}|{vary}'.encode()).hexdigest(), key_version
+        )
+        response = cache.get(key)
+        if response is None:
+            response = get_response()
+            if response.status_code != 200:
+                return response
+            cache.set(key, response, (
+                settings.REPLICA_STICKY_SECONDS if stale
+                else settings.PAGE_CACHE_TIMEOUT
+            ))
+    if not stale:
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'max-age=0, must-revalidate'
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def anonymous_page_cache(get_scopes):
+    """Кэширует страницу целиком для анонимных посетителей.
+
+    get_scopes получает аргументы представления и возвращает области
+    (scope, ident), от которых зависит страница, либо None, если страницу
+    кэшировать не нужно. Клиенты и прокси получают 304 Not Modified, пока
+    затрагивающей страницу записи не было (см. cached_response).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (request.method not in ('GET', 'HEAD')
+                    or request.user.is_authenticated):
+                return view(request, *args, **kwargs)
+            scopes = get_scopes(*args, **kwargs)
+            if scopes is None:
+                return view(request, *args, **kwargs)
+            return cached_response(
+                request, scopes, lambda: view(request, *args, **kwargs)
+            )
+        return wrapper
+    return decorator
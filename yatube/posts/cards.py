@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from .thumbnails import card_images
+
+CARD_KEY = 'posts:card:{}:{}:{:d}{:d}'
+CARD_TEMPLATE = 'posts/includes/post_card.html'
+
+
+def card_key(post, show_group_link, show_profile_link):
+    # updated меняется при правке поста, а также при переименовании его
+    # группы или автора (см. signals), поэтому ключ не нужно удалять.
+    return CARD_KEY.format(
+        post.pk, int(post.updated.timestamp() * 1_000_000),
+        show_group_link, show_profile_link
+    )
+
+
+def render_cards(posts, show_group_link=False, show_profile_link=False):
+    """HTML карточек постов; готовые берутся из кэша одним get_many.
+
+    Карточка, у которой готовы ещё не все варианты картинки, не
+    кэшируется: до этого в ней заглушка или неполный srcset.
+    """
+    posts = list(posts)
+    keys = [card_key(post, show_group_link, show_profile_link)
+            for post in posts]
+    found = cache.get_many(keys)
+    rendered = {}
+    cards = []
+    for post, key in zip(posts, keys):
+        html = found.get(key)
+        if html is None:
+            thumbnail, sources = (
+                card_images(post.image) if post.image else (None, [])
+            )
+            html = render_to_string(CARD_TEMPLATE, {
+                'post': post,
+                'thumbnail': thumbnail,
+                'sources': sources,
+                'show_group_link': show_group_link,
+                'show_profile_link': show_profile_link,
+            })
+            if sources is not None:
+                rendered[key] = html
+        cards.append(html)
+    if rendered:
+        cache.set_many(rendered, settings.FEED_CACHE_TIMEOUT)
+    return cards
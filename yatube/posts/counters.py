@@ -0,0 +1,98 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, User, UserStats
+
+
+def actual_user_counts(user_id):
+    """Счётчики пользователя, посчитанные по данным базы."""
+    return {
+        'post_count': Post.objects.filter(author_id=user_id).count(),
+        'follower_count': Follow.objects.filter(author_id=user_id).count(),
+        'following_count': Follow.objects.filter(user_id=user_id).count(),
+    }
+
+
+def change_user_counter(user_id, field, delta):
+    """Атомарно изменяет счётчик пользователя на delta.
+
+    Вызывается после записи. Если строки счётчиков нет (пользователь из
+    loaddata), она создаётся по данным базы, где запись уже учтена.
+    """
+    # Условие не даёт уйти в минус, если счётчик уже разошёлся с данными.
+    updated = UserStats.objects.filter(
+        user_id=user_id, **{f'{field}__gte': -delta}
+    ).update(**{field: F(field) + delta})
+    if updated or UserStats.objects.filter(user_id=user_id).exists():
+        return
+    UserStats.objects.get_or_create(
+        user_id=user_id, defaults=actual_user_counts(user_id)
+    )
+
+
+def get_user_stats(user):
+    """Счётчики пользователя.
+
+    У пользователей из loaddata строки нет: сигнал пропускает raw-записи.
+    Тогда она создаётся по данным базы.
+    """
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        user.stats, _ = UserStats.objects.get_or_create(
+            user=user, defaults=actual_user_counts(user.pk)
+        )
+        return user.stats
+
+
+def change_comment_counter(post_id, delta):
+    Post.objects.filter(
+        pk=post_id, comment_count__gte=-delta
+    ).update(comment_count=F('comment_count') + delta)
+
+
+def _count(model, field):
+    counts = model.objects.filter(
+        **{field: OuterRef('pk')}
+    ).order_by().values(field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts), 0)
+
+
+def reconcile_counters():
+    """Пересчитывает все счётчики и исправляет расхождения.
+
+    Возвращает количество исправленных постов и пользователей.
+    """
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=user_id) for user_id in User.objects.filter(
+            stats__isnull=True
+        ).values_list('pk', flat=True).iterator()),
+        ignore_conflicts=True,
+    )
+    drifted_posts = Post.objects.annotate(
+        actual=_count(Comment, 'post')
+    ).exclude(comment_count=F('actual')).values_list('pk', 'actual')
+    fixed_posts = 0
+    for post_id, actual in drifted_posts.iterator():
+        Post.objects.filter(pk=post_id).update(comment_count=actual)
+        fixed_posts += 1
+    drifted_users = UserStats.objects.annotate(
+        actual_posts=_count(Post, 'author'),
+        actual_followers=_count(Follow, 'author'),
+        actual_following=_count(Follow, 'user'),
+    ).exclude(
+        post_count=F('actual_posts'),
+        follower_count=F('actual_followers'),
+        following_count=F('actual_following'),
+    ).values_list(
+        'pk', 'actual_posts', 'actual_followers', 'actual_following'
+    )
+    fixed_users = 0
+    for user_id, posts, followers, following in drifted_users.iterator():
+        UserStats.objects.filter(pk=user_id).update(
+            post_count=posts,
+            follower_count=followers,
+            following_count=following,
+        )
+        fixed_users += 1
+    return fixed_posts, fixed_users
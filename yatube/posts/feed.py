@@ -0,0 +1,122 @@
+from django.conf import settings
+from django.db import connection
+
+from . import cache
+from .models import FeedEntry, Follow, Post
+
+BATCH_SIZE = 500
+
+
+def trim_feeds(user_ids):
+    """Оставляет в лентах пользователей не больше FOLLOW_FEED_MAX_ENTRIES.
+
+    Один DELETE на пачку пользователей: лишние записи находит оконная
+    функция, а не отдельный запрос границы для каждой ленты.
+    """
+    table = connection.ops.quote_name(FeedEntry._meta.db_table)
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        batch = user_ids[start:start + BATCH_SIZE]
+        placeholders = ', '.join(['%s'] * len(batch))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE id IN ('
+                f'SELECT id FROM (SELECT id, ROW_NUMBER() OVER ('
+                f'PARTITION BY user_id ORDER BY pub_date DESC, id DESC'
+                f') AS position FROM {table} '
+                f'WHERE user_id IN ({placeholders})) ranked '
+                f'WHERE position > %s)',
+                [*batch, settings.FOLLOW_FEED_MAX_ENTRIES]
+            )
+
+
+def fan_out_post(post_id):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    post = Post.objects.filter(pk=post_id).values(
+        'author_id', 'pub_date'
+    ).first()
+    if post is None:
+        return
+    follower_ids = list(Follow.objects.filter(
+        author_id=post['author_id']
+    ).values_list('user_id', flat=True))
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, post_id=post_id,
+                      pub_date=post['pub_date'])
+            for user_id in follower_ids
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim_feeds(follower_ids)
+    cache.bump_generations(cache.FOLLOWER, follower_ids)
+
+
+def invalidate_follower_feeds(author_id):
+    """Сбрасывает кэш лент всех подписчиков автора."""
+    cache.bump_generations(cache.FOLLOWER, Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True))
+
+
+def is_following(user_id, author_id):
+    return Follow.objects.filter(user_id=user_id, author_id=author_id).exists()
+
+
+def _delete_author_entries(user_id, author_id):
+    FeedEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def _add_author_entries(user_id, author_id):
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date'
+    ).values_list('pk', 'pub_date')[:settings.FOLLOW_FEED_MAX_ENTRIES]
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+            for post_id, pub_date in posts
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim_feeds([user_id])
+
+
+# Задачи подписки и отписки идут в пуле потоков в любом порядке, поэтому
+# после записи каждая сверяется с текущей строкой Follow: быстрые подписка
+# и отписка не оставят в ленте чужих постов, что бы ни выполнилось первым.
+
+def backfill_feed(user_id, author_id):
+    """Добавляет в ленту последние посты автора после подписки."""
+    _add_author_entries(user_id, author_id)
+    if not is_following(user_id, author_id):
+        _delete_author_entries(user_id, author_id)
+    cache.bump_generation(cache.FOLLOWER, user_id)
+
+
+def prune_feed(user_id, author_id):
+    """Удаляет из ленты посты автора после отписки."""
+    _delete_author_entries(user_id, author_id)
+    if is_following(user_id, author_id):
+        _add_author_entries(user_id, author_id)
+    cache.bump_generation(cache.FOLLOWER, user_id)
+
+
+def rebuild_feed(user_id):
+    """Заново собирает ленту пользователя по его текущим подпискам."""
+    FeedEntry.objects.filter(user_id=user_id).delete()
+    posts = Post.objects.filter(author__following__user_id=user_id).order_by(
+        '-pub_date'
+    ).values_list('pk', 'pub_date')[:settings.FOLLOW_FEED_MAX_ENTRIES]
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+            for post_id, pub_date in posts
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    cache.bump_generation(cache.FOLLOWER, user_id)
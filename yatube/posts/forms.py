@@ -1,6 +1,11 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
 
-from .models import Post, Comment
+from core.querycache import cached
+
+from .images import ingest_image
+from .models import Comment, Group, Post
 
 
 class PostForm(forms.ModelForm):
@@ -11,6 +16,24 @@ class PostForm(forms.ModelForm):
         help_texts = {'text': 'Текст нового поста',
                       'group': 'Группа, к которой будет относиться пост'}
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['group'].queryset = cached(Group.objects.all())
+
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            try:
+                return ingest_image(image)
+            except (OSError, Image.DecompressionBombError):
+                # Заголовок проверил ImageField, а битые или слишком
+                # большие данные видны только при декодировании.
+                raise forms.ValidationError(
+                    'Не удалось прочитать картинку: файл повреждён или '
+                    'слишком велик.'
+                )
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,82 @@
+"""Обработка загруженных картинок постов.
+
+Оригинал уменьшается до POST_IMAGE_MAX_SIZE по большей стороне,
+поворачивается по EXIF и пересохраняется без метаданных. Варианты для
+srcset создаются потом как миниатюры (см. POST_THUMBNAILS). Файлы
+хранятся по хэшу содержимого (см. storage) и удаляются вместе с
+последним постом, который на них ссылается.
+"""
+import io
+import logging
+import os
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps
+from sorl.thumbnail import delete
+
+from .models import Post
+from .thumbnails import source_file
+
+logger = logging.getLogger(__name__)
+
+# Форматы, которые сохраняются как есть; остальные переводятся в JPEG.
+KEPT_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+
+def save_options(image_format, image):
+    options = {}
+    if image_format in ('JPEG', 'WEBP'):
+        options['quality'] = settings.POST_IMAGE_QUALITY
+    if image_format == 'JPEG':
+        options.update(optimize=True, progressive=True)
+    if image_format == 'PNG':
+        options['optimize'] = True
+    # Цветовой профиль — не метаданные: без него поплывут цвета.
+    if image.info.get('icc_profile') and image_format != 'GIF':
+        options['icc_profile'] = image.info['icc_profile']
+    return options
+
+
+def ingest_image(upload):
+    """Уменьшенная и очищенная копия загруженной картинки.
+
+    Анимированные GIF возвращаются без изменений.
+    """
+    upload.seek(0)
+    image = Image.open(upload)
+    if getattr(image, 'is_animated', False):
+        upload.seek(0)
+        return upload
+    source_format = image.format
+    image = ImageOps.exif_transpose(image)
+    limit = settings.POST_IMAGE_MAX_SIZE
+    image.thumbnail((limit, limit), Image.LANCZOS)
+    image_format = source_format if source_format in KEPT_FORMATS else 'JPEG'
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **save_options(image_format, image))
+    name = os.path.splitext(os.path.basename(upload.name))[0]
+    return SimpleUploadedFile(
+        f'{name}.{KEPT_FORMATS[image_format]}',
+        buffer.getvalue(),
+        content_type=Image.MIME[image_format],
+    )
+
+
+def release_image(name):
+    """Удаляет файл и его миниатюры, если на него не ссылается ни один пост.
+
+    Запускается после фиксации транзакции. Загрузка той же картинки в
+    промежутке между проверкой и удалением останется без файла: окно
+    узкое, а пост можно пересохранить с картинкой заново.
+    """
+    if not name or Post.objects.filter(image=name).exists():
+        return
+    try:
+        delete(source_file(name))
+    except Exception:
+        # Уборка не должна мешать удалению поста: файл, до которого не
+        # добраться, остаётся на диске.
+        logger.exception('Не удалось удалить картинку %s', name)
@@ -0,0 +1,176 @@
+import json
+import math
+import time
+from contextlib import contextmanager
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.template.backends.django import Template
+from django.test import Client
+
+from posts.management.routes import (WRITE_ROUTES, route_paths,
+                                     sample_arguments, without_rate_limits)
+from posts.models import Group, Post, User
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, rank):
+    """Перцентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    index = max(math.ceil(rank / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+class Timings:
+    """Счётчики запросов к базе и времени рендеринга одного запроса."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.render = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+    @contextmanager
+    def render_timer(self):
+        render = Template.render
+        timings = self
+        depth = 0
+
+        def timed_render(template, *args, **kwargs):
+            # Вложенный рендеринг (карточки постов) уже входит во время
+            # внешнего шаблона.
+            nonlocal depth
+            if depth:
+                return render(template, *args, **kwargs)
+            depth += 1
+            started = time.perf_counter()
+            try:
+                return render(template, *args, **kwargs)
+            finally:
+                depth -= 1
+                timings.render += time.perf_counter() - started
+
+        with mock.patch.object(Template, 'render', timed_render):
+            yield
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет число запросов, время в базе, время рендеринга и '
+        'задержку p50/p95/p99 для всех маршрутов posts/urls.py.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20)
+        parser.add_argument(
+            '--anonymous', action='store_true',
+            help='Не входить на сайт: закрытые страницы дадут редирект.'
+        )
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кэш перед каждым запросом.'
+        )
+        parser.add_argument('--output', help='Куда записать отчёт в JSON.')
+        parser.add_argument(
+            '--compare', help='Отчёт прошлого прогона для сравнения.'
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests должен быть больше нуля.')
+        client = Client()
+        user, sample = sample_arguments()
+        if not options['anonymous']:
+            client.force_login(user)
+        routes = {}
+        with without_rate_limits():
+            for name, path in route_paths(sample):
+                routes[name] = self.measure(
+                    client, path, options['requests'], options['cold'],
+                    rollback=name in WRITE_ROUTES,
+                )
+        report = {
+            'requests': options['requests'],
+            'anonymous': options['anonymous'],
+            'cold': options['cold'],
+            'rows': {
+                'users': User.objects.count(),
+                'groups': Group.objects.count(),
+                'posts': Post.objects.count(),
+            },
+            'routes': routes,
+        }
+        self.print_report(report)
+        if options['compare']:
+            with open(options['compare']) as fp:
+                self.print_comparison(json.load(fp), report)
+        if options['output']:
+            with open(options['output'], 'w') as fp:
+                json.dump(report, fp, ensure_ascii=False, indent=2)
+
+    def measure(self, client, path, count, cold, rollback):
+        latencies = []
+        totals = Timings()
+        status = None
+        for _ in range(count):
+            if cold:
+                cache.clear()
+            timings = Timings()
+            with connection.execute_wrapper(timings), timings.render_timer():
+                started = time.perf_counter()
+                if rollback:
+                    with transaction.atomic():
+                        status = client.get(path).status_code
+                        transaction.set_rollback(True)
+                else:
+                    status = client.get(path).status_code
+                latencies.append(time.perf_counter() - started)
+            totals.queries += timings.queries
+            totals.db += timings.db
+            totals.render += timings.render
+        result = {
+            'path': path,
+            'status': status,
+            'queries': totals.queries / count,
+            'db_ms': totals.db * 1000 / count,
+            'render_ms': totals.render * 1000 / count,
+        }
+        for rank in PERCENTILES:
+            result[f'p{rank}_ms'] = percentile(latencies, rank) * 1000
+        return result
+
+    def print_report(self, report):
+        self.stdout.write(
+            f'{"маршрут":<18}{"код":>5}{"запросы":>9}{"БД, мс":>9}'
+            f'{"шаблон":>9}{"p50":>9}{"p95":>9}{"p99":>9}'
+        )
+        for name, row in report['routes'].items():
+            self.stdout.write(
+                f'{name:<18}{row["status"]:>5}{row["queries"]:>9.1f}'
+                f'{row["db_ms"]:>9.2f}{row["render_ms"]:>9.2f}'
+                f'{row["p50_ms"]:>9.2f}{row["p95_ms"]:>9.2f}'
+                f'{row["p99_ms"]:>9.2f}'
+            )
+
+    def print_comparison(self, old, new):
+        self.stdout.write('\nИзменения относительно прошлого прогона:')
+        for name, row in new['routes'].items():
+            before = old.get('routes', {}).get(name)
+            if before is None:
+                self.stdout.write(f'{name:<18} новый маршрут')
+                continue
+            self.stdout.write(
+                f'{name:<18}'
+                f'запросы {row["queries"] - before["queries"]:+.1f}, '
+                f'p95 {row["p95_ms"] - before["p95_ms"]:+.2f} мс'
+            )
@@ -0,0 +1,170 @@
+import logging
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from types import MethodType
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.sqlite3 import base as sqlite_base
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from posts.management.commands.benchmark_views import PERCENTILES, percentile
+from posts.management.routes import without_rate_limits
+from posts.models import Post, User
+
+# Сколько ждать, пока все процессы войдут и будут готовы писать.
+START_TIMEOUT = 60
+
+
+def copy_to_file(path):
+    """Снимок основной базы в отдельный файл: замер не трогает данные."""
+    connection = connections[DEFAULT_DB_ALIAS]
+    connection.ensure_connection()
+    target = sqlite3.connect(path)
+    try:
+        connection.connection.backup(target)
+        # Режим журнала хранится в файле; сменить его можно, только пока
+        # к базе не подключились процессы.
+        target.execute(
+            f'PRAGMA journal_mode = {settings.SQLITE_PRAGMAS["journal_mode"]}'
+        )
+    finally:
+        target.close()
+
+
+def write_worker(path, deferred, user_id, post_id, writes, barrier, results):
+    """Процесс-писатель: поочерёдно создаёт посты и комментарии."""
+    # Ошибки записи считаются в отчёте, трассировки только мешают.
+    logging.disable(logging.ERROR)
+    connection = connections[DEFAULT_DB_ALIAS]
+    # Соединение родителя после fork не используется: у процесса своё.
+    connection.connection = None
+    connection.settings_dict['NAME'] = path
+    if deferred:
+        connection._start_transaction_under_autocommit = MethodType(
+            sqlite_base.DatabaseWrapper._start_transaction_under_autocommit,
+            connection
+        )
+    client = Client()
+    client.force_login(User.objects.get(pk=user_id))
+    comment_url = reverse('posts:add_comment', args=(post_id,))
+    create_url = reverse('posts:post_create')
+    latencies = []
+    failed = 0
+    barrier.wait()
+    for number in range(writes):
+        url = comment_url if number % 2 else create_url
+        started = time.perf_counter()
+        try:
+            client.post(url, data={'text': f'Замер записи {number}'})
+        except Exception:
+            # Client пробрасывает исключение представления: запись
+            # не удалась, чем бы она ни кончилась.
+            failed += 1
+        latencies.append(time.perf_counter() - started)
+    connection.close()
+    results.put((latencies, failed))
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет пропускную способность записи в SQLite: N процессов '
+        'одновременно создают посты и комментарии через post_create и '
+        'add_comment. Пишет в копию основной базы во временном файле.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, nargs='+', default=[1, 2, 4, 8]
+        )
+        parser.add_argument(
+            '--writes', type=int, default=50, help='Записей на процесс.'
+        )
+        parser.add_argument(
+            '--no-retry', action='store_true',
+            help='Не повторять представления при «database is locked».'
+        )
+        parser.add_argument(
+            '--rollback-journal', action='store_true',
+            help='Журнал отката вместо WAL, как у sqlite3 по умолчанию.'
+        )
+        parser.add_argument(
+            '--deferred', action='store_true',
+            help='Обычный BEGIN стандартного бэкенда вместо BEGIN IMMEDIATE.'
+        )
+
+    def handle(self, *args, **options):
+        if connections[DEFAULT_DB_ALIAS].vendor != 'sqlite':
+            raise CommandError('Команда замеряет только SQLite.')
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            raise CommandError('Снимок базы нельзя снять внутри транзакции.')
+        if options['writes'] < 1:
+            raise CommandError('--writes должен быть больше нуля.')
+        user = User.objects.order_by('pk').first()
+        post = Post.objects.order_by('pk').first()
+        if user is None or post is None:
+            raise CommandError('Нужен хотя бы один пост: запустите seed_data.')
+        overrides = {'TASKS_ALWAYS_EAGER': True}
+        if options['no_retry']:
+            overrides['SQLITE_RETRY_ATTEMPTS'] = 1
+        if options['rollback_journal']:
+            overrides['SQLITE_PRAGMAS'] = {
+                **settings.SQLITE_PRAGMAS, 'journal_mode': 'DELETE'
+            }
+        self.stdout.write(
+            f'{"процессов":<11}{"записей/с":>11}{"успешно":>9}'
+            f'{"ошибок":>8}{"p50":>9}{"p95":>9}{"p99":>9}'
+        )
+        with override_settings(**overrides), without_rate_limits(), \
+                tempfile.TemporaryDirectory() as directory:
+            for processes in options['processes']:
+                path = os.path.join(directory, f'bench-{processes}.sqlite3')
+                copy_to_file(path)
+                self.report(processes, *self.run(
+                    path, options['deferred'], processes, options['writes'],
+                    user.pk, post.pk
+                ))
+
+    def run(self, path, deferred, processes, writes, user_id, post_id):
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(processes + 1)
+        results = context.Queue()
+        workers = [
+            context.Process(target=write_worker, args=(
+                path, deferred, user_id, post_id, writes, barrier, results
+            ))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            barrier.wait(START_TIMEOUT)
+        except threading.BrokenBarrierError:
+            for worker in workers:
+                worker.terminate()
+            raise CommandError('Процессы-писатели не смогли начать замер.')
+        started = time.perf_counter()
+        collected = [results.get() for _ in workers]
+        elapsed = time.perf_counter() - started
+        for worker in workers:
+            worker.join()
+        latencies = [value for values, _ in collected for value in values]
+        failed = sum(count for _, count in collected)
+        return elapsed, latencies, failed
+
+    def report(self, processes, elapsed, latencies, failed):
+        succeeded = len(latencies) - failed
+        line = (
+            f'{processes:<11}{succeeded / elapsed:>11.1f}{succeeded:>9}'
+            f'{failed:>8}'
+        )
+        for rank in PERCENTILES:
+            line += f'{percentile(latencies, rank) * 1000:>9.2f}'
+        self.stdout.write(line)
@@ -0,0 +1,106 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+
+from posts.management.routes import (WRITE_ROUTES, route_paths,
+                                     sample_arguments, without_rate_limits)
+
+TEMP_SORT = 'USE TEMP B-TREE'
+# Псевдонимы производных таблиц: просмотр результата подзапроса, в который
+# Django оборачивает COUNT, не полный просмотр таблицы.
+DERIVED_TABLES = ('subquery', 'CONSTANT ROW')
+
+
+def plan_problems(plan):
+    """Строки плана с полным просмотром таблицы или сортировкой в памяти."""
+    problems = []
+    for row in plan:
+        detail = row[-1]
+        full_scan = (
+            detail.startswith('SCAN ')
+            and 'INDEX' not in detail
+            and detail[len('SCAN '):] not in DERIVED_TABLES
+        )
+        if full_scan or TEMP_SORT in detail:
+            problems.append(detail)
+    return problems
+
+
+class QueryCollector:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет EXPLAIN QUERY PLAN для каждого запроса, который делают '
+        'маршруты posts/urls.py, и показывает полные просмотры таблиц и '
+        'сортировки во временном B-дереве. Запускать на базе, заполненной '
+        'командой seed_data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--anonymous', action='store_true',
+            help='Не входить на сайт: закрытые страницы дадут редирект.'
+        )
+        parser.add_argument(
+            '--strict', action='store_true',
+            help='Завершиться с ошибкой, если найдены проблемные планы.'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Команда разбирает планы только SQLite.')
+        client = Client()
+        user, sample = sample_arguments()
+        if not options['anonymous']:
+            client.force_login(user)
+        total = 0
+        with without_rate_limits():
+            for name, path in route_paths(sample):
+                queries = self.collect(client, path, name in WRITE_ROUTES)
+                total += self.report(name, path, queries)
+        message = f'Проблемных запросов: {total}'
+        if total and options['strict']:
+            raise CommandError(message)
+        style = self.style.WARNING if total else self.style.SUCCESS
+        self.stdout.write(style(message))
+
+    def collect(self, client, path, rollback):
+        # Без кэша страниц и фрагментов view делает все свои запросы.
+        cache.clear()
+        collector = QueryCollector()
+        with connection.execute_wrapper(collector):
+            if rollback:
+                with transaction.atomic():
+                    client.get(path)
+                    transaction.set_rollback(True)
+            else:
+                client.get(path)
+        return collector.queries
+
+    def report(self, name, path, queries):
+        found = 0
+        seen = set()
+        self.stdout.write(f'{name} {path}: запросов {len(queries)}')
+        for sql, params in queries:
+            if sql in seen:
+                continue
+            seen.add(sql)
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                problems = plan_problems(cursor.fetchall())
+            if not problems:
+                continue
+            found += 1
+            self.stdout.write(self.style.WARNING(f'  {sql}'))
+            for detail in problems:
+                self.stdout.write(f'    -> {detail}')
+        return found
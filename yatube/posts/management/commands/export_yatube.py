@@ -0,0 +1,39 @@
+
+from django.core.management.base import BaseCommand
+
+from posts.management.transfer import (MODELS, Encoder, Throughput,
+                                       open_stream)
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоково выгружает пользователей, группы, посты, комментарии и '
+        'подписки в NDJSON, не загружая таблицы в память.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output', help='Файл выгрузки; .gz сжимается, - — stdout.'
+        )
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        encoder = Encoder(ensure_ascii=False)
+        total = Throughput()
+        with open_stream(options['output'], 'w') as stream:
+            for name, model, fields in MODELS:
+                counter = Throughput()
+                rows = model.objects.order_by('pk').values_list(
+                    'pk', *fields
+                ).iterator(chunk_size=options['chunk_size'])
+                for pk, *values in rows:
+                    stream.write(encoder.encode({
+                        'model': name,
+                        'id': pk,
+                        'fields': dict(zip(fields, values)),
+                    }))
+                    stream.write('\n')
+                    counter.add(1)
+                total.add(counter.rows)
+                self.stderr.write(f'{name}: {counter}')
+        self.stderr.write(self.style.SUCCESS(f'Готово, {total}'))
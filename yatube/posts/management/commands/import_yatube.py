@@ -0,0 +1,233 @@
+import json
+import os
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+
+from posts.counters import reconcile_counters
+from posts.feed import rebuild_feed
+from posts.management.transfer import MODELS, Throughput, open_stream
+from posts.models import Comment, Follow, Group, Post, User
+
+# Поля с auto_now/auto_now_add: при загрузке даты берутся из файла.
+TIMESTAMP_FIELDS = (
+    (Post, 'pub_date'), (Post, 'updated'), (Comment, 'created'),
+)
+
+
+@contextmanager
+def preserve_timestamps():
+    fields = [model._meta.get_field(name) for model, name in TIMESTAMP_FIELDS]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает выгрузку export_yatube пачками bulk_create, по одной '
+        'транзакции на пачку. Пользователи и группы сопоставляются по '
+        'username и slug, id постов и комментариев сдвигаются за '
+        'максимальные id в базе. После каждой пачки в контрольную точку '
+        'дописывается номер строки и новые id, и прерванную загрузку можно '
+        'продолжить повторным запуском.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Файл выгрузки; - — stdin.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл контрольной точки; по умолчанию <input>.checkpoint.'
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Не продолжать с контрольной точки, а начать заново.'
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = options['checkpoint']
+        if checkpoint is None and options['input'] != '-':
+            checkpoint = options['input'] + '.checkpoint'
+        state = self.load_state(checkpoint, options['restart'])
+        if state['line']:
+            self.stderr.write(f'Продолжаю со строки {state["line"] + 1}')
+        throughput = Throughput()
+        batch = []
+        number = state['line']
+        with open_stream(options['input'], 'r') as stream, \
+                preserve_timestamps():
+            for number, line in enumerate(stream, 1):
+                if number <= state['line'] or not line.strip():
+                    continue
+                batch.append(json.loads(line))
+                if len(batch) >= options['chunk_size']:
+                    self.commit(batch, state, number, checkpoint, throughput)
+                    batch = []
+            if batch:
+                self.commit(batch, state, number, checkpoint, throughput)
+        self.finish()
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stderr.write(self.style.SUCCESS(f'Готово, {throughput}'))
+
+    def load_state(self, checkpoint, restart):
+        """Состояние загрузки из контрольной точки.
+
+        Контрольная точка — JSON по строке: сначала сдвиги id, затем по
+        записи на пачку с номером строки и сопоставлениями id, новыми в
+        этой пачке. Недописанная последняя строка пропускается: её пачка
+        загрузится ещё раз, и вставки это выдерживают.
+        """
+        if checkpoint and not restart and os.path.exists(checkpoint):
+            state = {'line': 0, 'user': {}, 'group': {}}
+            with open(checkpoint) as fp:
+                for line in fp:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    for name in ('user', 'group'):
+                        state[name].update(entry.pop(name, {}))
+                    state.update(entry)
+            return state
+        # Новые id идут после уже существующих; сдвиги хранятся в
+        # контрольной точке, чтобы продолжение дало те же id.
+        offsets = {
+            'post_offset': Post.objects.aggregate(top=Max('pk'))['top'] or 0,
+            'comment_offset': (
+                Comment.objects.aggregate(top=Max('pk'))['top'] or 0
+            ),
+        }
+        if checkpoint:
+            with open(checkpoint, 'w') as fp:
+                fp.write(json.dumps(offsets) + '\n')
+        return {'line': 0, 'user': {}, 'group': {}, **offsets}
+
+    def append_checkpoint(self, checkpoint, entry):
+        with open(checkpoint, 'a') as fp:
+            fp.write(json.dumps(entry) + '\n')
+
+    def commit(self, batch, state, number, checkpoint, throughput):
+        by_model = defaultdict(list)
+        for record in batch:
+            by_model[record['model']].append(record)
+        unknown = set(by_model) - {name for name, _, _ in MODELS}
+        if unknown:
+            raise CommandError(f'Неизвестные модели: {", ".join(unknown)}')
+        added = {}
+        with transaction.atomic():
+            for name, _, _ in MODELS:
+                if by_model[name]:
+                    ids = getattr(self, f'load_{name}')(by_model[name], state)
+                    if ids:
+                        state[name].update(ids)
+                        added[name] = ids
+        state['line'] = number
+        # Контрольная точка пишется после фиксации и может не успеть:
+        # тогда пачка загрузится повторно, поэтому все вставки ниже
+        # пропускают уже существующие строки.
+        if checkpoint:
+            self.append_checkpoint(checkpoint, {'line': number, **added})
+        throughput.add(len(batch))
+        self.stderr.write(f'строка {number}: {throughput}')
+
+    def remap(self, state, name, old_id):
+        try:
+            return state[name][str(old_id)]
+        except KeyError:
+            raise CommandError(f'В выгрузке нет записи {name} с id {old_id}')
+
+    def load_natural(self, records, model, key):
+        """Загружает строки с естественным ключом; возвращает их новые id."""
+        values = [record['fields'][key] for record in records]
+        existing = set(model.objects.filter(
+            **{f'{key}__in': values}
+        ).values_list(key, flat=True))
+        model.objects.bulk_create(
+            model(**record['fields']) for record in records
+            if record['fields'][key] not in existing
+        )
+        ids = dict(model.objects.filter(
+            **{f'{key}__in': values}
+        ).values_list(key, 'pk'))
+        return {
+            str(record['id']): ids[record['fields'][key]]
+            for record in records
+        }
+
+    def load_user(self, records, state):
+        return self.load_natural(records, User, 'username')
+
+    def load_group(self, records, state):
+        return self.load_natural(records, Group, 'slug')
+
+    def load_post(self, records, state):
+        posts = []
+        for record in records:
+            fields = record['fields']
+            group_id = fields['group_id']
+            posts.append(Post(**{
+                **fields,
+                'id': record['id'] + state['post_offset'],
+                'author_id': self.remap(state, 'user', fields['author_id']),
+                'group_id': group_id and self.remap(state, 'group', group_id),
+            }))
+        Post.objects.bulk_create(posts, ignore_conflicts=True)
+
+    def load_comment(self, records, state):
+        Comment.objects.bulk_create(
+            (
+                Comment(**{
+                    **record['fields'],
+                    'id': record['id'] + state['comment_offset'],
+                    'post_id': (
+                        record['fields']['post_id'] + state['post_offset']
+                    ),
+                    'author_id': self.remap(
+                        state, 'user', record['fields']['author_id']
+                    ),
+                })
+                for record in records
+            ),
+            ignore_conflicts=True,
+        )
+
+    def load_follow(self, records, state):
+        Follow.objects.bulk_create(
+            (
+                Follow(
+                    user_id=self.remap(state, 'user', record['fields'][
+                        'user_id'
+                    ]),
+                    author_id=self.remap(state, 'user', record['fields'][
+                        'author_id'
+                    ]),
+                )
+                for record in records
+            ),
+            ignore_conflicts=True,
+        )
+
+    def finish(self):
+        """То, что при обычной записи делают сигналы."""
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                no_style(), [User, Group, Post, Comment, Follow]
+            ):
+                cursor.execute(sql)
+        reconcile_counters()
+        followers = Follow.objects.values_list('user_id', flat=True)
+        for user_id in followers.distinct().order_by():
+            rebuild_feed(user_id)
+        cache.clear()
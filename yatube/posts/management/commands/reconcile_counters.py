@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики постов, комментариев и подписок.'
+
+    def handle(self, *args, **options):
+        fixed_posts, fixed_users = reconcile_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено постов: {fixed_posts}, '
+            f'пользователей: {fixed_users}'
+        ))
@@ -0,0 +1,214 @@
+import io
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from faker import Faker
+from PIL import Image
+
+from posts.counters import reconcile_counters
+from posts.feed import rebuild_feed
+from posts.images import ingest_image
+from posts.models import Comment, Follow, Group, Post, User
+from posts.thumbnails import generate_thumbnails
+
+IMAGE_SIZE = (1200, 800)
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, группами, постами, '
+        'комментариями, подписками и картинками для нагрузочных замеров.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--posts', type=int, default=1000)
+        parser.add_argument('--comments', type=int, default=5000)
+        parser.add_argument('--follows', type=int, default=500)
+        parser.add_argument(
+            '--images', type=int, default=0,
+            help='Сколько постов получат сгенерированную картинку.'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней до запуска распределены даты постов.'
+        )
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--locale', default='ru_RU')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.fake = Faker(options['locale'])
+        if options['seed'] is not None:
+            self.fake.seed_instance(options['seed'])
+        started = time.monotonic()
+        self.now = timezone.now()
+        self.period = timedelta(days=options['days'])
+        user_ids = self.create_users(options['users'])
+        group_ids = self.create_groups(options['groups'])
+        post_ids = self.create_posts(options['posts'], user_ids, group_ids)
+        self.create_comments(options['comments'], user_ids, post_ids)
+        follower_ids = self.create_follows(options['follows'], user_ids)
+        self.attach_images(options['images'], post_ids)
+        reconcile_counters()
+        for user_id in follower_ids:
+            rebuild_feed(user_id)
+        cache.clear()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.1f} с'
+        ))
+
+    def report(self, name, count):
+        self.stdout.write(f'{name}: {count}')
+
+    def create_users(self, count):
+        # Войти под такими пользователями нельзя: бенчмарк входит
+        # через force_login, а хэширование паролей заняло бы минуты.
+        password = make_password(None)
+        first_id = (User.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0) + 1
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f'{self.fake.user_name()}_{first_id + i}',
+                    first_name=self.fake.first_name(),
+                    last_name=self.fake.last_name(),
+                    email=self.fake.email(),
+                    password=password,
+                )
+                for i in range(count)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        self.report('Пользователей', count)
+        return list(User.objects.values_list('pk', flat=True))
+
+    def create_groups(self, count):
+        first_id = (Group.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0) + 1
+        Group.objects.bulk_create(
+            (
+                Group(
+                    title=self.fake.catch_phrase()[:200],
+                    slug=f'group-{first_id + i}',
+                    description=self.fake.paragraph(),
+                )
+                for i in range(count)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        self.report('Групп', count)
+        return list(Group.objects.values_list('pk', flat=True))
+
+    def spread_dates(self, model, field, dates):
+        """Проставляет даты {id: дата} полю с auto_now_add.
+
+        bulk_create записывает в такое поле текущее время, и все записи
+        получили бы почти одинаковые даты: ключи курсора и окна подсчёта
+        работали бы на одних совпадениях.
+        """
+        model.objects.bulk_update(
+            [model(pk=pk, **{field: date}) for pk, date in dates.items()],
+            [field], batch_size=BATCH_SIZE,
+        )
+
+    def create_posts(self, count, user_ids, group_ids):
+        choices = group_ids + [None]
+        last_id = Post.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+        Post.objects.bulk_create(
+            (
+                Post(
+                    author_id=self.random.choice(user_ids),
+                    group_id=self.random.choice(choices),
+                    text=self.fake.text(self.random.randint(50, 1000)),
+                )
+                for _ in range(count)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        # Даты за последние --days дней, по возрастанию вместе с id, как
+        # у постов, опубликованных по очереди.
+        new_ids = list(Post.objects.filter(pk__gt=last_id).order_by(
+            'pk').values_list('pk', flat=True))
+        dates = sorted(
+            self.now - self.random.random() * self.period for _ in new_ids
+        )
+        self.spread_dates(Post, 'pub_date', dict(zip(new_ids, dates)))
+        self.report('Постов', count)
+        return list(Post.objects.values_list('pk', flat=True))
+
+    def create_comments(self, count, user_ids, post_ids):
+        if not post_ids:
+            return
+        last_id = Comment.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+        Comment.objects.bulk_create(
+            (
+                Comment(
+                    post_id=self.random.choice(post_ids),
+                    author_id=self.random.choice(user_ids),
+                    text=self.fake.sentence(),
+                )
+                for _ in range(count)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        # Комментарий появляется между публикацией поста и запуском.
+        pub_dates = dict(Post.objects.values_list('pk', 'pub_date'))
+        self.spread_dates(Comment, 'created', {
+            pk: pub_dates[post_id] + self.random.random() * (
+                self.now - pub_dates[post_id]
+            )
+            for pk, post_id in Comment.objects.filter(
+                pk__gt=last_id
+            ).values_list('pk', 'post_id')
+        })
+        self.report('Комментариев', count)
+
+    def create_follows(self, count, user_ids):
+        pairs = set(Follow.objects.values_list('user_id', 'author_id'))
+        new_pairs = set()
+        attempts = count * 3
+        while len(new_pairs) < count and attempts and len(user_ids) > 1:
+            attempts -= 1
+            pair = tuple(self.random.sample(user_ids, 2))
+            if pair not in pairs:
+                new_pairs.add(pair)
+        Follow.objects.bulk_create(
+            (Follow(user_id=user_id, author_id=author_id)
+             for user_id, author_id in sorted(new_pairs)),
+            batch_size=BATCH_SIZE,
+        )
+        self.report('Подписок', len(new_pairs))
+        return {user_id for user_id, _ in new_pairs}
+
+    def attach_images(self, count, post_ids):
+        """Картинки проходят тот же путь, что и загруженные в форме.
+
+        ingest_image пересжимает их, хранилище кладёт под хэшем
+        содержимого, а миниатюры создаются сразу, как это сделала бы
+        фоновая задача.
+        """
+        field = Post._meta.get_field('image')
+        for post_id in self.random.sample(post_ids, min(count, len(post_ids))):
+            buffer = io.BytesIO()
+            color = tuple(self.random.randrange(256) for _ in range(3))
+            Image.new('RGB', IMAGE_SIZE, color).save(buffer, 'JPEG')
+            upload = ingest_image(
+                SimpleUploadedFile(f'seed_{post_id}.jpg', buffer.getvalue())
+            )
+            name = field.storage.save(
+                field.generate_filename(None, upload.name), upload
+            )
+            Post.objects.filter(pk=post_id).update(image=name)
+            generate_thumbnails(name)
+        self.report('Картинок', count)
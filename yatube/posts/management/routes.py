@@ -0,0 +1,77 @@
+"""Маршруты posts/urls.py с аргументами из текущей базы.
+
+Общий код команд benchmark_views, explain_views и benchmark_writes.
+"""
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db.models import Count
+from django.test.utils import override_settings
+from django.urls import URLPattern, reverse
+from django.utils.http import urlencode
+
+from posts import urls
+from posts.models import Group, Post, User
+
+# Маршруты, которые меняют данные даже на GET: запросы к ним нужно
+# выполнять в транзакции и откатывать.
+WRITE_ROUTES = ('profile_follow', 'profile_unfollow')
+# Параметры строки запроса для маршрутов, которым без них нечего делать.
+QUERY_PARAMS = {'search': ('q',)}
+# Ёмкость корзин ограничителя частоты на время замеров.
+UNLIMITED_CAPACITY = 10 ** 9
+
+
+def sample_arguments():
+    """Подбирает аргументы маршрутов: самые «тяжёлые» объекты базы.
+
+    Возвращает пользователя, от имени которого делать запросы, и словарь
+    значений для параметров URL.
+    """
+    user = User.objects.order_by('-stats__following_count').first()
+    if user is None:
+        raise CommandError('База пуста: сначала запустите seed_data.')
+    post = (
+        Post.objects.filter(author=user).order_by('-comment_count').first()
+        or Post.objects.order_by('-comment_count').first()
+    )
+    group = Group.objects.annotate(
+        posts_count=Count('posts')
+    ).order_by('-posts_count').first()
+    if post is None or group is None:
+        raise CommandError('Нужны хотя бы один пост и одна группа.')
+    author = User.objects.exclude(pk=user.pk).order_by(
+        '-stats__follower_count'
+    ).first() or user
+    return user, {
+        'post_id': post.pk,
+        'slug': group.slug,
+        'username': author.username,
+        'q': post.text.split()[0],
+    }
+
+
+def route_paths(sample):
+    """Пары (имя маршрута, путь) для всех маршрутов posts/urls.py."""
+    for pattern in urls.urlpatterns:
+        if not isinstance(pattern, URLPattern):
+            continue
+        kwargs = {name: sample[name] for name in pattern.pattern.converters}
+        path = reverse(f'{urls.app_name}:{pattern.name}', kwargs=kwargs)
+        params = {
+            name: sample[name] for name in QUERY_PARAMS.get(pattern.name, ())
+        }
+        if params:
+            path = f'{path}?{urlencode(params)}'
+        yield pattern.name, path
+
+
+def without_rate_limits():
+    """Настройки, при которых серия запросов замера не получает 429.
+
+    Ограничитель по-прежнему берёт жетоны и входит в замер, но корзина
+    не кончается: иначе измерялся бы ответ 429, а не представление.
+    """
+    return override_settings(RATE_LIMITS={
+        policy: {**limits, 'capacity': UNLIMITED_CAPACITY}
+        for policy, limits in settings.RATE_LIMITS.items()
+    })
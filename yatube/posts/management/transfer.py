@@ -0,0 +1,71 @@
+"""Формат выгрузки export_yatube / import_yatube.
+
+Файл NDJSON: одна запись в строке, {"model": ..., "id": ..., "fields": {}}.
+Записи идут в порядке MODELS, чтобы при загрузке ссылки указывали на уже
+загруженные строки. Файлы с расширением .gz сжимаются.
+"""
+import datetime
+import gzip
+import sys
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# Модель -> поля выгрузки. Ссылки выгружаются старыми id.
+MODELS = (
+    ('user', User, (
+        'username', 'first_name', 'last_name', 'email', 'password',
+        'is_active', 'date_joined',
+    )),
+    ('group', Group, ('title', 'slug', 'description')),
+    ('post', Post, (
+        'text', 'pub_date', 'updated', 'author_id', 'group_id', 'image',
+    )),
+    ('comment', Comment, ('post_id', 'author_id', 'text', 'created')),
+    ('follow', Follow, ('user_id', 'author_id')),
+)
+
+
+class Encoder(DjangoJSONEncoder):
+    """Даты с микросекундами: DjangoJSONEncoder округляет их до мс."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+@contextmanager
+def open_stream(path, mode):
+    """Файл по пути, .gz со сжатием, '-' — стандартный ввод или вывод."""
+    if path == '-':
+        yield sys.stdin if mode == 'r' else sys.stdout
+        return
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, mode + 't', encoding='utf-8') as stream:
+        yield stream
+
+
+class Throughput:
+    """Счётчик строк и скорости в строках в секунду."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.rows = 0
+
+    def add(self, rows):
+        self.rows += rows
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.rows / elapsed if elapsed else 0.0
+
+    def __str__(self):
+        return f'строк: {self.rows}, {self.rate:.0f} строк/с'
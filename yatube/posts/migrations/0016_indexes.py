@@ -0,0 +1,73 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:56
+
+from django.db import migrations, models
+import django.db.models.expressions
+from django.db.models import Count, F, Min
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    """Удаляет повторные подписки и подписки на себя перед ограничениями."""
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    duplicates = Follow.objects.order_by().values('user', 'author').annotate(
+        first_id=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+    affected = set()
+    for row in duplicates.iterator():
+        Follow.objects.filter(
+            user_id=row['user'], author_id=row['author']
+        ).exclude(id=row['first_id']).delete()
+        affected.update((row['user'], row['author']))
+    self_follows = Follow.objects.filter(user=F('author'))
+    affected.update(self_follows.values_list('user_id', flat=True))
+    self_follows.delete()
+    for user_id in affected:
+        UserStats.objects.filter(user_id=user_id).update(
+            follower_count=Follow.objects.filter(author_id=user_id).count(),
+            following_count=Follow.objects.filter(user_id=user_id).count(),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_post_fts'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='feedentry',
+            name='posts_feed_user_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created'], name='posts_comment_post_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', 'pub_date'], name='posts_feed_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['pub_date'], name='posts_post_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', 'pub_date'], name='posts_post_author_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', 'pub_date'], name='posts_post_group_date_idx'),
+        ),
+        migrations.RunPython(
+            remove_duplicate_follows, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='posts_follow_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.CheckConstraint(check=models.Q(_negated=True, user=django.db.models.expressions.F('author')), name='posts_follow_not_self'),
+        ),
+    ]
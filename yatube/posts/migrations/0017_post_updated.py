@@ -0,0 +1,35 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:57
+
+from importlib import import_module
+
+from django.db import migrations, models
+from django.db.models import F
+
+fts = import_module('posts.migrations.0015_post_fts')
+
+# SQLite пересоздаёт posts_post при добавлении столбца, и триггеры
+# полнотекстового индекса пропадают вместе со старой таблицей.
+restore_fts = fts.run_on_sqlite(fts.FTS_SQL[1:])
+
+
+def fill_updated(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Post.objects.update(updated=F('pub_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_fts),
+        migrations.AddField(
+            model_name='post',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения'),
+        ),
+        migrations.RunPython(fill_updated, migrations.RunPython.noop),
+        migrations.RunPython(restore_fts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.16 on 2026-10-18 06:05
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+import posts.storage
+
+fts = import_module('posts.migrations.0015_post_fts')
+
+# Смена хранилища не меняет схему, но SQLite всё равно пересоздаёт
+# posts_post, и триггеры полнотекстового индекса пропадают.
+restore_fts = fts.run_on_sqlite(fts.FTS_SQL[1:])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_post_updated'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_fts),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+        migrations.RunPython(restore_fts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['image'], name='posts_post_image_idx'),
+        ),
+    ]
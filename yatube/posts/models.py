@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .storage import post_image_storage
+
 User = get_user_model()
 
 
@@ -22,6 +24,10 @@ class Post(models.Model):
         'Дата публикации',
         auto_now_add=True
     )
+    updated = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -40,17 +46,62 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=post_image_storage,
         blank=True
     )
+    comment_count = models.PositiveIntegerField(
+        'Количество комментариев',
+        default=0,
+        editable=False
+    )
+
+    # Счётчики меняются только F-выражениями, обычное сохранение их не
+    # перезаписывает.
+    counter_fields = ('comment_count',)
 
     class Meta:
         ordering = ('-pub_date',)
+        # Индексы по возрастанию: SQLite читает их с конца и получает
+        # порядок (pub_date DESC, id DESC) без сортировки, потому что
+        # id хранится в индексе по возрастанию.
+        indexes = (
+            models.Index(fields=('pub_date',), name='posts_post_date_idx'),
+            models.Index(
+                fields=('author', 'pub_date'),
+                name='posts_post_author_date_idx'
+            ),
+            models.Index(
+                fields=('group', 'pub_date'),
+                name='posts_post_group_date_idx'
+            ),
+            # Число постов с той же картинкой: файл удаляется с последним.
+            models.Index(fields=('image',), name='posts_post_image_idx'),
+        )
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Группа на момент загрузки: при смене группы сбрасывается кэш
+        # обеих лент.
+        instance.loaded_group_id = instance.__dict__.get('group_id')
+        # Картинка на момент загрузки: заменённый файл освобождается.
+        instance.loaded_image = instance.__dict__.get('image')
+        return instance
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -74,6 +125,12 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ('-created',)
+        indexes = (
+            models.Index(
+                fields=('post', 'created'),
+                name='posts_comment_post_date_idx'
+            ),
+        )
 
 
 class Follow(models.Model):
@@ -89,3 +146,62 @@ class Follow(models.Model):
         verbose_name='Дата комментария',
         on_delete=models.CASCADE,
     )
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'author'), name='posts_follow_unique'
+            ),
+            models.CheckConstraint(
+                check=~models.Q(user=models.F('author')),
+                name='posts_follow_not_self'
+            ),
+        )
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        related_name='feed',
+        verbose_name='Читатель',
+        on_delete=models.CASCADE,
+    )
+    post = models.ForeignKey(
+        Post,
+        related_name='feed_entries',
+        verbose_name='Пост',
+        on_delete=models.CASCADE,
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ('-pub_date',)
+        unique_together = ('user', 'post')
+        indexes = (
+            models.Index(
+                fields=('user', 'pub_date'),
+                name='posts_feed_user_date_idx'
+            ),
+        )
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Лента подписок'
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+    )
+    post_count = models.PositiveIntegerField('Постов', default=0)
+    follower_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self):
+        return str(self.user)
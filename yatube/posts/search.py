@@ -0,0 +1,156 @@
+import re
+
+from django.db import connection, connections
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+TOKEN_RE = re.compile(r'\w+')
+MARK_START = '\x02'
+MARK_END = '\x03'
+SNIPPET_TOKENS = 16
+# Триггеры, которые держат индекс в согласии с posts_post (см. миграцию
+# 0015_post_fts).
+FTS_TRIGGERS = {
+    'posts_post_fts_insert': """
+        CREATE TRIGGER IF NOT EXISTS posts_post_fts_insert
+        AFTER INSERT ON posts_post BEGIN
+            INSERT INTO posts_post_fts(rowid, text)
+            VALUES (new.id, new.text);
+        END
+    """,
+    'posts_post_fts_delete': """
+        CREATE TRIGGER IF NOT EXISTS posts_post_fts_delete
+        AFTER DELETE ON posts_post BEGIN
+            INSERT INTO posts_post_fts(posts_post_fts, rowid, text)
+            VALUES ('delete', old.id, old.text);
+        END
+    """,
+    'posts_post_fts_update': """
+        CREATE TRIGGER IF NOT EXISTS posts_post_fts_update
+        AFTER UPDATE OF text ON posts_post BEGIN
+            INSERT INTO posts_post_fts(posts_post_fts, rowid, text)
+            VALUES ('delete', old.id, old.text);
+            INSERT INTO posts_post_fts(rowid, text)
+            VALUES (new.id, new.text);
+        END
+    """,
+}
+
+
+def fts_available():
+    return connection.vendor == 'sqlite'
+
+
+def ensure_fts_triggers(using):
+    """Восстанавливает триггеры индекса после миграций.
+
+    SQLite пересоздаёт posts_post почти при любом изменении схемы, и
+    триггеры пропадают вместе со старой таблицей. Если их не было,
+    индекс перестраивается: посты могли измениться без них.
+    """
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master "
+            "WHERE type IN ('table', 'trigger') "
+            "AND name LIKE 'posts_post_fts%'"
+        )
+        existing = {name for name, in cursor.fetchall()}
+        if FTS_TABLE not in existing or existing.issuperset(FTS_TRIGGERS):
+            return
+        for sql in FTS_TRIGGERS.values():
+            cursor.execute(sql)
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+        )
+
+
+def build_match(tokens):
+    """Строит выражение MATCH из слов запроса.
+
+    Каждое слово берётся в кавычки и ищется по префиксу, поэтому
+    синтаксис FTS5 из пользовательского ввода не исполняется.
+    """
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def matching_ids_sql():
+    """Подзапрос id постов, подходящих под MATCH; параметр — выражение."""
+    return f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+
+
+def highlight(snippet):
+    return mark_safe(
+        escape(snippet).replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
+
+
+class SearchResults:
+    """Ранжированные результаты поиска для Paginator.
+
+    Paginator вызывает count() и срезы; в базу уходят только запросы
+    к индексу FTS5 и выборка постов текущей страницы по первичному ключу.
+    """
+
+    def __init__(self, query):
+        self.tokens = TOKEN_RE.findall(query)
+        self.match = build_match(self.tokens)
+
+    def count(self):
+        if not self.match:
+            return 0
+        if not fts_available():
+            return self._fallback().count()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT count(*) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s',
+                [self.match]
+            )
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def _fallback(self):
+        posts = Post.objects.select_related('author', 'group')
+        for token in self.tokens:
+            posts = posts.filter(text__icontains=token)
+        return posts
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        if not self.match:
+            return []
+        if not fts_available():
+            posts = list(self._fallback()[index])
+            for post in posts:
+                post.snippet = escape(post.text[:200])
+            return posts
+        offset = index.start or 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, snippet({FTS_TABLE}, 0, %s, %s, %s, %s) '
+                f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY rank LIMIT %s OFFSET %s',
+                [MARK_START, MARK_END, '…', SNIPPET_TOKENS, self.match,
+                 index.stop - offset, offset]
+            )
+            rows = cursor.fetchall()
+        posts = Post.objects.select_related('author', 'group').in_bulk(
+            [post_id for post_id, _ in rows]
+        )
+        results = []
+        for post_id, snippet in rows:
+            post = posts.get(post_id)
+            if post is not None:
+                post.snippet = highlight(snippet)
+                results.append(post)
+        return results
@@ -0,0 +1,153 @@
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.tasks import enqueue
+
+from . import cache, counters, feed, snapshots
+from .images import release_image
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+def invalidate_post_feeds(post):
+    snapshots.forget_posts([post.pk])
+    cache.bump_generation(cache.GLOBAL)
+    cache.bump_generation(cache.AUTHOR, post.author_id)
+    cache.bump_generation(cache.POST, post.pk)
+    group_ids = {post.group_id, getattr(post, 'loaded_group_id', None)}
+    group_ids.discard(None)
+    cache.bump_generations(cache.GROUP, group_ids)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    invalidate_post_feeds(instance)
+    if created:
+        counters.change_user_counter(instance.author_id, 'post_count', 1)
+        enqueue(feed.fan_out_post, instance.pk)
+    else:
+        enqueue(feed.invalidate_follower_feeds, instance.author_id)
+        loaded_image = getattr(instance, 'loaded_image', None)
+        if loaded_image and loaded_image != instance.image.name:
+            enqueue(release_image, loaded_image)
+    instance.loaded_group_id = instance.group_id
+    instance.loaded_image = instance.image.name
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.change_user_counter(instance.author_id, 'post_count', -1)
+    invalidate_post_feeds(instance)
+    enqueue(feed.invalidate_follower_feeds, instance.author_id)
+    if instance.image:
+        enqueue(release_image, instance.image.name)
+
+
+def touch_posts(posts):
+    """Сдвигает updated, чтобы карточки постов отрисовались заново."""
+    snapshots.forget_posts(list(posts.values_list('pk', flat=True)))
+    posts.update(updated=timezone.now())
+
+
+def invalidate_group(group):
+    # Авторы выбираются сразу: при удалении группы задачи выполнятся,
+    # когда у постов уже не будет группы.
+    author_ids = list(group.posts.values_list(
+        'author_id', flat=True
+    ).distinct())
+    touch_posts(group.posts.all())
+    cache.bump_generation(cache.GLOBAL)
+    cache.bump_generation(cache.GROUP, group.pk)
+    cache.bump_generations(cache.AUTHOR, author_ids)
+    for author_id in author_ids:
+        enqueue(feed.invalidate_follower_feeds, author_id)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_group(instance)
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    invalidate_group(instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.change_comment_counter(instance.post_id, 1)
+        snapshots.forget_posts([instance.post_id])
+    cache.bump_generation(cache.POST, instance.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.change_comment_counter(instance.post_id, -1)
+    snapshots.forget_posts([instance.post_id])
+    cache.bump_generation(cache.POST, instance.post_id)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_on_follow(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user_counter(instance.author_id, 'follower_count', 1)
+        counters.change_user_counter(instance.user_id, 'following_count', 1)
+        cache.bump_generations(
+            cache.AUTHOR, (instance.author_id, instance.user_id)
+        )
+        enqueue(feed.backfill_feed, instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_on_unfollow(sender, instance, **kwargs):
+    counters.change_user_counter(instance.author_id, 'follower_count', -1)
+    counters.change_user_counter(instance.user_id, 'following_count', -1)
+    cache.bump_generations(
+        cache.AUTHOR, (instance.author_id, instance.user_id)
+    )
+    enqueue(feed.prune_feed, instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+# Поля пользователя, которые выводятся на страницах.
+USER_NAME_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def user_names(user):
+    # Отложенные поля не загружены и не сохраняются: для них None.
+    return tuple(user.__dict__.get(name) for name in USER_NAME_FIELDS)
+
+
+@receiver(post_init, sender=User)
+def remember_user_names(sender, instance, **kwargs):
+    instance.loaded_names = user_names(instance)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Вход в систему сохраняет только last_login, смена пароля и правка
+    # в админке — поля, которых нет на страницах.
+    if update_fields and not set(update_fields) & set(USER_NAME_FIELDS):
+        return
+    loaded_names = instance.loaded_names
+    instance.loaded_names = user_names(instance)
+    if created or instance.loaded_names == loaded_names:
+        return
+    touch_posts(instance.posts.all())
+    cache.bump_generation(cache.GLOBAL)
+    cache.bump_generation(cache.AUTHOR, instance.pk)
+    cache.bump_generations(cache.GROUP, instance.posts.exclude(
+        group=None
+    ).values_list('group_id', flat=True).distinct())
+    cache.bump_generations(cache.POST, Comment.objects.filter(
+        author=instance
+    ).values_list('post_id', flat=True).distinct())
+    enqueue(feed.invalidate_follower_feeds, instance.pk)
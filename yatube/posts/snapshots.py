@@ -0,0 +1,72 @@
+"""Снимки постов в кэше: пост вместе с автором и группой по его id.
+
+Ленты выбирают из базы только id и ключи курсора, а сами посты берут
+отсюда одним get_many; из базы одним запросом догружаются лишь промахи.
+Снимок удаляется при правке или удалении поста, переименовании его
+автора или группы и изменении счётчика комментариев (см. signals).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core import routers
+from core.metrics import registry
+
+from . import cache as page_cache
+from .models import Post
+
+SNAPSHOT_KEY = 'posts:snapshot:{}'
+
+
+def snapshot_key(post_id):
+    return SNAPSHOT_KEY.format(post_id)
+
+
+def snapshot_queryset():
+    # Хешу пароля автора нечего делать в общем кэше.
+    return Post.objects.select_related('author', 'group').defer(
+        'author__password'
+    )
+
+
+def _count(result, amount):
+    if amount:
+        registry.increment(
+            'yatube_object_cache_requests_total', amount, model='post',
+            result=result
+        )
+
+
+def load_posts(post_ids):
+    """Посты в порядке post_ids; удалённые за это время пропускаются."""
+    keys = {post_id: snapshot_key(post_id) for post_id in post_ids}
+    found = cache.get_many(keys.values())
+    posts = {post_id: found[key] for post_id, key in keys.items()
+             if key in found}
+    missing = [post_id for post_id in keys if post_id not in posts]
+    _count('hit', len(posts))
+    _count('miss', len(missing))
+    if missing:
+        loaded = snapshot_queryset().in_bulk(missing)
+        posts.update(loaded)
+        timeout = settings.POST_SNAPSHOT_TIMEOUT
+        # Реплика может ещё не знать о последней правке: такой снимок
+        # живёт не дольше окна отставания реплик.
+        if (routers.reading_from_replica() and routers.may_be_stale(
+                page_cache.get_last_modified((page_cache.GLOBAL,)))):
+            timeout = settings.REPLICA_STICKY_SECONDS
+        cache.set_many(
+            {keys[post_id]: post for post_id, post in loaded.items()},
+            timeout
+        )
+    return [posts[post_id] for post_id in post_ids if post_id in posts]
+
+
+def forget_posts(post_ids):
+    keys = [snapshot_key(post_id) for post_id in post_ids]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    # Другой процесс мог прочитать старую строку до фиксации транзакции
+    # и вернуть её в кэш: удаляем ещё раз после фиксации.
+    transaction.on_commit(lambda: cache.delete_many(keys))
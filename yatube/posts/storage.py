@@ -0,0 +1,63 @@
+"""Хранилище картинок постов с адресацией по содержимому.
+
+Файл называется по SHA-256 своего содержимого: posts/ab/ab12…ef.jpg.
+Одинаковые картинки хранятся один раз, и, так как имена миниатюр sorl
+выводятся из имени исходника, миниатюры у них тоже общие. Ссылками
+на файл считаются строки Post с этим именем; файл удаляет
+images.release_image, когда ссылок не осталось.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def content_name(self, name, content):
+        """Имя по хэшу содержимого в каталоге name, расширение сохраняется."""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        hexdigest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(
+            posixpath.dirname(name), hexdigest[:2], hexdigest + extension
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        # Такое содержимое уже есть: второй копии не нужно.
+        if self.exists(name):
+            return name
+        return self._save(name, content)
+
+    def _save(self, name, content):
+        # Файл пишется рядом и переименовывается одним шагом: читатель не
+        # увидит недописанный файл, а одновременная загрузка той же
+        # картинки лишь заменит его таким же содержимым.
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    temp_file.write(chunk)
+            os.chmod(temp_path, self.file_permissions_mode or 0o644)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return name
+
+
+post_image_storage = ContentAddressedStorage()
@@ -0,0 +1,15 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from ..cards import render_cards
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_cards(posts, show_group_link=False, show_profile_link=False):
+    return [
+        mark_safe(card) for card in render_cards(
+            posts, show_group_link, show_profile_link
+        )
+    ]
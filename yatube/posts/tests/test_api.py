@@ -0,0 +1,111 @@
+from http import HTTPStatus
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User
+from ..utils import COUNT_POST
+
+
+@override_settings(TASKS_ALWAYS_EAGER=True)
+class ApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='api-author')
+        cls.reader = User.objects.create_user(username='api-reader')
+        cls.group = Group.objects.create(title='Группа', slug='api')
+        Post.objects.bulk_create(
+            Post(author=cls.author, text=f'Пост {i}')
+            for i in range(COUNT_POST + 2)
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост в группе'
+        )
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий'
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_index_cursor_pagination(self):
+        """Лента отдаётся страницами по курсору."""
+        data = self.client.get(reverse('api:index')).json()
+        self.assertEqual(len(data['results']), COUNT_POST)
+        self.assertEqual(data['results'][0]['id'], self.post.pk)
+        self.assertIsNone(data['previous'])
+        second = self.client.get(data['next']).json()
+        self.assertEqual(len(second['results']), 3)
+        self.assertIsNone(second['next'])
+        self.assertIsNotNone(second['previous'])
+
+    def test_sparse_fields(self):
+        """fields= ограничивает поля ответа, неизвестные дают 400."""
+        url = reverse('api:group_posts', args=(self.group.slug,))
+        data = self.client.get(url, {'fields': 'id,author'}).json()
+        self.assertEqual(
+            data['results'], [{'id': self.post.pk, 'author': 'api-author'}]
+        )
+        response = self.client.get(url, {'fields': 'id,password'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_values_without_instances(self):
+        """Выборка не тянет лишних столбцов."""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('api:index'), {'fields': 'id'})
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('"text"', sql)
+
+    def test_post_detail_and_comments(self):
+        """Пост отдаётся с числом комментариев, комментарии — лентой."""
+        data = self.client.get(
+            reverse('api:post_detail', args=(self.post.pk,))
+        ).json()
+        self.assertEqual(data['comment_count'], 1)
+        self.assertEqual(data['group'], 'api')
+        self.assertIsNone(data['image'])
+        comments = self.client.get(
+            reverse('api:post_comments', args=(self.post.pk,))
+        ).json()
+        self.assertEqual(comments['results'][0]['text'], 'Комментарий')
+        response = self.client.get(reverse('api:post_detail', args=(0,)))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_post_deleted_during_request(self):
+        """Пост, удалённый после проверки областей кэша, даёт 404."""
+        with mock.patch(
+            'posts.cache.post_page_scopes', return_value=[('post', 0)]
+        ):
+            response = self.client.get(
+                reverse('api:post_detail', args=(0,))
+            )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        self.assertEqual(response.json(), {'detail': 'Не найдено.'})
+
+    def test_etag_conditional_request(self):
+        """Повторный запрос с ETag получает 304 до изменения данных."""
+        url = reverse('api:profile', args=(self.author.username,))
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        Post.objects.create(author=self.author, text='Новый пост')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_follow_feed_is_personal(self):
+        """Лента подписок требует входа и у каждого своя."""
+        url = reverse('api:follow_index')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+        Follow.objects.create(user=self.reader, author=self.author)
+        reader = Client()
+        reader.force_login(self.reader)
+        self.assertEqual(len(reader.get(url).json()['results']), COUNT_POST)
+        author = Client()
+        author.force_login(self.author)
+        self.assertEqual(author.get(url).json()['results'], [])
@@ -0,0 +1,214 @@
+import json
+import os
+import tempfile
+from datetime import timedelta
+from http import HTTPStatus
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from ..management.commands.explain_views import plan_problems
+from ..management.commands.import_yatube import Command as ImportCommand
+from ..models import Comment, FeedEntry, Follow, Group, Post, User
+from ..thumbnails import thumbnail_or_none
+
+
+class SeedAndBenchmarkTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        call_command(
+            'seed_data', users=5, groups=2, posts=30, comments=20,
+            follows=6, seed=1, stdout=StringIO()
+        )
+
+    def test_seed_data_creates_requested_volumes(self):
+        """seed_data создаёт записи и заполняет счётчики и ленты."""
+        self.assertEqual(User.objects.count(), 5)
+        self.assertEqual(Group.objects.count(), 2)
+        self.assertEqual(Post.objects.count(), 30)
+        self.assertEqual(Comment.objects.count(), 20)
+        follow = Follow.objects.first()
+        self.assertEqual(
+            FeedEntry.objects.filter(user=follow.user).count(),
+            Post.objects.filter(
+                author__following__user=follow.user
+            ).count()
+        )
+        post = Post.objects.order_by('-comment_count').first()
+        self.assertEqual(post.comment_count, post.comment.count())
+
+    def test_seed_dates_are_spread(self):
+        """Даты постов и комментариев разнесены по периоду --days."""
+        dates = list(Post.objects.order_by('pk').values_list(
+            'pub_date', flat=True))
+        self.assertEqual(len(set(dates)), len(dates))
+        self.assertEqual(dates, sorted(dates))
+        self.assertGreater(dates[-1] - dates[0], timedelta(days=30))
+        self.assertLess(timezone.now() - dates[0], timedelta(days=366))
+        for comment in Comment.objects.select_related('post'):
+            self.assertGreaterEqual(comment.created, comment.post.pub_date)
+
+    def test_seed_images_use_upload_path(self):
+        """Картинки сида хранятся как загруженные и сразу с миниатюрами."""
+        with tempfile.TemporaryDirectory() as media, \
+                override_settings(MEDIA_ROOT=media):
+            call_command(
+                'seed_data', users=2, groups=1, posts=3, comments=0,
+                follows=0, images=2, seed=3, stdout=StringIO()
+            )
+            posts = Post.objects.exclude(image='')
+            self.assertEqual(len(posts), 2)
+            for post in posts:
+                self.assertRegex(
+                    post.image.name, r'^posts/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$'
+                )
+                self.assertIsNotNone(thumbnail_or_none(post.image, 'card'))
+
+    def test_benchmark_reports_every_route(self):
+        """benchmark_views пишет в JSON замеры по каждому маршруту."""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'report.json')
+            call_command(
+                'benchmark_views', requests=2, output=output,
+                stdout=StringIO()
+            )
+            with open(output) as fp:
+                report = json.load(fp)
+        self.assertIn('index', report['routes'])
+        self.assertIn('post_detail', report['routes'])
+        index = report['routes']['index']
+        self.assertEqual(index['status'], 200)
+        for key in ('queries', 'db_ms', 'render_ms', 'p50_ms', 'p99_ms'):
+            self.assertIn(key, index)
+
+    def test_benchmark_not_rate_limited(self):
+        """Серия запросов замера не упирается в ограничитель частоты."""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'report.json')
+            call_command(
+                'benchmark_views', requests=20, output=output,
+                stdout=StringIO()
+            )
+            with open(output) as fp:
+                report = json.load(fp)
+        for name, route in report['routes'].items():
+            with self.subTest(route=name):
+                self.assertNotEqual(
+                    route['status'], HTTPStatus.TOO_MANY_REQUESTS
+                )
+
+    def test_explain_views_uses_indexes_for_feeds(self):
+        """Ленты читаются по индексам без сортировки во временном дереве."""
+        out = StringIO()
+        call_command('explain_views', stdout=out)
+        output = out.getvalue()
+        self.assertIn('follow_index', output)
+        self.assertNotIn('USE TEMP B-TREE', output)
+        self.assertNotIn('SCAN posts_post\n', output)
+
+    def test_plan_problems(self):
+        """Полный просмотр и временная сортировка попадают в отчёт."""
+        plan = [
+            (2, 0, 0, 'SCAN posts_post'),
+            (3, 0, 0, 'SEARCH posts_group USING INTEGER PRIMARY KEY'),
+            (4, 0, 0, 'SCAN posts_comment USING INDEX some_idx'),
+            (5, 0, 0, 'SCAN subquery'),
+            (6, 0, 0, 'USE TEMP B-TREE FOR ORDER BY'),
+        ]
+        self.assertEqual(
+            plan_problems(plan),
+            ['SCAN posts_post', 'USE TEMP B-TREE FOR ORDER BY']
+        )
+
+
+# Снимок базы для процессов снимается вне транзакции теста.
+class BenchmarkWritesTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='writer')
+        Post.objects.create(author=self.user, text='Пост для комментариев')
+
+    def test_benchmark_writes_from_several_processes(self):
+        """benchmark_writes пишет из нескольких процессов без ошибок."""
+        out = StringIO()
+        call_command(
+            'benchmark_writes', processes=[1, 2], writes=4, stdout=out
+        )
+        rows = [line.split() for line in out.getvalue().splitlines()[1:]]
+        self.assertEqual([row[0] for row in rows], ['1', '2'])
+        # Успешных записей столько, сколько заказано, ошибок нет.
+        self.assertEqual([row[2:4] for row in rows], [
+            ['4', '0'], ['8', '0']
+        ])
+        # Замер идёт на копии базы.
+        self.assertEqual(Post.objects.count(), 1)
+
+
+class ExportImportTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        call_command(
+            'seed_data', users=4, groups=2, posts=12, comments=10,
+            follows=3, seed=2, stdout=StringIO()
+        )
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.dump = os.path.join(self.tmp.name, 'dump.ndjson.gz')
+        call_command('export_yatube', self.dump, stderr=StringIO())
+
+    def import_dump(self, **options):
+        call_command(
+            'import_yatube', self.dump, chunk_size=5, stderr=StringIO(),
+            **options
+        )
+
+    def test_import_remaps_users_and_keeps_dates(self):
+        """Пользователи и группы сопоставляются, посты копируются с датами."""
+        dates = sorted(Post.objects.values_list('pub_date', flat=True))
+        self.import_dump()
+        self.assertEqual(User.objects.count(), 4)
+        self.assertEqual(Group.objects.count(), 2)
+        self.assertEqual(Post.objects.count(), 24)
+        self.assertEqual(Comment.objects.count(), 20)
+        self.assertEqual(Follow.objects.count(), 3)
+        self.assertEqual(
+            sorted(Post.objects.values_list('pub_date', flat=True)),
+            sorted(dates * 2)
+        )
+        post = Post.objects.order_by('-comment_count').first()
+        self.assertEqual(post.comment_count, post.comment.count())
+        self.assertFalse(os.path.exists(self.dump + '.checkpoint'))
+
+    def test_import_resumes_from_checkpoint(self):
+        """Прерванная загрузка продолжается с контрольной точки."""
+        with mock.patch.object(
+            ImportCommand, 'load_comment', side_effect=RuntimeError
+        ), self.assertRaises(RuntimeError):
+            self.import_dump()
+        state = ImportCommand().load_state(self.dump + '.checkpoint', False)
+        self.assertEqual(state['line'], 15)
+        self.assertEqual(Post.objects.count(), 12 + 9)
+        self.import_dump()
+        self.assertEqual(Post.objects.count(), 24)
+        self.assertEqual(Comment.objects.count(), 20)
+
+    def test_import_survives_lost_checkpoint(self):
+        """Пачка, зафиксированная без контрольной точки, не дублируется."""
+        append = ImportCommand.append_checkpoint
+
+        def crash_after_commit(command, checkpoint, entry):
+            if entry['line'] > 20:
+                raise RuntimeError
+            append(command, checkpoint, entry)
+
+        with mock.patch.object(
+            ImportCommand, 'append_checkpoint', crash_after_commit
+        ), self.assertRaises(RuntimeError):
+            self.import_dump()
+        self.assertEqual(Comment.objects.count(), 10 + 7)
+        self.import_dump()
+        self.assertEqual(Post.objects.count(), 24)
+        self.assertEqual(Comment.objects.count(), 20)
@@ -1,15 +1,25 @@
+import io
+import os
 import shutil
 import tempfile
 from http import HTTPStatus
+from unittest import mock
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
+from .. import thumbnails
+from ..cards import render_cards
 from ..models import Comment, Group, Post, User
+from ..thumbnails import generate_thumbnails, thumbnail_or_none
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+# Картинки хранятся под хэшем содержимого: posts/ab/ab12…ef.gif.
+HASHED_GIF = r'^posts/[0-9a-f]{2}/[0-9a-f]{64}\.gif$'
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -44,6 +54,8 @@ class PostFormTests(TestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
+        # Отметки об очереди миниатюр общие у одинаковых картинок.
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -75,7 +87,7 @@ class PostFormTests(TestCase):
                 text=form_data['text'],
                 author=self.user,
                 group=self.group,
-                image='posts/small.gif'
+                image__regex=HASHED_GIF
             ).exists()
         )
 
@@ -106,10 +118,204 @@ class PostFormTests(TestCase):
                 text=form_data['text'],
                 author=self.user,
                 group=self.group,
-                image='posts/smal.gif'
+                image__regex=HASHED_GIF
             ).exists()
         )
 
+    @override_settings(TASKS_ALWAYS_EAGER=True)
+    def test_create_post_generates_thumbnails(self):
+        """Миниатюры создаются при сохранении поста с картинкой."""
+        uploaded = SimpleUploadedFile(
+            name='thumb.gif',
+            content=self.small_gif,
+            content_type='image/gif'
+        )
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'С картинкой', 'image': uploaded}
+        )
+        post = Post.objects.get(text='С картинкой')
+        self.assertIsNotNone(thumbnail_or_none(post.image, 'card'))
+
+    def test_missing_thumbnail_renders_placeholder(self):
+        """Пока миниатюры нет, вместо неё выводится заглушка."""
+        uploaded = SimpleUploadedFile(
+            name='pending.gif',
+            content=self.small_gif,
+            content_type='image/gif'
+        )
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Ждёт миниатюру', 'image': uploaded}
+        )
+        post = Post.objects.get(text='Ждёт миниатюру')
+        response = self.authorized_client.get(
+            reverse('posts:profile', args=(self.user.username,))
+        )
+        self.assertContains(response, 'aspect-ratio: 960 / 339')
+        self.assertIsNone(thumbnail_or_none(post.image, 'card'))
+
+    @override_settings(TASKS_ALWAYS_EAGER=True)
+    def test_card_looks_up_each_thumbnail_once(self):
+        """Карточка ищет каждый вариант миниатюры в хранилище один раз."""
+        uploaded = SimpleUploadedFile(
+            name='once.gif',
+            content=self.small_gif,
+            content_type='image/gif'
+        )
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Один поиск', 'image': uploaded}
+        )
+        cache.clear()
+        lookup = thumbnails.backend.get_cached_thumbnail
+        with mock.patch.object(thumbnails.backend, 'get_cached_thumbnail',
+                               wraps=lookup) as get_cached:
+            [card] = render_cards(Post.objects.filter(text='Один поиск'))
+        self.assertIn('<picture>', card)
+        self.assertEqual(
+            get_cached.call_count, len(thumbnails.supported_presets())
+        )
+
+    def test_generated_thumbnails_replace_cached_placeholder(self):
+        """Готовые миниатюры сбрасывают страницы, закэшированные с
+        заглушкой."""
+        uploaded = SimpleUploadedFile(
+            name='late.gif',
+            content=self.small_gif,
+            content_type='image/gif'
+        )
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Миниатюра позже', 'image': uploaded}
+        )
+        post = Post.objects.get(text='Миниатюра позже')
+        url = reverse('posts:profile', args=(self.user.username,))
+        self.assertContains(
+            self.guest_client.get(url), 'aspect-ratio: 960 / 339'
+        )
+        generate_thumbnails(post.image.name)
+        self.assertNotContains(
+            self.guest_client.get(url), 'aspect-ratio: 960 / 339'
+        )
+
+    def upload(self, name, image_format, size, **save_options):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'red').save(
+            buffer, image_format, **save_options
+        )
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def test_upload_is_downscaled_and_stripped(self):
+        """Большой оригинал уменьшается и теряет EXIF."""
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        uploaded = self.upload(
+            'camera.jpg', 'JPEG', (4000, 1000), exif=exif.tobytes()
+        )
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Снимок', 'image': uploaded}
+        )
+        post = Post.objects.get(text='Снимок')
+        with Image.open(post.image) as image:
+            self.assertEqual(image.size, (settings.POST_IMAGE_MAX_SIZE, 512))
+            self.assertNotIn('exif', image.info)
+
+    def test_upload_in_rare_format_is_converted(self):
+        """Картинка в формате, который не отдают браузерам, станет JPEG."""
+        uploaded = self.upload('scan.bmp', 'BMP', (20, 10))
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Скан', 'image': uploaded}
+        )
+        post = Post.objects.get(text='Скан')
+        self.assertRegex(
+            post.image.name, r'^posts/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$'
+        )
+
+    def test_truncated_upload_is_rejected(self):
+        """Обрезанная картинка даёт ошибку формы, а не 500."""
+        content = self.upload('cut.jpg', 'JPEG', (400, 300)).read()
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Обрезано',
+                'image': SimpleUploadedFile(
+                    'cut.jpg', content[:len(content) // 2]
+                ),
+            }
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertFormError(
+            response, 'form', 'image',
+            'Не удалось прочитать картинку: файл повреждён или слишком '
+            'велик.'
+        )
+        self.assertFalse(Post.objects.filter(text='Обрезано').exists())
+
+    def create_with_image(self, text, name):
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': text, 'image': self.upload(name, 'PNG', (30, 20))}
+        )
+        return Post.objects.get(text=text)
+
+    def test_same_image_is_stored_once(self):
+        """Повторная загрузка той же картинки ссылается на тот же файл."""
+        first = self.create_with_image('Первый мем', 'meme.png')
+        second = self.create_with_image('Второй мем', 'meme-copy.png')
+        self.assertEqual(first.image.name, second.image.name)
+        directory = os.path.dirname(first.image.path)
+        self.assertEqual(os.listdir(directory), [
+            os.path.basename(first.image.name)
+        ])
+
+    @override_settings(TASKS_ALWAYS_EAGER=True)
+    def test_image_is_deleted_with_last_post(self):
+        """Файл и миниатюры удаляются вместе с последним постом."""
+        first = self.create_with_image('Мем', 'meme.png')
+        second = self.create_with_image('Мем ещё раз', 'meme.png')
+        thumbnail = thumbnail_or_none(first.image, 'card')
+        self.assertIsNotNone(thumbnail)
+        first.delete()
+        self.assertTrue(os.path.exists(second.image.path))
+        self.assertTrue(thumbnail.exists())
+        second.delete()
+        self.assertFalse(os.path.exists(second.image.path))
+        self.assertFalse(thumbnail.exists())
+
+    @override_settings(TASKS_ALWAYS_EAGER=True)
+    def test_replaced_image_is_released(self):
+        """Картинка, заменённая при редактировании, удаляется."""
+        post = self.create_with_image('Заменить', 'old.png')
+        old_path = post.image.path
+        self.authorized_client.post(
+            reverse('posts:post_edit', args=(post.pk,)),
+            data={
+                'text': 'Заменить',
+                'image': self.upload('new.png', 'PNG', (40, 20)),
+            }
+        )
+        post.refresh_from_db()
+        self.assertNotEqual(post.image.path, old_path)
+        self.assertFalse(os.path.exists(old_path))
+
+    @override_settings(TASKS_ALWAYS_EAGER=True)
+    def test_card_has_srcset(self):
+        """Карточка предлагает браузеру варианты картинки разной ширины."""
+        uploaded = self.upload('wide.png', 'PNG', (1600, 600))
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Широкая', 'image': uploaded}
+        )
+        response = self.guest_client.get(
+            reverse('posts:profile', args=(self.user.username,))
+        )
+        self.assertContains(response, 'type="image/jpeg"')
+        self.assertContains(response, ' 480w, ')
+        self.assertContains(response, ' 1440w"')
+
     def test_comment_authorized_client(self):
         comment_count = Comment.objects.count()
         form_data = {
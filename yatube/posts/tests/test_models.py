@@ -1,6 +1,11 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
 from django.test import TestCase
+from django.urls import reverse
 
-from ..models import Group, Post, User
+from ..models import Comment, Follow, Group, Post, User, UserStats
 
 
 class PostModelTest(TestCase):
@@ -29,3 +34,98 @@ class PostModelTest(TestCase):
         group = PostModelTest.group
         expected_object_name = group.title
         self.assertEqual(expected_object_name, str(group))
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_post_and_comment_counters(self):
+        """Счётчики постов и комментариев меняются при записи."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        self.assertEqual(self.stats(self.author).post_count, 1)
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий'
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+        post.delete()
+        self.assertEqual(self.stats(self.author).post_count, 0)
+
+    def test_follow_constraints(self):
+        """Повторная подписка и подписка на себя отклоняются базой."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Follow.objects.create(user=self.reader, author=self.author)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Follow.objects.create(user=self.reader, author=self.reader)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+
+    def test_post_save_keeps_comment_counter(self):
+        """Сохранение поста не затирает счётчик комментариев."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        post.text = 'Новый текст'
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+
+    def test_follow_counters(self):
+        """Подписка и отписка меняют счётчики обоих пользователей."""
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.stats(self.author).follower_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        follow.delete()
+        self.assertEqual(self.stats(self.author).follower_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_reconcile_counters_command(self):
+        """Команда reconcile_counters исправляет расхождения."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        Post.objects.filter(pk=post.pk).update(comment_count=7)
+        UserStats.objects.filter(user=self.author).update(post_count=0)
+        UserStats.objects.filter(user=self.reader).delete()
+        call_command('reconcile_counters', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.stats(self.author).post_count, 1)
+        self.assertEqual(self.stats(self.reader).post_count, 0)
+
+    def test_write_for_user_without_stats_row(self):
+        """Строка счётчиков, созданная при записи, учитывает все данные."""
+        Post.objects.create(author=self.author, text='Из фикстуры')
+        Follow.objects.create(user=self.reader, author=self.author)
+        UserStats.objects.filter(user=self.author).delete()
+        Post.objects.create(author=self.author, text='Новый')
+        stats = self.stats(self.author)
+        self.assertEqual(stats.post_count, 2)
+        self.assertEqual(stats.follower_count, 1)
+        UserStats.objects.filter(user=self.reader).delete()
+        Follow.objects.filter(user=self.reader).delete()
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+        self.assertEqual(self.stats(self.author).follower_count, 0)
+
+    def test_pages_of_user_without_stats_row(self):
+        """Пользователь из loaddata без строки счётчиков не даёт 500."""
+        post = Post.objects.create(author=self.author, text='Из фикстуры')
+        Follow.objects.create(user=self.reader, author=self.author)
+        UserStats.objects.filter(user=self.author).delete()
+        response = self.client.get(
+            reverse('posts:post_detail', args=(post.pk,))
+        )
+        self.assertEqual(response.context['count'], 1)
+        response = self.client.get(
+            reverse('posts:profile', args=(self.author.username,))
+        )
+        self.assertContains(response, 'Подписчиков: 1')
+        self.assertEqual(self.stats(self.author).post_count, 1)
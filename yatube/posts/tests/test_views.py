@@ -1,12 +1,25 @@
 from http import HTTPStatus
+from io import StringIO
 
 from django import forms
 from django.core.cache import cache
-from django.test import Client, TestCase
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from ..models import Comment, Follow, Group, Post, User
-from ..utils import COUNT_POST
+from core.testing import QueryBudgetMixin
+
+from .. import cache as page_cache
+from .. import feed
+from ..cards import render_cards
+from ..management.routes import WRITE_ROUTES, route_paths, sample_arguments
+from ..models import Comment, FeedEntry, Follow, Group, Post, User
+from ..snapshots import load_posts, snapshot_key
+from ..utils import (COUNT_COMMENTS, COUNT_POST, decode_cursor,
+                     encode_cursor)
 
 POST_PAGE_2 = 3
 POST_ALL = COUNT_POST + POST_PAGE_2
@@ -202,6 +215,9 @@ class PaginatorViewsTest(TestCase):
         ]
         Post.objects.bulk_create(post_list)
 
+    def setUp(self):
+        cache.clear()
+
     def test_first_page_contains_ten_records(self):
         templates_pages = {
             reverse('posts:index'): COUNT_POST,
@@ -232,6 +248,134 @@ class PaginatorViewsTest(TestCase):
                 response = self.client.get(reverse_name, {'page': 2})
                 self.assertEqual(len(response.context['page_obj']), value)
 
+    def test_cursor_pages_cover_all_posts(self):
+        """Курсоры after/before обходят ленту без пропусков и повторов."""
+        response = self.client.get(reverse('posts:profile',
+                                           args=(self.user.username,)))
+        first_page = list(response.context['page_obj'])
+        next_cursor = response.context['page_obj'].next_cursor
+        response = self.client.get(
+            reverse('posts:profile', args=(self.user.username,)),
+            {'after': next_cursor}
+        )
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.number, 2)
+        self.assertEqual(len(page_obj), POST_PAGE_2)
+        self.assertFalse(page_obj.next_cursor)
+        self.assertEqual(
+            set(first_page) | set(page_obj),
+            set(Post.objects.filter(author=self.user))
+        )
+        response = self.client.get(
+            reverse('posts:profile', args=(self.user.username,)),
+            {'before': page_obj.previous_cursor}
+        )
+        self.assertEqual(list(response.context['page_obj']), first_page)
+
+    def count_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, params)
+        return len([q for q in queries if 'COUNT(' in q['sql'].upper()])
+
+    def test_paginator_count_is_cached(self):
+        """Число записей берётся из кэша, пока не истёк срок."""
+        cache.clear()
+        url = reverse('posts:group_posts', args=(self.group.slug,))
+        self.assertEqual(self.count_queries(url), 1)
+        Post.objects.create(text='Новый', author=self.user, group=self.group)
+        self.assertEqual(self.count_queries(url), 0)
+
+    def test_page_window_has_constant_size(self):
+        """Окно номеров страниц не зависит от их общего числа."""
+        Post.objects.bulk_create(
+            Post(text=f'Ещё {i}', author=self.user) for i in range(100)
+        )
+        cache.clear()
+        response = self.client.get(reverse('posts:index'), {'page': 6})
+        page_obj = response.context['page_obj']
+        self.assertEqual(list(page_obj.page_window), [4, 5, 6, 7, 8])
+        self.assertContains(response, 'class="page-item', count=9)
+
+    def test_last_page(self):
+        """Ссылка на последнюю страницу показывает самые старые посты."""
+        response = self.client.get(reverse('posts:index'), {'page': 'last'})
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.number, 2)
+        self.assertFalse(page_obj.next_cursor)
+        self.assertEqual(
+            page_obj[-1], Post.objects.order_by('pub_date', 'pk').first()
+        )
+
+    def test_last_page_matches_numbered_page(self):
+        """?page=last и номер последней страницы показывают одни посты."""
+        url = reverse('posts:index')
+        last = self.client.get(url, {'page': 'last'}).context['page_obj']
+        numbered = self.client.get(url, {'page': 2}).context['page_obj']
+        self.assertEqual(len(last), POST_PAGE_2)
+        self.assertEqual(list(last), list(numbered))
+        self.assertTrue(last.previous_cursor)
+
+    def test_page_past_end_returns_last_page(self):
+        response = self.client.get(reverse('posts:index'), {'page': 99})
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.number, 2)
+        self.assertEqual(len(page_obj), POST_PAGE_2)
+
+    def test_broken_cursor_returns_first_page(self):
+        """Некорректный курсор открывает первую страницу."""
+        response = self.client.get(reverse('posts:index'),
+                                   {'after': 'broken'})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.context['page_obj'].number, 1)
+
+    def test_huge_page_numbers_and_cursors(self):
+        """Номера и курсоры вне диапазона базы не дают 500."""
+        post = Post.objects.first()
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.user.username,)),
+            reverse('posts:post_detail', args=(post.pk,)),
+            reverse('posts:post_comments', args=(post.pk,)),
+            reverse('api:index'),
+        )
+        params = (
+            {'page': '9223372036854775807'},
+            {'page': '99999999999999999999999'},
+            {'page': '922337203685477580'},
+            {'after': encode_cursor(post.pub_date, 2 ** 64, 2)},
+            {'before': encode_cursor(post.pub_date, 1, 2 ** 70)},
+            {'after': encode_cursor(
+                post.pub_date.replace(tzinfo=None), 1, 2
+            )},
+        )
+        for url in urls:
+            for query in params:
+                with self.subTest(url=url, query=query):
+                    response = self.client.get(url, query)
+                    self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_huge_page_number_returns_last_page(self):
+        response = self.client.get(
+            reverse('posts:index'), {'page': '9223372036854775807'}
+        )
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.number, 2)
+        self.assertEqual(len(page_obj), POST_PAGE_2)
+
+    def test_out_of_range_cursor_is_rejected(self):
+        post = Post.objects.first()
+        self.assertIsNone(decode_cursor(
+            encode_cursor(post.pub_date, 2 ** 63, 2)
+        ))
+        self.assertIsNone(decode_cursor(
+            encode_cursor(post.pub_date.replace(tzinfo=None), 1, 2)
+        ))
+        self.assertEqual(
+            decode_cursor(encode_cursor(post.pub_date, 1, 2)),
+            (post.pub_date, 1, 2)
+        )
+
 
 class PostCacheTest(TestCase):
     @classmethod
@@ -249,14 +393,72 @@ class PostCacheTest(TestCase):
         )
         response = self.guest_client.get(reverse('posts:index'))
         self.assertEqual(len(response.context['page_obj']), 1)
-        post.delete()
+        Post.objects.filter(pk=post.pk).update(text='Изменено в обход ORM')
         response2 = self.guest_client.get(reverse('posts:index'))
         self.assertEqual(response.content, response2.content)
         cache.clear()
         response3 = self.guest_client.get(reverse('posts:index'))
         self.assertNotEqual(response.content, response3.content)
 
+    def test_index_cache_invalidated_on_delete(self):
+        """Удалённый пост сразу пропадает из закэшированной ленты."""
+        post = Post.objects.create(
+            text='Тестовый пост',
+            author=PostCacheTest.author,
+        )
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, post.text)
+        post.delete()
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertNotContains(response, post.text)
+
+    def test_cache_hit_skips_feed_query(self):
+        """Закэшированная лента не выполняет запрос постов."""
+        Post.objects.create(text='Тестовый пост', author=self.author)
+        self.guest_client.get(reverse('posts:index'))
+        with CaptureQueriesContext(connection) as queries:
+            self.guest_client.get(reverse('posts:index'))
+        self.assertFalse(
+            [q for q in queries if 'posts_post' in q['sql']]
+        )
 
+    def test_group_cache_invalidated_on_group_change(self):
+        """Смена группы поста сбрасывает кэш обеих групп."""
+        old_group = Group.objects.create(title='Старая', slug='old')
+        new_group = Group.objects.create(title='Новая', slug='new')
+        post = Post.objects.create(
+            text='Пост в группе', author=self.author, group=old_group
+        )
+        self.guest_client.get(reverse('posts:group_posts', args=('old',)))
+        post = Post.objects.get(pk=post.pk)
+        post.group = new_group
+        post.save()
+        response = self.guest_client.get(
+            reverse('posts:group_posts', args=('old',))
+        )
+        self.assertNotContains(response, post.text)
+        response = self.guest_client.get(
+            reverse('posts:group_posts', args=('new',))
+        )
+        self.assertContains(response, post.text)
+
+    @override_settings(TASKS_ALWAYS_EAGER=True)
+    def test_follow_cache_is_personal(self):
+        """Лента подписок не делит кэш с главной и другими читателями."""
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=self.author)
+        post = Post.objects.create(text='Пост автора', author=self.author)
+        client = Client()
+        client.force_login(reader)
+        self.assertContains(client.get(reverse('posts:follow_index')),
+                            post.text)
+        stranger = Client()
+        stranger.force_login(User.objects.create_user(username='stranger'))
+        response = stranger.get(reverse('posts:follow_index'))
+        self.assertNotContains(response, post.text)
+
+
+@override_settings(TASKS_ALWAYS_EAGER=True)
 class FollowTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -319,3 +521,464 @@ class FollowTest(TestCase):
         self.assertTrue(len(response.context['page_obj']))
         response = self.nofollow_client.get(reverse('posts:follow_index'))
         self.assertFalse(len(response.context['page_obj']))
+
+    def test_unfollow_removes_posts_from_feed(self):
+        """После отписки посты автора пропадают из ленты подписок."""
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow', args=(self.author,))
+        )
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertFalse(len(response.context['page_obj']))
+        self.assertFalse(FeedEntry.objects.filter(user=self.user).exists())
+
+    def test_follow_backfills_feed(self):
+        """Подписка добавляет в ленту уже опубликованные посты автора."""
+        self.nofollow_client.get(
+            reverse('posts:profile_follow', args=(self.author,))
+        )
+        response = self.nofollow_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [self.post])
+
+    @override_settings(FOLLOW_FEED_MAX_ENTRIES=3)
+    def test_feed_is_trimmed_to_limit(self):
+        """Лента подписок хранит не больше FOLLOW_FEED_MAX_ENTRIES записей."""
+        for i in range(5):
+            Post.objects.create(author=self.author, text=f'Пост {i}')
+        self.assertEqual(FeedEntry.objects.filter(user=self.user).count(), 3)
+        newest = Post.objects.filter(author=self.author)[:3]
+        self.assertEqual(
+            list(Post.objects.filter(feed_entries__user=self.user)),
+            list(newest)
+        )
+
+    @override_settings(FOLLOW_FEED_MAX_ENTRIES=1)
+    def test_fan_out_trims_all_feeds_at_once(self):
+        """Новый пост обрезает ленты всех подписчиков одним DELETE."""
+        Follow.objects.create(user=self.nofollow, author=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            post = Post.objects.create(author=self.author, text='Свежий')
+        deletes = [q for q in queries if q['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 1)
+        for user in (self.user, self.nofollow):
+            self.assertEqual(
+                list(Post.objects.filter(feed_entries__user=user)), [post]
+            )
+
+    def test_group_change_resets_follow_feed(self):
+        """Переименование и удаление группы меняют ленту подписок."""
+        group = Group.objects.create(title='Группа', slug='old-slug')
+        Post.objects.create(author=self.author, group=group, text='В группе')
+        pages = (reverse('posts:follow_index'), reverse('api:follow_index'))
+        for url in pages:
+            self.assertContains(self.authorized_client.get(url), 'old-slug')
+        group.slug = 'new-slug'
+        group.save()
+        for url in pages:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertNotContains(response, 'old-slug')
+                self.assertContains(response, 'new-slug')
+        group.delete()
+        for url in pages:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertNotContains(response, 'new-slug')
+
+    def test_follow_tasks_in_any_order(self):
+        """Задачи подписки и отписки сверяются с текущей подпиской."""
+        # Отписка, а задача подписки выполнилась после задачи отписки.
+        self.follower.delete()
+        feed.backfill_feed(self.user.pk, self.author.pk)
+        self.assertFalse(FeedEntry.objects.filter(user=self.user).exists())
+        # Снова подписка, а задача прежней отписки выполнилась последней.
+        Follow.objects.create(user=self.user, author=self.author)
+        feed.prune_feed(self.user.pk, self.author.pk)
+        self.assertTrue(FeedEntry.objects.filter(user=self.user).exists())
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='seeker')
+        cls.cats = Post.objects.create(
+            author=cls.user, text='Котики <b>правят</b> миром'
+        )
+        cls.dogs = Post.objects.create(
+            author=cls.user, text='Собаки тоже неплохи'
+        )
+
+    def search(self, query):
+        response = self.client.get(reverse('posts:search'), {'q': query})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return response
+
+    def test_search_finds_by_prefix(self):
+        """Поиск находит посты по началу слова и подсвечивает совпадение."""
+        response = self.search('кот')
+        self.assertEqual(list(response.context['page_obj']), [self.cats])
+        self.assertContains(response, '<mark>Котики</mark>')
+        self.assertContains(response, '&lt;b&gt;правят&lt;/b&gt;')
+
+    def test_search_follows_post_changes(self):
+        """Индекс обновляется при изменении и удалении постов."""
+        self.dogs.text = 'Котики и собаки'
+        self.dogs.save()
+        self.assertEqual(len(self.search('котики').context['page_obj']), 2)
+        self.cats.delete()
+        self.assertEqual(
+            list(self.search('котики').context['page_obj']), [self.dogs]
+        )
+
+    def test_search_triggers_restored_after_migrate(self):
+        """Триггеры, потерянные при пересоздании таблицы, возвращаются."""
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER posts_post_fts_insert')
+        Post.objects.create(author=self.user, text='Попугаи без триггера')
+        call_command('migrate', verbosity=0)
+        Post.objects.create(author=self.user, text='Попугаи с триггером')
+        self.assertEqual(len(self.search('попугаи').context['page_obj']), 2)
+
+    def test_search_ignores_query_syntax(self):
+        """Спецсимволы FTS5 в запросе не ломают поиск."""
+        for query in ('"', 'NEAR(', '*', ''):
+            with self.subTest(query=query):
+                self.assertFalse(len(self.search(query).context['page_obj']))
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке использует полнотекстовый индекс."""
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass'
+        )
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'собак'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.dogs]
+        )
+
+
+class CommentPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='talker')
+        cls.post = Post.objects.create(author=cls.user, text='Обсуждаемый')
+        for i in range(COUNT_COMMENTS + 5):
+            Comment.objects.create(
+                post=cls.post, author=cls.user, text=f'Комментарий {i}'
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_post_detail_shows_first_chunk(self):
+        """На странице поста выводится только первая порция комментариев."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('posts:post_detail', args=(self.post.id,))
+            )
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COUNT_COMMENTS)
+        self.assertContains(response, 'Комментариев: 25')
+        self.assertContains(response, 'data-fragment')
+        self.assertFalse(
+            [q for q in queries if 'COUNT(' in q['sql'].upper()]
+        )
+
+    def test_comments_fragment_loads_rest(self):
+        """Фрагмент «показать ещё» отдаёт оставшиеся комментарии."""
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.id,))
+        )
+        first_chunk = list(response.context['comments'])
+        response = self.client.get(
+            reverse('posts:post_comments', args=(self.post.id,)),
+            {'after': response.context['comments'].next_cursor}
+        )
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        rest = list(response.context['comments'])
+        self.assertEqual(len(rest), 5)
+        self.assertEqual(
+            set(first_chunk) | set(rest),
+            set(Comment.objects.filter(post=self.post))
+        )
+        self.assertNotContains(response, 'data-fragment')
+
+    def test_comment_pages_cached_separately(self):
+        """Кэш фрагмента комментариев не отдаёт ?page=2 вместо первой."""
+        url = reverse('posts:post_detail', args=(self.post.id,))
+        response = self.client.get(url, {'page': 2})
+        self.assertContains(response, 'Комментарий 0')
+        self.assertNotContains(response, 'Комментарий 24')
+        response = self.client.get(url)
+        self.assertContains(response, 'Комментарий 24')
+        self.assertNotContains(response, 'Комментарий 0\n')
+
+    def test_comments_fragment_404(self):
+        """Фрагмент комментариев несуществующего поста возвращает 404."""
+        response = self.client.get(
+            reverse('posts:post_comments', args=(0,))
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class AnonymousPageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='writer')
+        cls.group = Group.objects.create(title='Группа', slug='cached')
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Первый пост'
+        )
+        cls.other_post = Post.objects.create(
+            author=cls.author, text='Второй пост'
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_conditional_get_returns_not_modified(self):
+        """Повторный запрос с ETag или Last-Modified получает 304."""
+        url = reverse('posts:post_detail', args=(self.post.id,))
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('ETag'))
+        self.assertFalse(response['ETag'].startswith('W/'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_cached_page_skips_database(self):
+        """Закэшированная страница не обращается к таблицам постов."""
+        url = reverse('posts:index')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertFalse([q for q in queries if 'posts_post' in q['sql']])
+
+    def test_comment_invalidates_only_its_post(self):
+        """Комментарий меняет ETag своего поста, но не соседнего."""
+        url = reverse('posts:post_detail', args=(self.post.id,))
+        other_url = reverse('posts:post_detail', args=(self.other_post.id,))
+        etag = self.client.get(url)['ETag']
+        other_etag = self.client.get(other_url)['ETag']
+        Comment.objects.create(
+            post=self.post, author=self.author, text='Новый комментарий'
+        )
+        response = self.client.get(url)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, 'Новый комментарий')
+        self.assertEqual(self.client.get(other_url)['ETag'], other_etag)
+
+    def test_group_rename_invalidates_group_page(self):
+        """Изменение группы сбрасывает кэш её страницы."""
+        url = reverse('posts:group_posts', args=(self.group.slug,))
+        self.client.get(url)
+        self.group.title = 'Новое название'
+        self.group.save()
+        self.assertContains(self.client.get(url), 'Новое название')
+
+    def test_authorized_user_bypasses_cache(self):
+        """Авторизованному пользователю страница не отдаётся из кэша."""
+        client = Client()
+        client.force_login(self.author)
+        response = client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('ETag'))
+        self.assertIsNotNone(response.context)
+
+
+class GenerationCommitTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='committer')
+
+    def test_generation_bumped_again_after_commit(self):
+        """Страница, собранная до фиксации записи, не переживает её."""
+        scopes = ((page_cache.GLOBAL, ''), (page_cache.AUTHOR, self.author.pk))
+        with transaction.atomic():
+            Post.objects.create(author=self.author, text='Черновик')
+            # Так версию видит читатель, пока строка не зафиксирована.
+            during = page_cache.get_generations(*scopes)
+        after = page_cache.get_generations(*scopes)
+        for scope, before, committed in zip(scopes, during, after):
+            with self.subTest(scope=scope):
+                self.assertNotEqual(committed, before)
+
+
+class PostCardCacheTest(TestCase):
+    card = 'posts/includes/post_card.html'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='carder', first_name='Иван', last_name='Петров'
+        )
+        cls.group = Group.objects.create(title='Группа', slug='cards')
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            author=self.author, group=self.group, text='Карточка'
+        )
+
+    def cards(self):
+        return render_cards(
+            Post.objects.select_related('author', 'group'),
+            show_group_link=True, show_profile_link=True
+        )
+
+    def test_cards_rendered_once(self):
+        """Повторный показ берёт карточку из кэша без рендеринга."""
+        with self.assertTemplateUsed(self.card):
+            first = self.cards()
+        with self.assertTemplateNotUsed(self.card):
+            self.assertEqual(self.cards(), first)
+
+    def test_card_invalidated_on_edit(self):
+        """Правка поста меняет его карточку."""
+        self.cards()
+        self.post.text = 'Новый текст'
+        self.post.save()
+        self.assertIn('Новый текст', self.cards()[0])
+
+    def test_card_invalidated_on_group_and_author_change(self):
+        """Переименование группы и автора меняет карточки их постов."""
+        self.cards()
+        self.group.slug = 'renamed'
+        self.group.save()
+        self.assertIn('/group/renamed/', self.cards()[0])
+        self.author.first_name = 'Пётр'
+        self.author.save()
+        self.assertIn('Пётр Петров', self.cards()[0])
+
+    def test_user_save_without_name_change_keeps_cache(self):
+        """Смена пароля не сбрасывает кэш страниц автора."""
+        author = User.objects.get(pk=self.author.pk)
+        scopes = ((page_cache.GLOBAL, ''), (page_cache.AUTHOR, author.pk))
+        generations = page_cache.get_generations(*scopes)
+        updated = Post.objects.get(pk=self.post.pk).updated
+        author.set_password('новый-пароль')
+        author.save()
+        self.assertEqual(page_cache.get_generations(*scopes), generations)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).updated, updated)
+        author.last_name = 'Сидоров'
+        author.save()
+        self.assertNotEqual(page_cache.get_generations(*scopes), generations)
+
+
+class PostSnapshotTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='snap')
+        cls.group = Group.objects.create(title='Группа', slug='snap')
+        cls.posts = [
+            Post.objects.create(author=cls.author, group=cls.group,
+                                text=f'Снимок {i}')
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.ids = [post.pk for post in self.posts]
+
+    def test_misses_loaded_in_bulk(self):
+        """Промахи догружаются одним запросом, попадания — без базы."""
+        with self.assertNumQueries(1):
+            self.assertEqual(load_posts(self.ids[:2]), self.posts[:2])
+        with self.assertNumQueries(1):
+            loaded = load_posts(self.ids[::-1])
+        self.assertEqual(loaded, self.posts[::-1])
+        with self.assertNumQueries(0):
+            loaded = load_posts(self.ids)
+            self.assertEqual(loaded[0].author.username, 'snap')
+            self.assertEqual(loaded[0].group.slug, 'snap')
+        self.assertEqual(load_posts([self.ids[0], 0]), self.posts[:1])
+
+    def test_snapshot_forgotten_on_change(self):
+        """Правка поста, автора, группы и комментарий удаляют снимок."""
+        post = self.posts[0]
+        key = snapshot_key(post.pk)
+
+        def rename_author():
+            author = User.objects.get(pk=self.author.pk)
+            author.first_name = 'Переименован'
+            author.save()
+
+        changes = (
+            lambda: post.save(),
+            lambda: Comment.objects.create(
+                post=post, author=self.author, text='Комментарий'
+            ),
+            rename_author,
+            lambda: self.group.save(),
+        )
+        for change in changes:
+            load_posts([post.pk])
+            self.assertIsNotNone(cache.get(key))
+            change()
+            self.assertIsNone(cache.get(key))
+
+    def test_feed_selects_only_ids(self):
+        """Лента берёт из базы только id, а посты — из снимков."""
+        client = Client()
+        client.force_login(self.author)
+        client.get(reverse('posts:index'))
+        # Новая версия фрагмента: лента собирается заново.
+        page_cache.bump_generation(page_cache.GLOBAL)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse('posts:index'))
+        self.assertEqual(list(response.context['page_obj']),
+                         self.posts[::-1])
+        self.assertFalse(
+            [q for q in queries if '"posts_post"."text"' in q['sql']]
+        )
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    # Запросов на маршрут при пустом кэше, от имени пользователя.
+    QUERY_BUDGETS = {
+        'index': 5,
+        'group_posts': 6,
+        'profile': 6,
+        'post_detail': 4,
+        'post_comments': 2,
+        'search': 5,
+        'post_create': 5,
+        'post_edit': 7,
+        'add_comment': 5,
+        'follow_index': 5,
+        'profile_follow': 9,
+        'profile_unfollow': 13,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'seed_data', users=5, groups=2, posts=30, comments=20,
+            follows=6, seed=1, stdout=StringIO()
+        )
+
+    def test_every_route_fits_query_budget(self):
+        """Маршруты укладываются в бюджет запросов и обходятся без N+1."""
+        user, sample = sample_arguments()
+        self.client.force_login(user)
+        for name, path in route_paths(sample):
+            with self.subTest(route=name):
+                self.assertIn(name, self.QUERY_BUDGETS)
+                cache.clear()
+                with self.assertQueryBudget(self.QUERY_BUDGETS[name]):
+                    if name in WRITE_ROUTES:
+                        with transaction.atomic():
+                            self.client.get(path)
+                            transaction.set_rollback(True)
+                    else:
+                        self.client.get(path)
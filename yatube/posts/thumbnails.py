@@ -0,0 +1,171 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from PIL import features
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from core.tasks import enqueue
+
+from . import cache as page_cache
+from . import feed, snapshots
+from .models import Post
+from .storage import post_image_storage
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = 'posts:thumbnail-pending:{}:{}'
+PENDING_TIMEOUT = 60
+
+
+class CachedThumbnailBackend(ThumbnailBackend):
+    def get_cached_thumbnail(self, file_, geometry_string, **options):
+        """Как get_thumbnail, но только ищет готовую миниатюру.
+
+        Возвращает None, если миниатюра ещё не создана.
+        """
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+backend = CachedThumbnailBackend()
+
+
+def source_file(image):
+    """Исходник для sorl в хранилище картинок постов.
+
+    Ключи миниатюр зависят от класса хранилища, поэтому и поле модели, и
+    имя файла должны приводиться к одному хранилищу.
+    """
+    return ImageFile(getattr(image, 'name', image), post_image_storage)
+
+
+def supported_presets(presets=None):
+    """Пресеты, которые может сохранить установленный Pillow.
+
+    Без libwebp пресеты WebP пропускаются: браузеры получат JPEG.
+    """
+    webp = features.check('webp')
+    return [
+        preset for preset in presets or settings.POST_THUMBNAILS
+        if webp or settings.POST_THUMBNAILS[preset][1].get('format') != 'WEBP'
+    ]
+
+
+def refresh_image_posts(name):
+    """Сбрасывает кэш страниц с постами картинки name.
+
+    Пока миниатюр не было, фрагменты лент, страницы анонимов и ответы API
+    закэшировались с заглушкой.
+    """
+    rows = list(Post.objects.filter(image=name).values_list(
+        'pk', 'author_id', 'group_id'
+    ))
+    if not rows:
+        return
+    post_ids, author_ids, group_ids = (set(column) for column in zip(*rows))
+    group_ids.discard(None)
+    snapshots.forget_posts(list(post_ids))
+    page_cache.bump_generation(page_cache.GLOBAL)
+    page_cache.bump_generations(page_cache.POST, post_ids)
+    page_cache.bump_generations(page_cache.AUTHOR, author_ids)
+    page_cache.bump_generations(page_cache.GROUP, group_ids)
+    for author_id in author_ids:
+        feed.invalidate_follower_feeds(author_id)
+
+
+def generate_thumbnails(name, presets=None):
+    """Создаёт миниатюры картинки для всех пресетов POST_THUMBNAILS."""
+    created = False
+    for preset in supported_presets(presets):
+        geometry, options = settings.POST_THUMBNAILS[preset]
+        try:
+            get_thumbnail(source_file(name), geometry, **options)
+            created = True
+        except Exception:
+            # Отметка в кэше остаётся до истечения PENDING_TIMEOUT, поэтому
+            # битая картинка не ставится в очередь на каждом показе.
+            logger.exception('Не удалось создать миниатюру %s', name)
+    if created:
+        refresh_image_posts(name)
+
+
+def schedule_thumbnails(name, presets=None):
+    """Ставит создание миниатюр в фоновую очередь.
+
+    Повторная постановка той же миниатюры в течение PENDING_TIMEOUT
+    пропускается.
+    """
+    presets = [
+        preset for preset in supported_presets(presets)
+        if cache.add(PENDING_KEY.format(name, preset), True, PENDING_TIMEOUT)
+    ]
+    if presets:
+        enqueue(generate_thumbnails, name, presets)
+
+
+def thumbnails_or_none(image, presets):
+    """Готовые миниатюры {пресет: миниатюра или None}.
+
+    Недостающие ставятся в очередь одной задачей. image — файл поля
+    ImageField или имя файла в хранилище.
+    """
+    if not image:
+        return dict.fromkeys(presets)
+    thumbnails = {}
+    for preset in presets:
+        geometry, options = settings.POST_THUMBNAILS[preset]
+        thumbnails[preset] = backend.get_cached_thumbnail(
+            source_file(image), geometry, **options
+        )
+    missing = [preset for preset, thumbnail in thumbnails.items()
+               if thumbnail is None]
+    if missing:
+        schedule_thumbnails(getattr(image, 'name', image), missing)
+    return thumbnails
+
+
+def thumbnail_or_none(image, preset):
+    """Готовая миниатюра или None; недостающая ставится в очередь."""
+    return thumbnails_or_none(image, [preset])[preset]
+
+
+def card_images(image):
+    """Миниатюра карточки и источники <picture>: (миниатюра, [(тип, srcset)]).
+
+    Все пресеты, включая 'card', берутся одним проходом по хранилищу
+    миниатюр. Источники — None, пока не готовы все варианты. Ширина в
+    srcset берётся у самой миниатюры: маленький оригинал не растягивается
+    до 1440.
+    """
+    groups = [(mime, supported_presets(presets))
+              for mime, presets in settings.POST_CARD_SOURCES]
+    presets = dict.fromkeys(
+        ['card'] + [preset for _, group in groups for preset in group]
+    )
+    thumbnails = thumbnails_or_none(image, list(presets))
+    if None in thumbnails.values():
+        return thumbnails['card'], None
+    sources = []
+    for mime, group in groups:
+        if not group:
+            continue
+        widths = {thumbnails[preset].width: thumbnails[preset].url
+                  for preset in group}
+        sources.append((mime, ', '.join(
+            f'{url} {width}w' for width, url in sorted(widths.items())
+        )))
+    return thumbnails['card'], sources
@@ -1,10 +1,270 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
 from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_bytes, force_text
+from django.utils.functional import SimpleLazyObject, cached_property
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from django.utils.timezone import is_naive
 
 COUNT_POST = 10
+COUNT_COMMENTS = 20
+CURSOR_KEYS = ('pub_date', 'pk')
+COMMENT_CURSOR_KEYS = ('created', 'pk')
+COUNT_CACHE_KEY = 'posts:paginator-count:{}'
+# Целые в SQLite знаковые 64-битные: большее число в запросе — ошибка базы.
+MAX_INT = 2 ** 63 - 1
+
+
+def encode_cursor(pub_date, pk, number):
+    """Упаковывает ключ (pub_date, id) и номер страницы в токен."""
+    raw = f'{pub_date.isoformat()}|{pk}|{number}'
+    return urlsafe_base64_encode(force_bytes(raw))
+
+
+def decode_cursor(token):
+    """Распаковывает токен курсора; при ошибке возвращает None.
+
+    Токен, который не мог выдать encode_cursor (дата без часового пояса,
+    числа вне диапазона базы), тоже считается ошибкой.
+    """
+    try:
+        pub_date, pk, number = force_text(
+            urlsafe_base64_decode(token)
+        ).split('|')
+        pub_date = parse_datetime(pub_date)
+        pk, number = int(pk), int(number)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if pub_date is None or is_naive(pub_date):
+        return None
+    if not (-MAX_INT <= pk <= MAX_INT and -MAX_INT <= number <= MAX_INT):
+        return None
+    return pub_date, pk, number
+
+
+class CursorRows:
+    """Строки страницы, которые выбираются из базы при первом обращении.
+
+    Выбирается на одну строку больше размера страницы, чтобы узнать,
+    есть ли записи дальше. Если страница взята из кэша фрагмента шаблона,
+    запрос не выполняется вовсе. С load выборка даёт только id и ключи
+    курсора, а объекты страницы возвращает load(ids).
+    """
+
+    def __init__(self, queryset, per_page, reverse=False, load=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.reverse = reverse
+        self.load = load
+        self.has_more = False
+        self._keys = None
+        self._rows = None
+
+    def fetch_keys(self):
+        if self._keys is None:
+            rows = list(self.queryset[:self.per_page + 1])
+            self.has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            self._keys = rows[::-1] if self.reverse else rows
+        return self._keys
+
+    def fetch(self):
+        if self._rows is None:
+            rows = self.fetch_keys()
+            if self.load is not None:
+                rows = self.load([row['pk'] for row in rows])
+            self._rows = rows
+        return self._rows
+
+    def __len__(self):
+        return len(self.fetch())
+
+    def __iter__(self):
+        return iter(self.fetch())
+
+    def __getitem__(self, index):
+        return self.fetch()[index]
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор по ключу (pub_date, id).
+
+    Страницы выбираются условием по ключу вместо OFFSET, поэтому глубокие
+    страницы стоят столько же, сколько первая.
+    Вместо has_next/has_previous шаблоны используют курсоры страницы.
+    keys задаёт имена полей ключа: даты и уникального идентификатора.
+    Строки могут быть и словарями из .values(), если поля ключа в них есть.
+
+    Общее число записей нужно только для окна номеров страниц; оно
+    берётся из кэша и может устареть не больше чем на
+    PAGINATOR_COUNT_TIMEOUT секунд.
+
+    load(ids) подставляет объекты страницы вместо строк выборки, например
+    из кэша (см. posts.snapshots); тогда из базы выбираются только id и
+    ключи курсора.
+    """
+
+    def __init__(self, object_list, per_page, keys=CURSOR_KEYS, load=None,
+                 **kwargs):
+        self.date_key, self.pk_key = keys
+        self.load = load
+        object_list = object_list.order_by(
+            f'-{self.date_key}', f'-{self.pk_key}'
+        )
+        if load is not None:
+            object_list = object_list.values(
+                *dict.fromkeys(('pk', self.date_key, self.pk_key))
+            )
+        super().__init__(object_list, per_page, **kwargs)
+
+    @cached_property
+    def count(self):
+        query = str(self.object_list.query).encode()
+        key = COUNT_CACHE_KEY.format(hashlib.md5(query).hexdigest())
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, settings.PAGINATOR_COUNT_TIMEOUT)
+        return count
+
+    def page_window(self, number):
+        """Номера страниц вокруг текущей: не больше 2 * PAGINATOR_WINDOW + 1.
+
+        Текущая страница попадает в окно, даже если оценка числа страниц
+        устарела.
+        """
+        size = settings.PAGINATOR_WINDOW
+        last = max(self.num_pages, number)
+        start = max(1, min(number - size, last - 2 * size))
+        stop = min(last, start + 2 * size)
+        return list(range(start, stop + 1))
+
+    def _cursor(self, obj, number):
+        if isinstance(obj, dict):
+            return encode_cursor(obj[self.date_key], obj[self.pk_key], number)
+        return encode_cursor(
+            getattr(obj, self.date_key), getattr(obj, self.pk_key), number
+        )
+
+    def _older(self, pub_date, pk):
+        return Q(**{f'{self.date_key}__lt': pub_date}) | Q(**{
+            self.date_key: pub_date, f'{self.pk_key}__lt': pk
+        })
+
+    def _newer(self, pub_date, pk):
+        return Q(**{f'{self.date_key}__gt': pub_date}) | Q(**{
+            self.date_key: pub_date, f'{self.pk_key}__gt': pk
+        })
+
+    def _edge_cursor(self, rows, index, number, exists):
+        items = rows.fetch_keys()
+        if not items:
+            return None
+        if exists is None:
+            exists = rows.has_more
+        return self._cursor(items[index], number) if exists else None
+
+    def _build_page(self, rows, number, older=None, newer=None, key=''):
+        """older/newer: есть ли записи дальше и раньше страницы.
+
+        None означает, что это станет известно после выборки строк.
+        key однозначно задаёт страницу (курсор или номер) для ключей кэша
+        фрагментов: у первой страницы он пустой.
+        """
+        page = self._get_page(rows, number, self)
+        page.cache_key = key
+        page.next_cursor = SimpleLazyObject(
+            lambda: self._edge_cursor(rows, -1, number + 1, older)
+        )
+        page.previous_cursor = SimpleLazyObject(
+            lambda: self._edge_cursor(rows, 0, number - 1, newer)
+        )
+        page.page_window = SimpleLazyObject(
+            lambda: self.page_window(number)
+        )
+        return page
+
+    def _rows(self, queryset, reverse=False, size=None):
+        return CursorRows(
+            queryset, size or self.per_page, reverse, self.load
+        )
+
+    def first_page(self):
+        rows = self._rows(self.object_list)
+        return self._build_page(rows, 1, newer=False)
+
+    def page_after(self, token):
+        cursor = decode_cursor(token)
+        if cursor is None:
+            return self.first_page()
+        pub_date, pk, number = cursor
+        rows = self._rows(self.object_list.filter(self._older(pub_date, pk)))
+        return self._build_page(rows, number, newer=True, key=f'after:{token}')
+
+    def page_before(self, token):
+        cursor = decode_cursor(token)
+        if cursor is None:
+            return self.first_page()
+        pub_date, pk, number = cursor
+        rows = self._rows(
+            self.object_list.filter(self._newer(pub_date, pk)).reverse(),
+            reverse=True
+        )
+        return self._build_page(
+            rows, max(number, 1), older=True, key=f'before:{token}'
+        )
+
+    def last_page(self):
+        """Последняя страница — те же строки, что и ?page=num_pages.
+
+        На ней остаток от деления числа записей на размер страницы, иначе
+        она пересекалась бы с предыдущей.
+        """
+        size = self.count - (self.num_pages - 1) * self.per_page
+        rows = self._rows(self.object_list.reverse(), reverse=True, size=size)
+        return self._build_page(
+            rows, self.num_pages, older=False, key='last'
+        )
+
+    def offset_page(self, number):
+        """Совместимость со ссылками вида ?page=N без подсчёта страниц.
+
+        Номер за концом ленты, как и в Paginator.get_page, открывает
+        последнюю страницу. Число страниц берётся из кэша и может
+        устареть, поэтому пустая выборка тоже ведёт на последнюю.
+        """
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            return self.first_page()
+        if number <= 1:
+            return self.first_page()
+        if number > self.num_pages:
+            return self.last_page()
+        bottom = (number - 1) * self.per_page
+        rows = self._rows(self.object_list[bottom:])
+        if not rows.fetch_keys():
+            return self.last_page()
+        return self._build_page(rows, number, newer=True, key=f'page:{number}')
+
+    def get_cursor_page(self, params):
+        if params.get('after'):
+            return self.page_after(params['after'])
+        if params.get('before'):
+            return self.page_before(params['before'])
+        if params.get('page') == 'last':
+            return self.last_page()
+        if params.get('page'):
+            return self.offset_page(params['page'])
+        return self.first_page()
 
 
-def get_page(queryset, request):
-    paginator = Paginator(queryset, COUNT_POST)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+def get_page(queryset, request, keys=CURSOR_KEYS, per_page=COUNT_POST,
+             load=None):
+    paginator = CursorPaginator(queryset, per_page, keys=keys, load=load)
+    page_obj = paginator.get_cursor_page(request.GET)
     return page_obj
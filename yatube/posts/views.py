@@ -1,36 +1,58 @@
 from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.db.models import F
 from django.shortcuts import get_object_or_404, redirect, render
 
+from core.db import retry_on_locked
+from core.querycache import cached
+from core.ratelimit import rate_limit
+
+from . import cache, snapshots
+from .counters import get_user_stats
 from .forms import CommentForm, PostForm
 from .models import Follow, Group, Post, User
-from .utils import get_page
+from .search import SearchResults
+from .thumbnails import schedule_thumbnails
+from .utils import (COMMENT_CURSOR_KEYS, COUNT_COMMENTS, COUNT_POST,
+                    get_page)
 
 
+@cache.anonymous_page_cache(cache.index_page_scopes)
 def index(request):
-    posts = Post.objects.select_related('group', 'author').all()
-    page_obj = get_page(posts, request)
+    page_obj = get_page(
+        Post.objects.all(), request, load=snapshots.load_posts
+    )
     context = {
         'page_obj': page_obj,
+        **cache.feed_cache((cache.GLOBAL,)),
     }
     return render(request, 'posts/index.html', context)
 
 
+@cache.anonymous_page_cache(cache.group_page_scopes)
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related('author').all()
-    page_obj = get_page(posts, request)
+    group = get_object_or_404(cached(Group.objects.all()), slug=slug)
+    page_obj = get_page(
+        group.posts.all(), request, load=snapshots.load_posts
+    )
     context = {
         'group': group,
         'page_obj': page_obj,
+        **cache.feed_cache((cache.GROUP, group.pk)),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@cache.anonymous_page_cache(cache.profile_page_scopes)
 def profile(request, username):
     template = 'posts/profile.html'
-    author = get_object_or_404(User, username=username)
-    author_posts = author.posts.select_related('group').all()
-    page_obj = get_page(author_posts, request)
+    author = get_object_or_404(
+        cached(User.objects.select_related('stats')), username=username
+    )
+    get_user_stats(author)
+    page_obj = get_page(
+        author.posts.all(), request, load=snapshots.load_posts
+    )
     following = False
     if request.user.is_authenticated:
         following = Follow.objects.filter(
@@ -39,33 +61,71 @@ def profile(request, username):
         'author': author,
         'page_obj': page_obj,
         'following': following,
+        **cache.feed_cache((cache.AUTHOR, author.pk)),
     }
     return render(request, template, context)
 
 
+@cache.anonymous_page_cache(cache.post_page_scopes)
 def post_detail(request, post_id):
     template = 'posts/post_detail.html'
-    post = get_object_or_404(Post.objects.select_related('author', 'group'),
-                             pk=post_id)
-    count = post.author.posts.count()
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id
+    )
+    count = get_user_stats(post.author).post_count
     form = CommentForm()
-    comments = post.comment.select_related('author').all()
+    comments = get_page(
+        post.comment.select_related('author'),
+        request,
+        keys=COMMENT_CURSOR_KEYS,
+        per_page=COUNT_COMMENTS
+    )
     context = {
         'post': post,
         'count': count,
         'form': form,
         'comments': comments,
+        **cache.feed_cache((cache.POST, post.pk)),
     }
     return render(request, template, context)
 
 
+def post_comments(request, post_id):
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    comments = get_page(
+        post.comment.select_related('author'),
+        request,
+        keys=COMMENT_CURSOR_KEYS,
+        per_page=COUNT_COMMENTS
+    )
+    context = {
+        'post': post,
+        'comments': comments,
+        **cache.feed_cache((cache.POST, post.pk)),
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    paginator = Paginator(SearchResults(query), COUNT_POST)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
+@rate_limit('post')
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
     if form.is_valid():
-        post = form.save(commit=False)
-        post.author = request.user
-        post.save()
+        form.instance.author = request.user
+        post = retry_on_locked(form.save)()
+        if post.image:
+            schedule_thumbnails(post.image.name)
         return redirect('posts:profile', username=post.author.username)
     return render(request, 'posts/create_post.html', {'form': form})
 
@@ -82,7 +142,9 @@ def post_edit(request, post_id):
         instance=post
     )
     if form.is_valid():
-        form.save()
+        post = retry_on_locked(form.save)()
+        if 'image' in form.changed_data and post.image:
+            schedule_thumbnails(post.image.name)
         return redirect('posts:post_detail', post_id=post_id)
     context = {
         'post': post,
@@ -93,39 +155,52 @@ def post_edit(request, post_id):
 
 
 @login_required
+@rate_limit('comment')
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
-        comment = form.save(commit=False)
-        comment.author = request.user
-        comment.post = post
-        comment.save()
+        form.instance.author = request.user
+        form.instance.post = post
+        retry_on_locked(form.save)()
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    page_obj = get_page(post_list, request)
+    post_list = Post.objects.filter(
+        feed_entries__user=request.user
+    ).annotate(
+        feed_date=F('feed_entries__pub_date'),
+        feed_id=F('feed_entries__id'),
+    )
+    page_obj = get_page(
+        post_list, request, keys=('feed_date', 'feed_id'),
+        load=snapshots.load_posts
+    )
     context = {
-        'page_obj': page_obj
+        'page_obj': page_obj,
+        **cache.feed_cache((cache.FOLLOWER, request.user.pk)),
     }
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
+@rate_limit('follow', methods=('GET', 'POST'))
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if request.user != author:
-        Follow.objects.get_or_create(user=request.user, author=author)
+        retry_on_locked(Follow.objects.get_or_create)(
+            user=request.user, author=author
+        )
     return redirect('posts:profile', username)
 
 
 @login_required
+@rate_limit('follow', methods=('GET', 'POST'))
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     follower = Follow.objects.filter(user=request.user, author=author)
     if follower.exists():
-        follower.delete()
+        retry_on_locked(follower.delete)()
     return redirect('posts:profile', username)
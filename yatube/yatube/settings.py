@@ -28,6 +28,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ProfilingMiddleware',
+    'core.middleware.QueryLogMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -42,7 +46,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backends.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -61,10 +65,38 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'CONN_MAX_AGE': 60,
+    },
+    # Локальная реплика: копия default, которую обновляет
+    # manage.py sync_replicas. Используется, только если указана
+    # в DATABASE_REPLICAS.
+    'replica': {
+        'ENGINE': 'core.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db-replica.sqlite3'),
+        'CONN_MAX_AGE': 60,
+    },
 }
+# PRAGMA для каждого соединения SQLite (см. core.db).
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 5000,
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение — размер в КиБ, а не в страницах.
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
+}
+# Повторы представлений, записывающих в базу, при «database is locked».
+SQLITE_RETRY_ATTEMPTS = 5
+SQLITE_RETRY_DELAY = 0.05
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# Псевдонимы реплик для чтения; пусто — всё читается из default.
+DATABASE_REPLICAS = []
+# Сколько секунд после своей записи клиент читает из default. Должно
+# быть больше отставания реплик.
+REPLICA_STICKY_SECONDS = 5
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -110,6 +142,88 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache_backends.TwoTierCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'L1_MAX_ENTRIES': 1000,
+            # Сколько процесс может не видеть чужую запись в кэш.
+            'L1_TIMEOUT': 2,
+            # Сколько отдавать устаревшее значение, пока его пересчитывают.
+            'STALE_TIMEOUT': 30,
+            'LOCK_TIMEOUT': 10,
+            'LOCK_WAIT': 0.5,
+        },
     }
 }
+
+# Кэш, метрики и профили тестов — во временном каталоге.
+TEST_RUNNER = 'core.testing.TestRunner'
+
+TASKS_ALWAYS_EAGER = False
+TASKS_MAX_WORKERS = 4
+
+FOLLOW_FEED_MAX_ENTRIES = 1000
+
+FEED_CACHE_TIMEOUT = 60 * 60
+POST_SNAPSHOT_TIMEOUT = 60 * 60
+QUERY_CACHE_TIMEOUT = 10 * 60
+
+PAGINATOR_COUNT_TIMEOUT = 5 * 60
+PAGINATOR_WINDOW = 2
+
+POST_IMAGE_MAX_SIZE = 2048
+POST_IMAGE_QUALITY = 85
+
+POST_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+    'card-480': ('480x170', {'crop': 'center', 'upscale': True}),
+    'card-1440': ('1440x509', {'crop': 'center'}),
+    'card-webp-480': ('480x170', {
+        'crop': 'center', 'upscale': True, 'format': 'WEBP', 'quality': 80,
+    }),
+    'card-webp-960': ('960x339', {
+        'crop': 'center', 'upscale': True, 'format': 'WEBP', 'quality': 80,
+    }),
+    'card-webp-1440': ('1440x509', {
+        'crop': 'center', 'format': 'WEBP', 'quality': 80,
+    }),
+}
+# Варианты карточки для <picture>: тип -> пресеты по возрастанию ширины.
+# Первый тип, который поддерживает браузер, выигрывает.
+POST_CARD_SOURCES = (
+    ('image/webp', ('card-webp-480', 'card-webp-960', 'card-webp-1440')),
+    ('image/jpeg', ('card-480', 'card', 'card-1440')),
+)
+
+PAGE_CACHE_TIMEOUT = 60 * 60
+
+METRICS_STORE = os.path.join(BASE_DIR, 'metrics.sqlite3')
+METRICS_FLUSH_INTERVAL = 10
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Профилирование запросов (core.profiling): доля случайных запросов и
+# заголовок, с которым профилируется любой запрос. Пустой PROFILE_TOKEN
+# отключает заголовок.
+PROFILE_SAMPLE_RATE = 0
+PROFILE_HEADER = 'X-Profile'
+PROFILE_TOKEN = ''
+PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILE_MAX_FILES = 200
+PROFILE_STACK_INTERVAL = 0.005
+
+# Журнал запросов (core.querylog): порог медленного запроса в секундах и
+# сколько раз за HTTP-запрос может выполниться один и тот же запрос, пока
+# это не считается N+1.
+SLOW_QUERY_THRESHOLD = 0.1
+QUERY_REPEAT_LIMIT = 5
+
+# Политики ограничения частоты (core.ratelimit): ёмкость корзины
+# жетонов и сколько секунд восполняется один жетон. Считаются на
+# пользователя, для анонимов — на адрес.
+RATE_LIMITS = {
+    'post': {'capacity': 10, 'refill': 60},
+    'comment': {'capacity': 20, 'refill': 10},
+    'follow': {'capacity': 30, 'refill': 5},
+    'signup': {'capacity': 5, 'refill': 10 * 60},
+}
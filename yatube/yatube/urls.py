@@ -3,11 +3,20 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from core.views import metrics, profile_detail, profile_file, profiles
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
+    path('metrics', metrics, name='metrics'),
+    path('profiles/', profiles, name='profiles'),
+    path('profiles/<slug:profile_id>/', profile_detail,
+         name='profile_detail'),
+    path('profiles/<slug:profile_id>.<slug:extension>', profile_file,
+         name='profile_file'),
+    path('api/v1/', include('posts.api_urls', namespace='api')),
     path('', include('posts.urls', namespace='posts')),
 ]
 